@@ -0,0 +1,42 @@
+"""
+Run the benchmarks from the root of the repository with:
+
+    python -m benchmarks [--repeat N] [--json FILE] [GROUP ...]
+
+where GROUP is any of "import", "messages", "utils" or "smtp" (all of them
+by default).
+"""
+import argparse
+import json
+import sys
+
+from .bench import BENCHMARKS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("groups", nargs="*", metavar="GROUP")
+    parser.add_argument(
+        "--repeat", type=int, default=100, help="calls per benchmark (default: 100)"
+    )
+    parser.add_argument("--json", help="also save the results in this file")
+    args = parser.parse_args(argv)
+    for group in args.groups:
+        if group not in BENCHMARKS:
+            parser.error("unknown group %r" % group)
+
+    results = []
+    for group in args.groups or BENCHMARKS:
+        print("# %s" % group)
+        for result in BENCHMARKS[group](args.repeat):
+            print(result)
+            results.append(result.as_dict())
+        print()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
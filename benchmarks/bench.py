@@ -0,0 +1,273 @@
+"""
+Benchmarks for rendering messages and for the mailers throughput.
+
+Each benchmark reports messages (or calls) per second, latency
+percentiles and the peak memory allocated while running it.
+"""
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from mailshake import EmailMessage, SMTPMailer
+from mailshake.utils import encode_address, make_msgid
+
+
+HTML = (
+    "<html><body>\n<h1>Weekly news</h1>\n"
+    + "<p>Lorem ipsum <strong>dolor</strong> sit amet, "
+    "<a href='https://example.com/'>consectetur</a> adipiscing elit.</p>\n" * 40
+    + "</body></html>"
+)
+TEXT = "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 40
+
+KB = 1024
+MB = 1024 * KB
+
+
+class Result:
+    def __init__(self, name, timings, peak_memory):
+        self.name = name
+        self.calls = len(timings)
+        self.total = sum(timings)
+        self.timings = sorted(timings)
+        self.peak_memory = peak_memory
+
+    @property
+    def per_second(self):
+        return self.calls / self.total if self.total else float("inf")
+
+    def percentile(self, pct):
+        index = min(len(self.timings) - 1, int(len(self.timings) * pct / 100))
+        return self.timings[index]
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "per_second": self.per_second,
+            "mean": statistics.mean(self.timings),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "peak_memory": self.peak_memory,
+        }
+
+    def __str__(self):
+        return "{:<48} {:>10.1f}/s  p50 {:>8}  p95 {:>8}  p99 {:>8}  {:>9}".format(
+            self.name,
+            self.per_second,
+            format_time(self.percentile(50)),
+            format_time(self.percentile(95)),
+            format_time(self.percentile(99)),
+            format_size(self.peak_memory),
+        )
+
+
+def measure(name, func, repeat, setup=None):
+    """Call `func` `repeat` times and return a `Result`.
+
+    If `setup` is given, it's called before each call and its return
+    value is passed to `func`, outside of the measured time.
+    There is an extra call first, to warm up the caches, and another at the
+    end to measure the peak memory, because tracing the allocations slows
+    down the code.
+    """
+    func(*((setup(),) if setup else ()))
+    timings = []
+    gc.collect()
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+
+    args = (setup(),) if setup else ()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Result(name, timings, peak_memory)
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return "%.1fµs" % (seconds * 1e6)
+    if seconds < 1:
+        return "%.2fms" % (seconds * 1e3)
+    return "%.2fs" % seconds
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return "%.1f%s" % (size, unit)
+        size /= 1024
+    return "%.1fGB" % size
+
+
+def make_message(recipients=1, attachment_size=0, html_only=False, non_ascii=False):
+    domain = "exampleБ.com" if non_ascii else "example.com"
+    name = "Jöhn Dœ" if non_ascii else "John Doe"
+    msg = EmailMessage(
+        subject="Nöticias de la semana" if non_ascii else "Weekly news",
+        text="" if html_only else TEXT,
+        html=HTML,
+        from_email="news@example.com",
+        to=[(name, "user%s@%s" % (num, domain)) for num in range(recipients)],
+    )
+    if attachment_size:
+        msg.attach("report.pdf", b"%PDF" * (attachment_size // 4), "application/pdf")
+    return msg
+
+
+MESSAGE_VARIANTS = [
+    ("1 recipient", {}),
+    ("100 recipients", {"recipients": 100}),
+    ("1000 recipients", {"recipients": 1000}),
+    ("html only", {"html_only": True}),
+    ("non-ascii headers", {"non_ascii": True, "recipients": 100}),
+    ("100KB attachment", {"attachment_size": 100 * KB}),
+    ("5MB attachment", {"attachment_size": 5 * MB}),
+]
+
+
+def _times(kwargs, repeat):
+    # Big attachments are slow, so they run fewer times.
+    if kwargs.get("attachment_size", 0) >= MB:
+        return max(1, repeat // 10)
+    return repeat
+
+
+def bench_messages(repeat):
+    for label, kwargs in MESSAGE_VARIANTS:
+        times = _times(kwargs, repeat)
+        yield measure(
+            "EmailMessage() %s" % label, lambda: make_message(**kwargs), times
+        )
+        # New messages for each call, so nothing is reused between calls.
+        yield measure(
+            "render() %s" % label,
+            lambda msg: msg.render(),
+            times,
+            setup=lambda: make_message(**kwargs),
+        )
+        yield measure(
+            "as_bytes() %s" % label,
+            lambda msg: msg.as_bytes(),
+            times,
+            setup=lambda: make_message(**kwargs),
+        )
+
+
+def bench_utils(repeat):
+    addresses = ["user%s@example.com" % num for num in range(1000)]
+
+    def encode_all():
+        for addr in addresses:
+            encode_address(addr, "utf-8")
+
+    def encode_all_cold():
+        encode_address.cache_clear()
+        encode_all()
+
+    yield measure("encode_address() x1000", encode_all, repeat)
+    yield measure("encode_address() x1000 (cold cache)", encode_all_cold, repeat)
+    yield measure("make_msgid()", make_msgid, repeat * 100)
+
+
+def bench_smtp(repeat):
+    from .smtpd import SMTPServer
+
+    with SMTPServer() as server:
+        for label, kwargs in MESSAGE_VARIANTS:
+            times = _times(kwargs, repeat)
+            mailer = SMTPMailer(host=server.hostname, port=server.port)
+            mailer.open()
+            yield measure(
+                "SMTPMailer %s" % label,
+                mailer.send_messages,
+                times,
+                setup=lambda: make_message(**kwargs),
+            )
+            mailer.close()
+
+        mailer = SMTPMailer(host=server.hostname, port=server.port)
+        yield measure(
+            "SMTPMailer new connection per message",
+            mailer.send_messages,
+            repeat,
+            setup=make_message,
+        )
+
+        mailer = SMTPMailer(host=server.hostname, port=server.port, pool_size=4)
+        yield measure(
+            "SMTPMailer pooled connection",
+            mailer.send_messages,
+            repeat,
+            setup=make_message,
+        )
+        mailer.shutdown()
+
+
+# Runs in a new interpreter, so nothing is already imported.
+IMPORT_SCRIPT = """
+import json, time, tracemalloc
+if {trace}:
+    tracemalloc.start()
+start = time.perf_counter()
+import mailshake
+{extra}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, tracemalloc.get_traced_memory()[1]]))
+"""
+
+IMPORT_VARIANTS = [
+    ("import mailshake", ""),
+    ("import mailshake + EmailMessage", "mailshake.EmailMessage"),
+    ("import mailshake + SMTPMailer", "mailshake.SMTPMailer"),
+    (
+        "import mailshake + everything",
+        "[getattr(mailshake, name) for name in mailshake.__all__]",
+    ),
+]
+
+
+def _run_import(script, trace):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", script.format(trace=trace)],
+        env=dict(os.environ, PYTHONPATH=root),
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return json.loads(output)
+
+
+def bench_import(repeat):
+    """The cold-start cost of importing the package, measured in new
+    interpreters, so it uses a tenth of the calls of the other benchmarks.
+    Like in `measure()`, the memory is measured in an extra run.
+    """
+    for label, extra in IMPORT_VARIANTS:
+        script = IMPORT_SCRIPT.replace("{extra}", extra)
+        timings = [
+            _run_import(script, False)[0] for _ in range(max(1, repeat // 10))
+        ]
+        peak_memory = _run_import(script, True)[1]
+        yield Result(label, timings, peak_memory)
+
+
+BENCHMARKS = {
+    "import": bench_import,
+    "messages": bench_messages,
+    "utils": bench_utils,
+    "smtp": bench_smtp,
+}
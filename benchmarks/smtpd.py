@@ -0,0 +1,47 @@
+"""
+A local SMTP server that accepts and discards every message.
+Requires the `aiosmtpd` python library.
+"""
+import socket
+
+
+class SinkHandler:
+    def __init__(self):
+        self.messages = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return "250 OK"
+
+
+class SMTPServer:
+    """Run an SMTP server in a background thread while inside the
+    `with` block.
+    """
+
+    hostname = "127.0.0.1"
+
+    def __init__(self):
+        from aiosmtpd.controller import Controller
+
+        self.handler = SinkHandler()
+        self.port = _free_port()
+        self.controller = Controller(
+            self.handler,
+            hostname=self.hostname,
+            port=self.port,
+            data_size_limit=None,
+        )
+
+    def __enter__(self):
+        self.controller.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.controller.stop()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -1,11 +1,47 @@
-from .mailers.base import BaseMailer  # noqa
-from .mailers.console import ToConsoleMailer  # noqa
-from .mailers.dummy import DummyMailer  # noqa
-from .mailers.filebased import ToFileMailer  # noqa
-from .mailers.memory import ToMemoryMailer  # noqa
-from .mailers.smtp import SMTPMailer  # noqa
-from .mailers.amazon_ses import AmazonSESMailer  # noqa
-from .message import EmailMessage  # noqa
-from .version import __version__  # noqa
-
-Mailer = ToConsoleMailer
+# The classes are imported the first time they are used (PEP 562), so
+# `import mailshake` doesn't pay for loading every mailer and its dependencies.
+_LAZY = {
+    "AsyncBaseMailer": ".mailers.base",
+    "BaseMailer": ".mailers.base",
+    "ToConsoleMailer": ".mailers.console",
+    "AsyncDummyMailer": ".mailers.dummy",
+    "DummyMailer": ".mailers.dummy",
+    "ToFileMailer": ".mailers.filebased",
+    "ToMaildirMailer": ".mailers.mailbox",
+    "ToMboxMailer": ".mailers.mailbox",
+    "AsyncToMemoryMailer": ".mailers.memory",
+    "ToMemoryMailer": ".mailers.memory",
+    "QueuedMailer": ".mailers.queued",
+    "SMTPMailer": ".mailers.smtp",
+    "SpoolMailer": ".mailers.spool",
+    "ThrottledMailer": ".mailers.throttled",
+    "AsyncSMTPMailer": ".mailers.async_smtp",
+    "AmazonSESMailer": ".mailers.amazon_ses",
+    "Instrumentation": ".instrumentation",
+    "MetricsCollector": ".instrumentation",
+    "MailMerge": ".merge",
+    "EmailMessage": ".message",
+    "SendReport": ".results",
+    "SendResult": ".results",
+    "RetryPolicy": ".retry",
+    "__version__": ".version",
+}
+_ALIASES = {"Mailer": "ToConsoleMailer"}
+
+__all__ = sorted(list(_LAZY) + list(_ALIASES))
+
+
+def __getattr__(name):
+    from importlib import import_module
+
+    attr = _ALIASES.get(name, name)
+    module = _LAZY.get(attr)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(import_module(module, __name__), attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
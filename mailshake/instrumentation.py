@@ -0,0 +1,230 @@
+"""
+Hooks to measure where the time goes when sending messages.
+"""
+from contextlib import nullcontext
+import threading
+import time
+
+
+class Instrumentation:
+    """Receives the events of the mailers and messages.
+
+    Pass an instance to a mailer, with its `instrumentation` argument, and/or
+    set it as `EmailMessage.instrumentation` to also measure the messages.
+    The default implementation does nothing; subclass it and overwrite
+    `on_phase()` and `on_result()`.
+
+    The phases are:
+        "encode": encoding the addresses of a new `EmailMessage`.
+        "render": rendering an `EmailMessage` as a MIME message.
+        "connect": opening and authenticating a connection.
+        "transfer": sending a message through an open connection, or
+            calling the API of the provider.
+
+    """
+
+    def phase(self, name, **labels):
+        """A context manager that measures the time spent inside the `with`
+        block and passes it to `on_phase()`.
+        """
+        return _Phase(self, name, labels)
+
+    def on_phase(self, name, seconds, labels, error=None):
+        """Called after each phase with the seconds it took, the labels
+        (eg: `{"mailer": "SMTPMailer"}`) and the exception raised, if any.
+        """
+        pass
+
+    def on_result(self, result, labels):
+        """Called with the `SendResult` of every message sent, or failed."""
+        pass
+
+
+class _Phase:
+    __slots__ = ("instrumentation", "name", "labels", "start")
+
+    def __init__(self, instrumentation, name, labels):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.instrumentation.on_phase(
+            self.name, time.perf_counter() - self.start, self.labels, error=exc
+        )
+
+
+class NoInstrumentation(Instrumentation):
+    """The default. It doesn't even measure the time."""
+
+    _context = nullcontext()
+
+    def phase(self, name, **labels):
+        return self._context
+
+
+NO_INSTRUMENTATION = NoInstrumentation()
+
+
+# Upper bounds, in seconds, of the buckets of the latency histograms.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsCollector(Instrumentation):
+    """An in-process, thread-safe, collector of metrics.
+
+    It keeps these metrics, all labeled by the mailer:
+
+        mailshake_phase_seconds: Histogram of the duration of each phase.
+        mailshake_phase_errors_total: Number of phases that failed.
+        mailshake_messages_total: Number of messages, by status ("sent"
+            or "failed").
+        mailshake_recipients_total: Number of recipients, by status
+            ("accepted" or "refused").
+        mailshake_bytes_sent_total: Bytes sent.
+
+    and can export them in the text format of Prometheus, with
+    `prometheus()`, or in the one of StatsD, with `statsd()`.
+
+    `buckets`: Upper bounds, in seconds, of the buckets of the histograms.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = {}
+        # {labels: [bucket counts..., sum, count]}
+        self._histograms = {}
+
+    def on_phase(self, name, seconds, labels, error=None):
+        key = _key(dict(labels, phase=name))
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[index] += 1
+            values[-2] += seconds
+            values[-1] += 1
+        if error is not None:
+            self.increment("mailshake_phase_errors_total", phase=name, **labels)
+
+    def on_result(self, result, labels):
+        status = "sent" if result.sent else "failed"
+        self.increment("mailshake_messages_total", status=status, **labels)
+        if result.accepted:
+            self.increment(
+                "mailshake_recipients_total",
+                len(result.accepted),
+                status="accepted",
+                **labels
+            )
+        if result.refused:
+            self.increment(
+                "mailshake_recipients_total",
+                len(result.refused),
+                status="refused",
+                **labels
+            )
+        if result.bytes_sent:
+            self.increment("mailshake_bytes_sent_total", result.bytes_sent, **labels)
+
+    def increment(self, name, value=1, **labels):
+        """Add `value` to a counter."""
+        key = (name, _key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        """The current value of a counter."""
+        return self._counters.get((name, _key(labels)), 0)
+
+    def histogram(self, **labels):
+        """The `(sum, count)` of the durations of a phase, eg:
+        `histogram(phase="connect", mailer="SMTPMailer")`.
+        """
+        values = self._histograms.get(_key(labels))
+        if values is None:
+            return 0, 0
+        return values[-2], values[-1]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(values)) for key, values in self._histograms.items()
+            )
+        lines = []
+        last_name = None
+        for (name, labels), value in counters:
+            if name != last_name:
+                lines.append("# TYPE %s counter" % name)
+                last_name = name
+            lines.append("%s%s %s" % (name, _format_labels(labels), value))
+
+        name = "mailshake_phase_seconds"
+        if histograms:
+            lines.append("# TYPE %s histogram" % name)
+        for labels, values in histograms:
+            for bound, count in zip(self.buckets, values):
+                lines.append(
+                    "%s_bucket%s %s"
+                    % (name, _format_labels(labels + (("le", str(bound)),)), count)
+                )
+            lines.append(
+                "%s_bucket%s %s"
+                % (name, _format_labels(labels + (("le", "+Inf"),)), values[-1])
+            )
+            lines.append("%s_sum%s %s" % (name, _format_labels(labels), values[-2]))
+            lines.append("%s_count%s %s" % (name, _format_labels(labels), values[-1]))
+        return "".join(line + "\n" for line in lines)
+
+    def statsd(self, prefix=""):
+        """The metrics as StatsD lines, using the DogStatsD syntax for
+        the labels. The counters are sent as gauges, with their total value,
+        and the histograms as the total and count of seconds of each phase.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(values)) for key, values in self._histograms.items()
+            )
+        lines = []
+        for (name, labels), value in counters:
+            lines.append("%s%s:%s|g%s" % (prefix, name, value, _format_tags(labels)))
+        for labels, values in histograms:
+            tags = _format_tags(labels)
+            name = prefix + "mailshake_phase_seconds"
+            lines.append("%s.sum:%s|g%s" % (name, values[-2], tags))
+            lines.append("%s.count:%s|g%s" % (name, values[-1], tags))
+        return lines
+
+
+def _key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+
+
+def _format_tags(labels):
+    if not labels:
+        return ""
+    return "|#" + ",".join("%s:%s" % (key, value) for key, value in labels)
@@ -1,14 +1,70 @@
 """
 Mailer for Amazon Simple Email Server.
 """
+from concurrent.futures import ThreadPoolExecutor
+import email.policy
+import json
 import logging
+import os
+import threading
 
 from .base import BaseMailer
+from .throttled import TokenBucket
+from ..message import encode_addresses
+from ..results import SendReport, SendResult
+
+
+# Maximum number of destinations of a `SendBulkTemplatedEmail` call.
+BULK_MAX_DESTINATIONS = 50
+
+
+class SESBulkError(Exception):
+    """A destination of a bulk templated send that failed.
+
+    `status`: The status returned by Amazon SES, eg: "MessageRejected".
+
+    Like a `botocore.exceptions.ClientError`, it has a `response`
+    with that status as the error code, so it can be classified
+    by a `RetryPolicy`.
+    """
+
+    def __init__(self, status, message=None):
+        self.status = status
+        self.response = {"Error": {"Code": status, "Message": message or ""}}
+        super(SESBulkError, self).__init__(
+            "{0}: {1}".format(status, message) if message else status
+        )
 
 
 class AmazonSESMailer(BaseMailer):
     """A mailer for Amazon Simple Email Server.
     Requires the `boto3` python library.
+
+    `retry`: An optional `RetryPolicy` to retry the sends that fail because
+        of throttling or other transient errors.
+
+    `raw`: If true, the messages are rendered and sent as they are, with
+        `send_raw_email`, so they can have attachments and custom headers.
+        Otherwise, only the subject, text and html are sent.
+        `return_path` is ignored in this mode.
+
+    `workers`: If bigger than one, `send_messages()` keeps this many calls
+        to the SES API in flight at the same time, using a pool of threads.
+
+    `max_send_rate`: Maximum number of messages per second, to stay inside
+        the sending rate of your SES account. It can also be a `TokenBucket`
+        shared with other mailers.
+
+    `max_pool_connections`: Maximum number of HTTPS connections kept open
+        to SES. By default, enough for the `workers` (but at least 10).
+
+    `tcp_keepalive`: Enable TCP keep-alive on those connections, so they
+        aren't dropped while idle.
+
+    The boto3 client is created the first time it's used, not when the mailer
+    is, so processes that never send emails don't pay for importing boto3.
+    It's shared by all the threads, and created again in the child processes
+    after a `fork()`, because the connections of the parent can't be reused.
     """
 
     def __init__(
@@ -17,59 +73,310 @@ class AmazonSESMailer(BaseMailer):
         aws_secret_access_key,
         region_name="us-east-1",
         return_path=None,
+        retry=None,
+        raw=False,
+        workers=None,
+        max_send_rate=None,
+        max_pool_connections=None,
+        tcp_keepalive=False,
         *args,
         **kwargs
     ):
         """ """
-        import boto3
-
-        self.client = boto3.client(
-            "ses",
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region_name,
-        )
-        assert self.client
+        self.client_kwargs = {
+            "aws_access_key_id": aws_access_key_id,
+            "aws_secret_access_key": aws_secret_access_key,
+            "region_name": region_name,
+        }
+        self.max_pool_connections = max_pool_connections or max(10, workers or 1)
+        self.tcp_keepalive = tcp_keepalive
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+        self._lock_pid = os.getpid()
         self.return_path = return_path
+        self.retry = retry
+        self.raw = raw
+        self.workers = workers
+        self.rate = max_send_rate
+        if max_send_rate is not None and not isinstance(max_send_rate, TokenBucket):
+            self.rate = TokenBucket(max_send_rate)
         super(AmazonSESMailer, self).__init__(*args, **kwargs)
 
+    @property
+    def client(self):
+        """The boto3 client of SES, created on first use."""
+        pid = os.getpid()
+        if self._client is None or self._client_pid != pid:
+            if self._lock_pid != pid:
+                # After a fork. The lock could have been copied while held
+                # by another thread of the parent.
+                self._client_lock = threading.Lock()
+                self._lock_pid = pid
+            with self._client_lock:
+                if self._client is None or self._client_pid != pid:
+                    with self._phase("connect"):
+                        self._client = self._create_client()
+                    self._client_pid = pid
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+        self._client_pid = os.getpid()
+
+    def _create_client(self):
+        import boto3
+        from botocore.config import Config
+
+        options = {"max_pool_connections": self.max_pool_connections}
+        if self.tcp_keepalive:
+            options["tcp_keepalive"] = True
+        # A new session, because the default one is not thread-safe.
+        session = boto3.session.Session()
+        return session.client("ses", config=Config(**options), **self.client_kwargs)
+
     def send_messages(self, *email_messages):
-        """ """
-        logger = logging.getLogger("mailshake:AmazonSESMailer")
+        """Sends one or more EmailMessage objects and returns the number of
+        messages sent, as a `SendReport`. The `provider_id` of each result
+        is the "MessageId" given by Amazon SES.
+        """
         if not email_messages:
+            logger = logging.getLogger("mailshake:AmazonSESMailer")
             logger.debug("No email messages to send")
+            return SendReport()
+
+        results = [SendResult(msg) for msg in email_messages]
+        self._map(self._send, results)
+        return self._report(results)
+
+    def send_templated(
+        self,
+        template,
+        recipients,
+        from_email=None,
+        default_data=None,
+        reply_to=None,
+        tags=None,
+        configuration_set=None,
+    ):
+        """Send an email from a template stored in Amazon SES to many
+        recipients, using `SendBulkTemplatedEmail`, so every API call sends
+        up to 50 personalized messages.
+
+        `template`: Name of the SES template.
+
+        `recipients`: The destinations. Each one is a dictionary with the
+            "to" and, optionally, the "cc" and "bcc" addresses of the message,
+            plus the values for the placeholders of the template, like in
+            `MailMerge`.
+
+        `default_data`: Values used for the placeholders missing from the
+            data of a recipient.
+
+        `tags`: Default message tags, as a list of `{"Name":, "Value":}`.
+
+        Returns a `SendReport` with a `SendResult` for each destination,
+        whose `message` is the dictionary of that destination. The ones that
+        failed have a `SESBulkError` with the status given by SES. If there is
+        a `retry` policy, the destinations with a transient status, like
+        "TransientFailure", are sent again.
+        """
+        results = [SendResult(values) for values in recipients]
+        if not results:
+            logger = logging.getLogger("mailshake:AmazonSESMailer")
+            logger.debug("No destinations to send")
+            return SendReport()
+
+        base_data = {
+            "Source": from_email or self.default_from,
+            "Template": template,
+            "DefaultTemplateData": json.dumps(default_data or {}),
+        }
+        if reply_to:
+            base_data["ReplyToAddresses"] = encode_addresses(reply_to, "utf-8")
+        if tags:
+            base_data["DefaultTags"] = tags
+        if configuration_set:
+            base_data["ConfigurationSetName"] = configuration_set
+        if self.return_path:
+            base_data["ReturnPath"] = self.return_path
+
+        groups = [
+            results[i : i + BULK_MAX_DESTINATIONS]
+            for i in range(0, len(results), BULK_MAX_DESTINATIONS)
+        ]
+        self._map(lambda group: self._send_bulk(base_data, group), groups)
+        return self._report(results)
+
+    def _map(self, func, items):
+        """Call `func` for each item, using the pool of threads if
+        `workers` is bigger than one.
+        """
+        workers = min(self.workers or 1, len(items))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Consume the iterator to raise the errors, if any.
+                list(executor.map(func, items))
+        else:
+            for item in items:
+                func(item)
+
+    def _send_bulk(self, base_data, group):
+        """Send a group of destinations, retrying the ones that fail with
+        a transient status (like "TransientFailure") according to `retry`.
+        """
+        with self._phase("render"):
+            destinations = [_get_destination(result.message) for result in group]
+        pending = list(zip(group, destinations))
+        attempt = 1
+        while True:
+            try:
+                response = self._call_bulk(
+                    base_data, [destination for _, destination in pending]
+                )
+            except Exception as exc:
+                for result, _ in pending:
+                    result.error = exc
+                if not self.fail_silently:
+                    raise
+                return
+
+            pending = self._read_statuses(pending, response.get("Status", []))
+            if not pending or not self.retry or attempt >= self.retry.max_attempts:
+                return
+            self.retry.wait(attempt)
+            attempt += 1
+
+    def _call_bulk(self, base_data, destinations):
+        data = dict(base_data, Destinations=destinations)
+        logger = logging.getLogger("mailshake:AmazonSESMailer")
+        logger.debug(
+            "Sending template {0} to {1} destinations".format(
+                data["Template"], len(destinations)
+            )
+        )
+        if self.rate is not None:
+            self.rate.acquire(len(destinations))
+        method = self.client.send_bulk_templated_email
+        with self._phase("transfer"):
+            if self.retry:
+                return self.retry.call(method, **data)
+            return method(**data)
+
+    def _read_statuses(self, sent, statuses):
+        """Fill the results with the status of each destination and return
+        the ones worth retrying.
+        """
+        retry = []
+        for num, (result, destination) in enumerate(sent):
+            if num >= len(statuses):
+                result.error = SESBulkError("MissingStatus", "No status returned")
+                continue
+            status = statuses[num]
+            if status.get("Status") == "Success":
+                result.sent = True
+                result.error = None
+                result.accepted = _get_recipients(destination["Destination"])
+                result.provider_id = status.get("MessageId")
+                continue
+            result.error = SESBulkError(status.get("Status"), status.get("Error"))
+            if self.retry and self.retry.is_transient(result.error):
+                retry.append((result, destination))
+        return retry
+
+    def _send(self, result):
+        msg = result.message
+        # Outside of the render phase, because the first time it creates
+        # the client.
+        client = self.client
+        with result.timer("render"), self._phase("render"):
+            if self.raw:
+                method, data = client.send_raw_email, self._get_raw_data(msg)
+            else:
+                method, data = client.send_email, self._get_data(msg)
+
+        logger = logging.getLogger("mailshake:AmazonSESMailer")
+        logger.debug("Sending email from {0} to {1}".format(msg.from_email, msg.to))
+        if self.rate is not None:
+            self.rate.acquire()
+        try:
+            with result.timer("transfer"), self._phase("transfer"):
+                if self.retry:
+                    response = self.retry.call(method, **data)
+                else:
+                    response = method(**data)
+        except Exception as exc:
+            result.error = exc
+            if not self.fail_silently:
+                raise
             return
+        result.sent = True
+        result.accepted = msg.get_recipients()
+        result.provider_id = response.get("MessageId")
+        if self.raw:
+            result.bytes_sent = len(data["RawMessage"]["Data"])
+
+    def _get_raw_data(self, msg):
+        data = {
+            "Source": msg.from_email or self.default_from,
+            "Destinations": msg.get_recipients(),
+            "RawMessage": {
+                "Data": b"".join(msg.iter_bytes(policy=email.policy.SMTP)),
+            },
+        }
+        if msg.tags:
+            data["Tags"] = msg.tags
+        return data
+
+    def _get_data(self, msg):
+        destination_data = {"ToAddresses": msg.to}
+        if msg.cc:
+            destination_data["CcAddresses"] = msg.cc
+        if msg.bcc:
+            destination_data["BccAddresses"] = msg.bcc
+
+        body_data = {"Text": {"Data": msg.text, "Charset": "UTF-8"}}
+        if msg.html:
+            body_data["Html"] = {"Data": msg.html, "Charset": "UTF-8"}
+
+        data = {
+            "Source": msg.from_email,
+            "Destination": destination_data,
+            "Message": {
+                "Subject": {"Data": msg.subject, "Charset": "UTF-8"},
+                "Body": body_data,
+            },
+        }
+        if msg.reply_to:
+            data["ReplyToAddresses"] = msg.reply_to
+        if msg.tags:
+            data["Tags"] = msg.tags
+        if self.return_path:
+            data["ReturnPath"] = self.return_path
+        return data
+
+
+def _get_destination(values):
+    values = dict(values)
+    destination = {}
+    for field, key in (
+        ("to", "ToAddresses"),
+        ("cc", "CcAddresses"),
+        ("bcc", "BccAddresses"),
+    ):
+        addrs = encode_addresses(values.pop(field, None), "utf-8")
+        if addrs:
+            destination[key] = addrs
+    return {
+        "Destination": destination,
+        "ReplacementTemplateData": json.dumps(values),
+    }
+
 
-        responses = []
-
-        for msg in email_messages:
-            destination_data = {"ToAddresses": msg.to}
-            if msg.cc:
-                destination_data["CcAddresses"] = msg.cc
-            if msg.bcc:
-                destination_data["BccAddresses"] = msg.bcc
-
-            body_data = {"Text": {"Data": msg.text, "Charset": "UTF-8"}}
-            if msg.html:
-                body_data["Html"] = {"Data": msg.html, "Charset": "UTF-8"}
-
-            data = {
-                "Source": msg.from_email,
-                "Destination": destination_data,
-                "Message": {
-                    "Subject": {"Data": msg.subject, "Charset": "UTF-8"},
-                    "Body": body_data,
-                },
-            }
-            if msg.reply_to:
-                data["ReplyToAddresses"] = msg.reply_to
-            if msg.tags:
-                data["Tags"] = msg.tags
-            if self.return_path:
-                data["ReturnPath"] = self.return_path
-
-            logger.debug("Sending email from {0} to {1}".format(msg.from_email, msg.to))
-            response = self.client.send_email(**data)
-            responses.append(response)
-
-        return responses
+def _get_recipients(destination):
+    return (
+        destination.get("ToAddresses", [])
+        + destination.get("CcAddresses", [])
+        + destination.get("BccAddresses", [])
+    )
@@ -0,0 +1,387 @@
+"""
+    Asynchronous (asyncio) SMTP mailer.
+"""
+import asyncio
+import collections
+import email.policy
+import time
+
+from .base import AsyncBaseMailer
+from .smtp import render_chunks
+from ..message import FileAttachment, iter_message_bytes
+from ..results import SendReport, SendResult
+from ..utils import DNS_NAME
+
+
+class AsyncSMTPConnectionPool:
+
+    """A pool of open and authenticated asyncio SMTP connections.
+
+    The asynchronous version of `SMTPConnectionPool`. Connections can only
+    be used from the event loop they were created in.
+
+    `connect`: A coroutine function that returns a new, ready to use,
+        connection.
+
+    `max_size`: Maximum number of connections, idle or in use, open at
+        the same time. When all of them are in use, `acquire()` waits for one
+        to be released.
+
+    `idle_timeout`: Seconds an idle connection is kept open before being
+        discarded. Use `None` to keep them forever.
+
+    `max_messages`: Number of messages sent through a connection before
+        it is closed and replaced by a fresh one. Use `None` for no limit.
+
+    `check_after`: Idle connections that haven't been used for this many
+        seconds are checked with a NOOP command before being handed out.
+
+    `wait_timeout`: Maximum seconds `acquire()` waits for a free connection
+        before raising an `asyncio.TimeoutError`. `None` means wait forever.
+
+    """
+
+    def __init__(
+        self,
+        connect,
+        max_size=10,
+        idle_timeout=60,
+        max_messages=100,
+        check_after=1,
+        wait_timeout=None,
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+
+        # Created on first use, so it belongs to the running event loop.
+        self._cond = None
+        # Idle connections as (connection, last_used) pairs, most recently
+        # used at the right.
+        self._idle = collections.deque()
+        # Number of messages sent by every open connection.
+        self._sent = {}
+        self._size = 0
+        self._closed = False
+
+    @property
+    def size(self):
+        """Number of open connections, idle or in use."""
+        return self._size
+
+    async def acquire(self):
+        """Borrow a connection from the pool, opening a new one if there are
+        no idle connections available.
+        """
+        while True:
+            connection, check = await asyncio.wait_for(
+                self._reserve(), self.wait_timeout
+            )
+            if connection is None:
+                break
+            # Checked outside the lock, so the other tasks don't have to
+            # wait for the reply.
+            if not check or await _is_alive(connection):
+                return connection
+            async with self._cond:
+                self._forget(connection)
+                self._cond.notify()
+            connection.close()
+
+        try:
+            connection = await self._connect()
+        except BaseException:
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._sent[connection] = 0
+        return connection
+
+    async def _reserve(self):
+        """Wait until there is an idle connection, and return it with
+        whether it has to be checked before using it, or room for a new one,
+        and return `(None, False)`.
+        """
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            while True:
+                await self._cond.wait_for(self._can_acquire)
+                if self._closed:
+                    raise RuntimeError("The connection pool is closed")
+                while self._idle:
+                    connection, last_used = self._idle.pop()
+                    idle_for = time.monotonic() - last_used
+                    if self.idle_timeout is None or idle_for <= self.idle_timeout:
+                        return connection, idle_for >= self.check_after
+                    self._forget(connection)
+                    connection.close()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, False
+
+    async def release(self, connection, messages=0):
+        """Return a borrowed connection to the pool.
+        `messages` is the number of messages sent with it while borrowed.
+        """
+        sent = self._sent.get(connection, 0) + messages
+        self._sent[connection] = sent
+        recycle = self._closed or (
+            self.max_messages is not None and sent >= self.max_messages
+        )
+        if recycle:
+            await self.discard(connection)
+            return
+        async with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    async def discard(self, connection):
+        """Close a borrowed connection instead of returning it to the pool.
+        Use it for connections that are broken.
+        """
+        async with self._cond:
+            self._forget(connection)
+            self._cond.notify()
+        await quit_connection(connection)
+
+    async def close(self):
+        """Close all the idle connections. Connections in use are closed
+        when released.
+        """
+        self._closed = True
+        idle = [connection for connection, _ in self._idle]
+        self._idle.clear()
+        for connection in idle:
+            self._forget(connection)
+            await quit_connection(connection)
+        if self._cond is not None:
+            async with self._cond:
+                self._cond.notify_all()
+
+    def _can_acquire(self):
+        return self._closed or bool(self._idle) or self._size < self.max_size
+
+    def _forget(self, connection):
+        self._sent.pop(connection, None)
+        self._size -= 1
+
+
+async def _is_alive(connection):
+    try:
+        response = await connection.noop()
+        return response.code == 250
+    except Exception:
+        return False
+
+
+async def quit_connection(connection):
+    """Politely close an SMTP connection, falling back to just dropping it."""
+    try:
+        await connection.quit()
+    except Exception:
+        connection.close()
+
+
+class AsyncSMTPMailer(AsyncBaseMailer):
+
+    """The asynchronous version of `SMTPMailer`.
+    Requires the `aiosmtplib` python library.
+
+    The connections are always taken from a pool, so remember to `close()`
+    the mailer when you are done with it.
+
+    `max_recipients`: Number of maximum recipients per mesage
+        Mailshake send several messages instead of one, in order to stay inside
+        that limit.
+
+    `pool_size`: Maximum number of connections open at the same time.
+        `send_messages()` uses up to this many connections concurrently.
+
+    `pool_idle_timeout`: Seconds an unused pooled connection is kept open.
+
+    `pool_max_messages`: Number of messages sent through a pooled connection
+        before replacing it with a new one.
+
+    `pool_timeout`: Maximum seconds to wait for a free pooled connection.
+
+    """
+
+    def __init__(
+        self,
+        host="localhost",
+        port=587,
+        username=None,
+        password=None,
+        use_tls=None,
+        use_ssl=None,
+        timeout=None,
+        max_recipients=200,
+        pool_size=10,
+        pool_idle_timeout=60,
+        pool_max_messages=100,
+        pool_timeout=None,
+        *args,
+        **kwargs
+    ):
+        import aiosmtplib
+
+        self._aiosmtplib = aiosmtplib
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = bool(use_tls)
+        self.use_ssl = bool(use_ssl)
+        self.timeout = timeout
+        if self.use_ssl and self.use_tls:
+            raise ValueError("EMAIL_USE_TLS/EMAIL_USE_SSL are mutually exclusive")
+
+        self.max_recipients = max_recipients
+        self.pool = AsyncSMTPConnectionPool(
+            self.connect,
+            max_size=pool_size,
+            idle_timeout=pool_idle_timeout,
+            max_messages=pool_max_messages,
+            wait_timeout=pool_timeout,
+        )
+        super(AsyncSMTPMailer, self).__init__(*args, **kwargs)
+
+    async def connect(self):
+        """Open and return a new, authenticated connection to the email server."""
+        with self._phase("connect"):
+            return await self._connect()
+
+    async def _connect(self):
+        connection = self._aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            username=self.username if self.password else None,
+            password=self.password if self.username else None,
+            # For performance, we use the cached FQDN for local_hostname.
+            local_hostname=DNS_NAME.get_fqdn(),
+            timeout=self.timeout,
+            use_tls=self.use_ssl,
+            start_tls=self.use_tls,
+        )
+        await connection.connect()
+        return connection
+
+    async def close(self):
+        """Closes all the idle connections to the email server."""
+        await self.pool.close()
+
+    async def send_messages(self, *email_messages):
+        """Sends one or more EmailMessage objects and returns the number of
+        messages sent, as a `SendReport`.
+
+        Up to `pool_size` messages are sent concurrently, each one using
+        a different connection.
+        """
+        if not email_messages:
+            return SendReport()
+        results = [SendResult(message) for message in email_messages]
+        pending = iter(results)
+        workers = min(self.pool.max_size, len(email_messages))
+        # Wait for all the workers, even if one fails, so no message is
+        # still being sent after raising the error.
+        errors = await asyncio.gather(
+            *[self._work(pending) for _ in range(workers)], return_exceptions=True
+        )
+        for error in errors:
+            if error is not None:
+                raise error
+        return self._report(results)
+
+    async def _work(self, pending):
+        try:
+            connection = await self.pool.acquire()
+        except Exception:
+            if not self.fail_silently:
+                _stop(pending)
+                raise
+            # Leave the messages to the other workers.
+            return
+
+        messages = 0
+        try:
+            for result in pending:
+                messages += await self._send(connection, result)
+        except BaseException:
+            _stop(pending)
+            await self.pool.discard(connection)
+            raise
+        await self.pool.release(connection, messages)
+
+    async def _send(self, connection, result):
+        """A helper method that does the actual sending.
+        Fills the `result` and returns the number of chunks sent.
+        """
+        message = result.message
+        recipients = message.get_recipients()
+        if not recipients:
+            return 0
+        from_email = message.from_email or self.default_from
+        chunks = 0
+        try:
+            start = time.perf_counter()
+            # Your SMTP provider has limits!
+            for group, msg in render_chunks(message, self.max_recipients):
+                if _has_files(msg):
+                    # Reading the files would block the event loop
+                    rendered_msg = await asyncio.get_running_loop().run_in_executor(
+                        None, _as_bytes, msg
+                    )
+                else:
+                    rendered_msg = _as_bytes(msg)
+                result.add_time("render", time.perf_counter() - start)
+                result.message_id = msg["Message-ID"]
+                with result.timer("transfer"), self._phase("transfer"):
+                    refused = await self._sendmail(
+                        connection, from_email, group, rendered_msg, result
+                    )
+                result.accepted.extend(addr for addr in group if addr not in refused)
+                result.refused.update(refused)
+                result.bytes_sent += len(rendered_msg)
+                chunks += 1
+                start = time.perf_counter()
+            result.sent = True
+        except Exception as exc:
+            result.error = exc
+            if not self.fail_silently:
+                raise
+        return chunks
+
+    async def _sendmail(self, connection, from_email, recipients, data, result):
+        """Send the data and return the refused recipients."""
+        # Attempts per message, not per group of recipients.
+        result.attempts = max(result.attempts, 1)
+        try:
+            refused, _ = await connection.sendmail(from_email, recipients, data)
+        except self._aiosmtplib.SMTPServerDisconnected:
+            # Reconnect the same client and try again.
+            connection.close()
+            with result.timer("connect"), self._phase("connect"):
+                await connection.connect()
+            result.attempts = max(result.attempts, 2)
+            refused, _ = await connection.sendmail(from_email, recipients, data)
+        return {addr: (reply.code, reply.message) for addr, reply in refused.items()}
+
+
+def _stop(pending):
+    """Take all the pending messages, so the other workers stop after
+    the ones they are sending.
+    """
+    collections.deque(pending, maxlen=0)
+
+
+def _as_bytes(msg):
+    return b"".join(iter_message_bytes(msg, policy=email.policy.SMTP))
+
+
+def _has_files(msg):
+    return any(isinstance(part, FileAttachment) for part in msg.walk())
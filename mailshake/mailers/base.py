@@ -1,15 +1,44 @@
+from ..instrumentation import NO_INSTRUMENTATION
 from ..message import EmailMessage
+from ..results import SendReport
 
 
-class BaseMailer:
+class InstrumentedMixin:
+    def _phase(self, name):
+        """Measure a phase of the sending with the instrumentation."""
+        return self.instrumentation.phase(name, mailer=type(self).__name__)
+
+    def _report(self, results, timings=None):
+        """Make the `SendReport` of the results and pass each one
+        to the instrumentation.
+        """
+        report = SendReport(results, timings)
+        labels = {"mailer": type(self).__name__}
+        for result in report.results:
+            self.instrumentation.on_result(result, labels)
+        return report
+
+
+class BaseMailer(InstrumentedMixin):
     """Base class for mailers implementations.
 
     Subclasses must at least overwrite send_messages().
+
+    `instrumentation`: An `Instrumentation` to measure the phases of the
+        sending, eg: a `MetricsCollector`.
     """
 
-    def __init__(self, default_from=None, fail_silently=False, *args, **kwargs):
+    def __init__(
+        self,
+        default_from=None,
+        fail_silently=False,
+        instrumentation=None,
+        *args,
+        **kwargs
+    ):
         self.default_from = default_from
         self.fail_silently = fail_silently
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
 
     def open(self):
         """Open a network connection.
@@ -41,6 +70,51 @@ class BaseMailer:
 
     def send_messages(self, *email_messages):
         """Sends one or more `EmailMessage` objects and returns the number of
-        email messages sent.
+        email messages sent, as a `SendReport` with the result of
+        each message.
+        """
+        raise NotImplementedError
+
+
+class AsyncBaseMailer(InstrumentedMixin):
+    """Base class for asynchronous (asyncio) mailers implementations.
+
+    The same as `BaseMailer`, but `open()`, `close()`, `send()` and
+    `send_messages()` are coroutines.
+
+    Subclasses must at least overwrite send_messages().
+    """
+
+    def __init__(
+        self,
+        default_from=None,
+        fail_silently=False,
+        instrumentation=None,
+        *args,
+        **kwargs
+    ):
+        self.default_from = default_from
+        self.fail_silently = fail_silently
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
+
+    async def open(self):
+        """Open a network connection.
+        The default implementation does nothing.
+        """
+        pass
+
+    async def close(self):
+        """Close a network connection.
+        The default implementation does nothing.
+        """
+        pass
+
+    async def send(self, *args, **kwargs):
+        return await self.send_messages(EmailMessage(*args, **kwargs))
+
+    async def send_messages(self, *email_messages):
+        """Sends one or more `EmailMessage` objects and returns the number of
+        email messages sent, as a `SendReport` with the result of
+        each message.
         """
         raise NotImplementedError
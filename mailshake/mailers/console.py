@@ -6,6 +6,11 @@ import sys
 import threading
 
 from .base import BaseMailer
+from ..results import SendResult
+
+
+# Written after each message
+SEPARATOR = "-" * 79 + "\n"
 
 
 class ToConsoleMailer(BaseMailer):
@@ -18,24 +23,28 @@ class ToConsoleMailer(BaseMailer):
         msg = message.render()
         msg_data = msg.as_string()
         self.stream.write("%s\n" % msg_data)
-        self.stream.write("-" * 79)
-        self.stream.write("\n")
+        self.stream.write(SEPARATOR)
+        return msg
 
     def send_messages(self, *email_messages):
         """Write all messages to the stream in a thread-safe way."""
         if not email_messages:
-            return
-        msg_count = 0
+            return self._report([])
+        results = []
         with self._lock:
             try:
                 stream_created = self.open()
                 for message in email_messages:
                     self.write_message(message)
                     self.stream.flush()  # flush after each message
-                    msg_count += 1
+                    results.append(SendResult(message, sent=True))
                 if stream_created:
                     self.close()
-            except Exception:
+            except Exception as exc:
                 if not self.fail_silently:
                     raise
-        return msg_count
+                for message in email_messages[len(results) :]:
+                    result = SendResult(message)
+                    result.error = exc
+                    results.append(result)
+        return self._report(results)
@@ -1,9 +1,15 @@
 """
 Dummy mailer that does nothing.
 """
-from .base import BaseMailer
+from .base import AsyncBaseMailer, BaseMailer
+from ..results import sent_results
 
 
 class DummyMailer(BaseMailer):
     def send_messages(self, *email_messages):
-        return len(email_messages)
+        return self._report(sent_results(email_messages))
+
+
+class AsyncDummyMailer(AsyncBaseMailer):
+    async def send_messages(self, *email_messages):
+        return self._report(sent_results(email_messages))
@@ -1,15 +1,39 @@
 """
 Mailer that writes messages to a file.
 """
+from collections import namedtuple
 import datetime
+from email import message_from_bytes
+import email.policy
 import errno
 import os
+import threading
+import time
 
-from .console import ToConsoleMailer
+from .console import SEPARATOR, ToConsoleMailer
+from ..utils import normalize_address
+
+
+# Name of the index file, inside the directory of the messages.
+INDEX_NAME = "index.sqlite3"
+
+# Number of entries read at once from the index.
+PAGE_SIZE = 500
 
 
 class ToFileMailer(ToConsoleMailer):
-    def __init__(self, path, multifile=True, *args, **kwargs):
+    """Writes the messages to files in the `path` directory.
+
+    `multifile`: If true, a new file is used every time the mailer is opened
+        (eg: for each call to `send_messages()` when not already open).
+
+    `index`: If true, keep an index of the messages written, in a SQLite
+        database in the same directory, so they can be found by Message-ID,
+        recipient or subject without reading all the files.
+        See `FileIndex`.
+    """
+
+    def __init__(self, path, multifile=True, index=False, *args, **kwargs):
         assert isinstance(path, str)
         path = os.path.abspath(path)
         if os.path.isfile(path):
@@ -32,6 +56,7 @@ class ToFileMailer(ToConsoleMailer):
         self.path = path
         self.multifile = multifile
         self._fname = None
+        self.index = FileIndex(path) if index else None
 
         # Finally, call super().
         # Since we're using the console-based backend as a base,
@@ -39,6 +64,23 @@ class ToFileMailer(ToConsoleMailer):
         kwargs["stream"] = None
         super(ToFileMailer, self).__init__(*args, **kwargs)
 
+    def send_messages(self, *email_messages):
+        try:
+            return super(ToFileMailer, self).send_messages(*email_messages)
+        finally:
+            if self.index is not None:
+                self.index.commit()
+
+    def write_message(self, message):
+        if self.index is None:
+            return super(ToFileMailer, self).write_message(message)
+        offset = self.stream.tell()
+        msg = super(ToFileMailer, self).write_message(message)
+        self.stream.flush()
+        length = self.stream.tell() - offset - len(SEPARATOR.encode("ascii"))
+        self.index.add(message, msg, self._fname, offset, length)
+        return msg
+
     def _get_filename(self):
         """Return a unique file name."""
         if self._fname is None:
@@ -63,3 +105,167 @@ class ToFileMailer(ToConsoleMailer):
             self.stream = None
             if self.multifile:
                 self._fname = None
+
+
+IndexEntry = namedtuple(
+    "IndexEntry",
+    "message_id sender recipients subject timestamp filename offset length",
+)
+
+
+class FileIndex:
+    """An index of the messages written by a `ToFileMailer`, stored in the
+    `INDEX_NAME` SQLite database of the directory.
+
+    For each message, it saves its Message-ID, sender, recipients (including
+    Bcc), subject, the time it was written and where it is: the name of the
+    file and the offset and length of the message inside it. The searches
+    by Message-ID, recipient or subject use the indexes of the database,
+    so they are fast even with millions of messages.
+
+    It can also be used to read the messages of a directory written by
+    other processes: `FileIndex(path)`.
+    """
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(self.path, INDEX_NAME), timeout=30, check_same_thread=False
+        )
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def add(self, message, msg, filename, offset, length):
+        """Add a message to the index. The changes are saved when
+        `commit()` is called.
+
+        `message`: The `EmailMessage`.
+        `msg`: The message rendered, as it was written.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO messages (message_id, sender, subject, timestamp,"
+                " filename, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _normalize_id(msg.get("Message-ID", "")),
+                    message.from_email,
+                    message.subject,
+                    time.time(),
+                    os.path.relpath(filename, self.path),
+                    offset,
+                    length,
+                ),
+            )
+            self._db.executemany(
+                "INSERT INTO recipients (message, address) VALUES (?, ?)",
+                [
+                    (cursor.lastrowid, normalize_address(addr))
+                    for addr in message.get_recipients()
+                ],
+            )
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def find(self, message_id=None, recipient=None, subject=None, limit=None):
+        """Yields an `IndexEntry` for each message that matches all the
+        given filters, in the order they were written.
+        The entries are read from the database in pages, as needed.
+        """
+        sql = [
+            "SELECT DISTINCT m.id, m.message_id, m.sender, m.subject, m.timestamp,"
+            " m.filename, m.offset, m.length FROM messages m"
+        ]
+        where, params = ["m.id > ?"], []
+        if recipient is not None:
+            sql.append("JOIN recipients r ON r.message = m.id")
+            where.append("r.address = ?")
+            params.append(normalize_address(recipient))
+        if message_id is not None:
+            where.append("m.message_id = ?")
+            params.append(_normalize_id(message_id))
+        if subject is not None:
+            where.append("m.subject = ?")
+            params.append(subject)
+        sql.append("WHERE " + " AND ".join(where))
+        sql.append("ORDER BY m.id LIMIT %d" % PAGE_SIZE)
+        sql = " ".join(sql)
+
+        last_id = 0
+        while limit is None or limit > 0:
+            with self._lock:
+                rows = self._db.execute(sql, [last_id] + params).fetchall()
+                recipients = self._recipients([row[0] for row in rows])
+            for row in rows[:limit]:
+                yield IndexEntry(row[1], row[2], recipients[row[0]], *row[3:])
+            if limit is not None:
+                limit -= len(rows)
+            if len(rows) < PAGE_SIZE:
+                break
+            last_id = rows[-1][0]
+
+    def messages(self, **filters):
+        """Yields the messages that match the filters of `find()`, as
+        `email.message.EmailMessage` objects, reading only their part
+        of the files.
+        """
+        for entry in self.find(**filters):
+            yield self.read(entry)
+
+    def read(self, entry):
+        """Read the message of an `IndexEntry`."""
+        with open(os.path.join(self.path, entry.filename), "rb") as f:
+            f.seek(entry.offset)
+            data = f.read(entry.length)
+        return message_from_bytes(data, policy=email.policy.default)
+
+    def _recipients(self, ids):
+        recipients = {id: [] for id in ids}
+        rows = self._db.execute(
+            "SELECT message, address FROM recipients WHERE message IN (%s)"
+            " ORDER BY id" % ",".join("?" * len(ids)),
+            ids,
+        )
+        for message, address in rows:
+            recipients[message].append(address)
+        return recipients
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT,
+    sender TEXT,
+    subject TEXT,
+    timestamp REAL,
+    filename TEXT,
+    offset INTEGER,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS messages_message_id ON messages (message_id);
+CREATE INDEX IF NOT EXISTS messages_subject ON messages (subject);
+CREATE TABLE IF NOT EXISTS recipients (
+    id INTEGER PRIMARY KEY,
+    message INTEGER,
+    address TEXT
+);
+CREATE INDEX IF NOT EXISTS recipients_address ON recipients (address);
+CREATE INDEX IF NOT EXISTS recipients_message ON recipients (message);
+"""
+
+
+def _normalize_id(message_id):
+    return message_id.strip().strip("<>")
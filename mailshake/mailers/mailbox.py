@@ -0,0 +1,183 @@
+"""
+Mailers that save the messages in the standard Maildir and mbox formats,
+so they can be read by any email client or by the `mailbox` module.
+"""
+from email.utils import parseaddr
+import gzip
+import itertools
+import os
+import re
+import socket
+import threading
+import time
+
+from .base import BaseMailer
+from .spool import FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER, _fsync_dir
+from ..results import SendResult
+
+try:
+    import fcntl
+except ImportError:  # pragma:no cover
+    # Windows
+    fcntl = None
+
+
+# File extension of each compression
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+# Lines of the body that must be escaped in a mbox file (the "mboxrd" variant).
+FROM_LINE = re.compile(rb"^(>*From )", re.MULTILINE)
+
+
+class ToMaildirMailer(BaseMailer):
+    """Save each message in its own file, in a Maildir directory.
+
+    The messages are written in `tmp/` and atomically moved to `new/`,
+    so a reader never sees an incomplete message.
+
+    `compress`: None, "gzip" or "zstd" (requires the `zstandard` library).
+        The compressed files have a ".gz" or ".zst" extension.
+
+    `fsync`: The same as in `SpoolMailer`, but "never" by default, because
+        these messages are not going to be delivered.
+    """
+
+    def __init__(self, path, compress=None, fsync=FSYNC_NEVER, *args, **kwargs):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER):
+            raise ValueError("Invalid fsync value: %r" % (fsync,))
+        self.path = os.path.abspath(path)
+        self.compress = compress
+        self.fsync = fsync
+        self._compressor = _get_compressor(compress)
+        self.tmp_path = os.path.join(self.path, "tmp")
+        self.new_path = os.path.join(self.path, "new")
+        for path in (self.tmp_path, self.new_path, os.path.join(self.path, "cur")):
+            os.makedirs(path, exist_ok=True)
+        self._counter = itertools.count()
+        self._hostname = (
+            socket.gethostname().replace("/", r"\057").replace(":", r"\072")
+        )
+        super(ToMaildirMailer, self).__init__(*args, **kwargs)
+
+    def send_messages(self, *email_messages):
+        """Save the messages and returns the number of messages saved,
+        as a `SendReport`.
+        """
+        results = []
+        try:
+            for message in email_messages:
+                result = SendResult(message)
+                results.append(result)
+                name = self._write(_as_bytes(message))
+                os.rename(
+                    os.path.join(self.tmp_path, name), os.path.join(self.new_path, name)
+                )
+                if self.fsync == FSYNC_ALWAYS:
+                    _fsync_dir(self.new_path)
+                result.sent = True
+                result.accepted = message.get_recipients()
+            if self.fsync == FSYNC_BATCH:
+                _fsync_dir(self.new_path)
+        except Exception as exc:
+            if not self.fail_silently:
+                raise
+            results.extend(SendResult(msg) for msg in email_messages[len(results) :])
+            for result in results:
+                if not result.sent:
+                    result.error = exc
+        return self._report(results)
+
+    def _write(self, data):
+        now = time.time()
+        name = "%d.M%dP%dQ%d.%s%s" % (
+            now,
+            (now % 1) * 1e6,
+            os.getpid(),
+            next(self._counter),
+            self._hostname,
+            COMPRESSIONS[self.compress],
+        )
+        if self._compressor:
+            data = self._compressor(data)
+        with open(os.path.join(self.tmp_path, name), "wb") as f:
+            f.write(data)
+            if self.fsync != FSYNC_NEVER:
+                f.flush()
+                os.fsync(f.fileno())
+        return name
+
+
+class ToMboxMailer(BaseMailer):
+    """Append the messages to a single mbox file.
+
+    The lines of the messages starting with "From " are escaped with a ">"
+    (the "mboxrd" format). The messages of each call to `send_messages()`
+    are written at once, holding an exclusive lock of the file (with
+    `fcntl.flock()`, where available) so several processes can share it.
+
+    `compress`: None, "gzip" or "zstd" (requires the `zstandard` library).
+        Each call to `send_messages()` appends a new gzip member or zstd
+        frame, so the file can be decompressed as a whole with the usual
+        tools. The file name should have the matching extension.
+    """
+
+    def __init__(self, path, compress=None, *args, **kwargs):
+        self.path = os.path.abspath(path)
+        self.compress = compress
+        self._compressor = _get_compressor(compress)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        super(ToMboxMailer, self).__init__(*args, **kwargs)
+
+    def send_messages(self, *email_messages):
+        """Append the messages to the file and returns the number of
+        messages saved, as a `SendReport`.
+        """
+        results = [SendResult(message) for message in email_messages]
+        if not results:
+            return self._report(results)
+        try:
+            data = b"".join(self._format(message) for message in email_messages)
+            if self._compressor:
+                data = self._compressor(data)
+            with self._lock, open(self.path, "ab") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                f.write(data)
+                f.flush()
+        except Exception as exc:
+            if not self.fail_silently:
+                raise
+            for result in results:
+                result.error = exc
+            return self._report(results)
+
+        for result in results:
+            result.sent = True
+            result.accepted = result.message.get_recipients()
+        return self._report(results)
+
+    def _format(self, message):
+        sender = parseaddr(message.from_email or self.default_from or "")[1]
+        data = FROM_LINE.sub(rb">\1", _as_bytes(message))
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        from_line = "From %s %s\n" % (sender or "MAILER-DAEMON", time.asctime())
+        return from_line.encode("utf-8") + data + b"\n"
+
+
+def _as_bytes(message):
+    # With "\n" line endings
+    return b"".join(message.iter_bytes())
+
+
+def _get_compressor(compress):
+    if compress is None:
+        return None
+    if compress == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=6)
+    if compress == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress
+    raise ValueError("Invalid compress value: %r" % (compress,))
@@ -1,6 +1,15 @@
 """Mailer for testing.
 """
-from .base import BaseMailer
+from collections import deque
+from collections.abc import MutableSequence
+from email import message_from_bytes
+import email.policy
+import threading
+import zlib
+
+from .base import AsyncBaseMailer, BaseMailer
+from ..results import sent_results
+from ..utils import normalize_address
 
 
 class ToMemoryMailer(BaseMailer):
@@ -10,13 +19,227 @@ class ToMemoryMailer(BaseMailer):
     rather than sending them out on the wire.
 
     The dummy outbox is accessible through the outbox instance attribute.
+    See `Outbox`.
+
+    `maxlen`: If given, the outbox only keeps this many messages,
+        discarding the oldest ones.
+
+    `compact`: If true, the outbox keeps the messages rendered and
+        compressed (as `StoredMessage`s) instead of the `EmailMessage`
+        objects, with their attachments.
     """
 
     def __init__(self, *args, **kwargs):
-        self.outbox = []
+        self.outbox = Outbox(
+            maxlen=kwargs.pop("maxlen", None), compact=kwargs.pop("compact", False)
+        )
         super(ToMemoryMailer, self).__init__(*args, **kwargs)
 
     def send_messages(self, *email_messages):
         """Redirect messages to the dummy outbox."""
         self.outbox.extend(email_messages)
-        return len(email_messages)
+        return self._report(sent_results(email_messages))
+
+
+class AsyncToMemoryMailer(AsyncBaseMailer):
+    """The asynchronous version of `ToMemoryMailer`."""
+
+    def __init__(self, *args, **kwargs):
+        self.outbox = Outbox(
+            maxlen=kwargs.pop("maxlen", None), compact=kwargs.pop("compact", False)
+        )
+        super(AsyncToMemoryMailer, self).__init__(*args, **kwargs)
+
+    async def send_messages(self, *email_messages):
+        """Redirect messages to the dummy outbox."""
+        self.outbox.extend(email_messages)
+        return self._report(sent_results(email_messages))
+
+
+class Outbox(MutableSequence):
+    """The messages sent to a `ToMemoryMailer`, oldest first.
+
+    It works like a list (`len(outbox)`, `outbox[0]`, `outbox[-2:]`,
+    `outbox.pop()`, `del outbox[:]`, etc.) but it can be bounded, and it
+    has indexes to find the messages without scanning all of them:
+
+        outbox.by_recipient("bob@example.com")
+        outbox.by_subject("Welcome!")
+        outbox.by_message_id("<...@example.com>")
+
+    `maxlen`: Maximum number of messages kept. When full, adding a message
+        discards the oldest one. `evicted` counts the messages discarded.
+
+    `compact`: Keep the messages as `StoredMessage`s.
+
+    The messages are indexed when added, so changing them later doesn't
+    update the indexes. `EmailMessage`s only get a Message-ID when rendered,
+    so `by_message_id()` finds only the ones with an explicit "Message-ID"
+    header or, in compact mode, all of them.
+    """
+
+    def __init__(self, maxlen=None, compact=False):
+        self.maxlen = maxlen
+        self.compact = compact
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # (message, its keys in the indexes)
+        self._items = deque()
+        self._index = {}
+
+    def append(self, message):
+        message, keys = self._entry(message)
+        with self._lock:
+            if self.maxlen is not None and len(self._items) >= self.maxlen:
+                self._evict()
+            self._items.append((message, keys))
+            for key in keys:
+                self._index.setdefault(key, deque()).append(message)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def insert(self, index, message):
+        entry = self._entry(message)
+        with self._lock:
+            items = list(self._items)
+            items.insert(index, entry)
+            self._replace(items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._index.clear()
+
+    def by_recipient(self, address):
+        """The messages sent to `address` (in To, Cc or Bcc)."""
+        return self._lookup(("to", normalize_address(address)))
+
+    def by_subject(self, subject):
+        return self._lookup(("subject", subject))
+
+    def by_message_id(self, message_id):
+        """The message with that Message-ID, or `None`."""
+        found = self._lookup(("id", message_id.strip("<>")))
+        return found[-1] if found else None
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        with self._lock:
+            items = list(self._items)
+        return (message for message, _ in items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return self._items[index][0]
+
+    def __setitem__(self, index, message):
+        if isinstance(index, slice):
+            entry = [self._entry(msg) for msg in message]
+        else:
+            entry = self._entry(message)
+        with self._lock:
+            items = list(self._items)
+            items[index] = entry
+            self._replace(items)
+
+    def __delitem__(self, index):
+        with self._lock:
+            items = list(self._items)
+            del items[index]
+            self._replace(items)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, Outbox)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "<Outbox %r>" % list(self)
+
+    def _entry(self, message):
+        if self.compact and not isinstance(message, StoredMessage):
+            message = StoredMessage(message)
+        return message, _index_keys(message)
+
+    def _replace(self, items):
+        """Replace all the messages and rebuild the indexes.
+        Must be called holding the lock.
+        """
+        if self.maxlen is not None and len(items) > self.maxlen:
+            self.evicted += len(items) - self.maxlen
+            items = items[-self.maxlen :]
+        self._items = deque(items)
+        self._index = {}
+        for message, keys in items:
+            for key in keys:
+                self._index.setdefault(key, deque()).append(message)
+
+    def _evict(self):
+        _, keys = self._items.popleft()
+        for key in keys:
+            # The oldest message of each key is the one evicted.
+            found = self._index[key]
+            found.popleft()
+            if not found:
+                del self._index[key]
+        self.evicted += 1
+
+    def _lookup(self, key):
+        with self._lock:
+            return list(self._index.get(key, ()))
+
+
+class StoredMessage:
+    """A message, already rendered, kept compressed in an `Outbox`.
+
+    It has the `subject`, `from_email`, `to`, `cc`, `bcc` and `message_id`
+    of the original message. `as_bytes()` returns the rendered message and
+    `parse()` returns it as a `email.message.EmailMessage`.
+    """
+
+    __slots__ = ("subject", "from_email", "to", "cc", "bcc", "message_id", "_data")
+
+    def __init__(self, message):
+        msg = message.render()
+        self.subject = message.subject
+        self.from_email = message.from_email
+        self.to = message.to
+        self.cc = message.cc
+        self.bcc = message.bcc
+        self.message_id = msg.get("Message-ID", "").strip("<>") or None
+        self._data = zlib.compress(msg.as_bytes(policy=email.policy.default), 1)
+
+    def get_recipients(self):
+        return self.to + self.cc + self.bcc
+
+    def as_bytes(self):
+        return zlib.decompress(self._data)
+
+    def parse(self):
+        return message_from_bytes(self.as_bytes(), policy=email.policy.default)
+
+    def __repr__(self):
+        return "<StoredMessage %r>" % (self.subject,)
+
+
+def _index_keys(message):
+    keys = {("to", normalize_address(addr)) for addr in message.get_recipients()}
+    keys.add(("subject", message.subject))
+    if isinstance(message, StoredMessage):
+        message_id = message.message_id
+    else:
+        message_id = message.extra_headers.get("Message-ID", "").strip("<>")
+    if message_id:
+        keys.add(("id", message_id))
+    return keys
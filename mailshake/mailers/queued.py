@@ -0,0 +1,169 @@
+"""
+Mailer that sends the messages in background threads.
+"""
+import atexit
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+
+from .base import BaseMailer
+from ..results import SendReport, get_results
+
+
+_STOP = object()
+
+
+class QueuedMailer(BaseMailer):
+    """Wraps another mailer so the messages are sent by background threads,
+    without blocking the caller.
+
+    `send()` and `send_messages()` put the messages in a queue and return
+    right away a `concurrent.futures.Future`. The worker threads take the
+    messages from the queue, in batches, and send them with the
+    `send_messages()` of the wrapped mailer. The future is resolved with
+    a `SendReport` of the messages, or with the exception raised while
+    sending the batch that included them.
+
+    `mailer`: The mailer used to send the messages, eg: a `SMTPMailer`.
+
+    `workers`: Number of worker threads.
+
+    `maxsize`: Maximum number of pending calls to `send_messages()` in the
+        queue. When the queue is full, new calls wait for a free slot or,
+        if `block` is false, raise a `queue.Full` exception.
+
+    `batch_size`: Maximum number of messages sent by a worker at once.
+
+    `block`: Whether to wait when the queue is full.
+
+    `timeout`: Maximum seconds to wait for a free slot in the queue before
+        raising `queue.Full`. `None` means wait forever.
+
+    The pending messages are sent when calling `close()`, or when the
+    program exits.
+    """
+
+    def __init__(
+        self,
+        mailer,
+        workers=1,
+        maxsize=1000,
+        batch_size=100,
+        block=True,
+        timeout=None,
+        *args,
+        **kwargs
+    ):
+        self.mailer = mailer
+        self.batch_size = batch_size
+        self.block = block
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize)
+        self._closed = False
+        # Number of calls putting messages in the queue right now
+        self._putting = 0
+        self._lock = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._work, name="mailshake-worker-%s" % num)
+            for num in range(workers)
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        atexit.register(self.close)
+        super(QueuedMailer, self).__init__(*args, **kwargs)
+
+    def send_messages(self, *email_messages):
+        """Put the messages in the queue and return a `Future`."""
+        future = Future()
+        if not email_messages:
+            future.set_result(SendReport())
+            return future
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The mailer is closed")
+            self._putting += 1
+        # Without holding the lock, so a call waiting for a free slot
+        # doesn't block the others.
+        try:
+            self._queue.put((email_messages, future), self.block, self.timeout)
+        finally:
+            with self._lock:
+                self._putting -= 1
+                self._lock.notify_all()
+        return future
+
+    def flush(self):
+        """Wait until all the messages in the queue have been sent."""
+        self._queue.join()
+
+    def close(self):
+        """Stop accepting messages, wait until the pending ones are sent,
+        stop the workers and close the wrapped mailer.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # The messages must be in the queue before the workers stop.
+            while self._putting:
+                self._lock.wait()
+        atexit.unregister(self.close)
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self.mailer.close()
+
+    def _work(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            size = len(item[0])
+            while size < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    # Send what we have and then stop.
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            try:
+                self._send_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send_batch(self, batch):
+        # Skip the messages whose futures were cancelled
+        batch = [
+            (messages, future)
+            for messages, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+        messages = [message for messages, _ in batch for message in messages]
+        try:
+            result = self.mailer.send_messages(*messages)
+        except BaseException as exc:
+            logger = logging.getLogger("mailshake:QueuedMailer")
+            logger.debug("Error sending %s messages: %r", len(messages), exc)
+            for _, future in batch:
+                future.set_exception(exc)
+        else:
+            results = get_results(result, messages)
+            start = 0
+            for messages, future in batch:
+                end = start + len(messages)
+                future.set_result(SendReport(results[start:end]))
+                start = end
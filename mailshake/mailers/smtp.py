@@ -1,18 +1,484 @@
 """
     SMTP mailer.
 """
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import email.policy
+from email.utils import parseaddr
+import re
 import smtplib
 import ssl
+import threading
+import time
 
 from .base import BaseMailer
+from ..message import iter_message_bytes
+from ..results import SendReport, SendResult
+from ..retry import RetryPolicy
 from ..utils import DNS_NAME
 
 
+# By default, a message is retried only once, and only if the server
+# disconnected, after reconnecting.
+RECONNECT_ONCE = RetryPolicy(
+    max_attempts=2,
+    base_delay=0,
+    jitter=0,
+    classify=lambda exc: isinstance(exc, smtplib.SMTPServerDisconnected),
+)
+
+# Size of the BDAT commands used to send the messages to the servers
+# that support CHUNKING.
+BDAT_CHUNK_SIZE = 256 * 1024
+
+
 def chunker(seq, size):
     return (seq[pos : pos + size] for pos in range(0, len(seq), size))
 
 
+def render_chunks(message, max_recipients):
+    """Split the recipients of the message in groups of at most
+    `max_recipients` and yields, for each group, a `(recipients, msg)`
+    pair, where `msg` is the message rendered for those recipients.
+
+    The message is rendered only once, so the body and attachments are
+    encoded only once too; for each group only the "To" and "Cc" headers
+    are updated, so `msg` must be serialized before asking for the next
+    group. The `EmailMessage` itself is not modified.
+    """
+    recipients = message.get_recipients()
+    msg = message.render()
+    if len(recipients) <= max_recipients:
+        yield recipients, msg
+        return
+
+    for group in chunker(recipients, max_recipients):
+        group_set = set(group)
+        _set_header(msg, "To", [addr for addr in message.to if addr in group_set])
+        _set_header(msg, "Cc", [addr for addr in message.cc if addr in group_set])
+        yield group, msg
+
+
+def _set_header(msg, name, addresses):
+    """Replace the value of an address header keeping its position,
+    or remove the header if there are no addresses.
+    """
+    if not addresses:
+        del msg[name]
+    elif name in msg:
+        msg.replace_header(name, ", ".join(addresses))
+    else:
+        msg[name] = ", ".join(addresses)
+
+
+def send_data(connection, from_addr, to_addrs, chunks):
+    """Like `smtplib.SMTP.sendmail()`, but the message is an iterable of
+    bytes chunks, like the ones from `iter_message_bytes()`, that are
+    written to the socket as they come, instead of a single string.
+
+    If the server supports CHUNKING (RFC 3030) the message is sent with
+    BDAT commands, that don't need the dot-stuffing pass over the content.
+
+    Each chunk must start at the beginning of a line.
+    Returns a dictionary with the refused recipients.
+    """
+    connection.ehlo_or_helo_if_needed()
+    options = _mail_options(connection, from_addr, to_addrs)
+    senderrs = _send_envelope(connection, from_addr, to_addrs, options)
+    try:
+        if connection.has_extn("chunking"):
+            _send_bdat(connection, chunks)
+        else:
+            _send_dot_data(connection, chunks)
+    except smtplib.SMTPResponseException:
+        # The server replied, and the transaction was already reset.
+        raise
+    except Exception:
+        # The message was cut in the middle, so the server is still waiting
+        # for the rest of it and the connection can't be used anymore.
+        connection.close()
+        raise
+    return senderrs
+
+
+def _mail_options(connection, from_addr, to_addrs):
+    """The parameters of the MAIL command for this server and addresses."""
+    options = []
+    if connection.has_extn("8bitmime"):
+        # The UTF-8 bodies are not encoded (see `message.py`), so tell
+        # the server they might have 8-bit data.
+        options.append("BODY=8BITMIME")
+    # Only the address is sent, not the name (see `smtplib.quoteaddr()`).
+    addresses = [parseaddr(addr)[1] for addr in [from_addr] + list(to_addrs)]
+    if not all(addr.isascii() for addr in addresses):
+        if not connection.has_extn("smtputf8"):
+            raise smtplib.SMTPNotSupportedError(
+                "SMTPUTF8 not supported by server, but required by the addresses"
+            )
+        options.append("SMTPUTF8")
+        connection.command_encoding = "utf-8"
+    return options
+
+
+def _send_dot_data(connection, chunks):
+    """Send the message with the DATA command."""
+    code, resp = connection.docmd("data")
+    if code != 354:
+        _abort(connection, code)
+        raise smtplib.SMTPDataError(code, resp)
+    # The last chunk is held back so it can be sent together with the
+    # terminating dot in a single write.
+    pending = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if pending:
+            connection.send(pending)
+        # Dot-stuffing, as in `smtplib.SMTP.data()`
+        pending = re.sub(rb"(?m)^\.", b"..", chunk)
+    if not pending.endswith(b"\r\n"):
+        pending += b"\r\n"
+    connection.send(pending + b".\r\n")
+    code, resp = connection.getreply()
+    if code != 250:
+        _abort(connection, code)
+        raise smtplib.SMTPDataError(code, resp)
+
+
+def _send_bdat(connection, chunks):
+    """Send the message with BDAT commands of about `BDAT_CHUNK_SIZE` bytes.
+
+    If the server also supports PIPELINING, the commands are sent without
+    waiting for their replies, that are read at the end.
+    """
+    pipelining = connection.has_extn("pipelining")
+    unread = 0
+    # The last block is held back so it can be marked as the LAST one.
+    pending = b""
+    for block in _join_chunks(chunks, BDAT_CHUNK_SIZE):
+        if pending:
+            connection.send(b"BDAT %d\r\n" % len(pending) + pending)
+            unread += 1
+            if not pipelining:
+                _check_bdat_replies(connection, unread)
+                unread = 0
+        pending = block
+    connection.send(b"BDAT %d LAST\r\n" % len(pending) + pending)
+    _check_bdat_replies(connection, unread + 1)
+
+
+def _check_bdat_replies(connection, count):
+    """Read the replies to `count` BDAT commands and raise an error if
+    any of them failed.
+    """
+    error = None
+    for _ in range(count):
+        code, resp = connection.getreply()
+        if code != 250 and error is None:
+            error = (code, resp)
+        if code == 421:
+            break
+    if error is not None:
+        _abort(connection, error[0])
+        raise smtplib.SMTPDataError(*error)
+
+
+def _join_chunks(chunks, size):
+    """Join the chunks in blocks of at least `size` bytes,
+    except the last one.
+    """
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _send_envelope(connection, from_addr, to_addrs, options=()):
+    """Send the MAIL and RCPT commands and return the refused recipients.
+
+    If the server supports PIPELINING (RFC 2920), all the commands are
+    sent in a single write and then all the replies are read, instead of
+    waiting for the reply of each command before sending the next one.
+    """
+    if connection.has_extn("pipelining"):
+        replies = _pipeline_envelope(connection, from_addr, to_addrs, options)
+    else:
+        replies = _serial_envelope(connection, from_addr, to_addrs, options)
+
+    code, resp = next(replies)
+    if code != 250:
+        # Read the replies to the pipelined RCPT commands before resetting.
+        for _ in replies:
+            pass
+        _abort(connection, code)
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+
+    senderrs = {}
+    for addr, (code, resp) in zip(to_addrs, replies):
+        if code not in (250, 251):
+            senderrs[addr] = (code, resp)
+        if code == 421:
+            connection.close()
+            raise smtplib.SMTPRecipientsRefused(senderrs)
+    if len(senderrs) == len(to_addrs):
+        # the server refused all our recipients
+        _rset(connection)
+        raise smtplib.SMTPRecipientsRefused(senderrs)
+    return senderrs
+
+
+def _serial_envelope(connection, from_addr, to_addrs, options):
+    """Send the envelope commands one by one, yielding each reply."""
+    code, resp = connection.mail(from_addr, options)
+    yield code, resp
+    if code != 250:
+        return
+    for addr in to_addrs:
+        yield connection.rcpt(addr)
+
+
+def _pipeline_envelope(connection, from_addr, to_addrs, options):
+    """Send all the envelope commands at once, yielding each reply."""
+    commands = [
+        "mail FROM:%s%s"
+        % (smtplib.quoteaddr(from_addr), "".join(" " + option for option in options))
+    ]
+    commands.extend("rcpt TO:%s" % smtplib.quoteaddr(addr) for addr in to_addrs)
+    connection.send("".join(command + "\r\n" for command in commands))
+    for _ in commands:
+        code, resp = connection.getreply()
+        yield code, resp
+        if code == 421:
+            # The server is closing the connection, there are no more replies.
+            return
+
+
+def _abort(connection, code):
+    """Reset the transaction or, if the server is closing the connection,
+    close it too.
+    """
+    if code == 421:
+        connection.close()
+    else:
+        _rset(connection)
+
+
+def _rset(connection):
+    try:
+        connection.rset()
+    except smtplib.SMTPServerDisconnected:
+        pass
+
+
+def quit_connection(connection):
+    """Politely close an SMTP connection, falling back to just dropping it."""
+    try:
+        connection.quit()
+    except (ssl.SSLError, smtplib.SMTPServerDisconnected):
+        # This happens when calling quit() on a TLS connection
+        # sometimes, or when the connection was already disconnected
+        # by the server.
+        connection.close()
+
+
+class SMTPConnectionPool:
+
+    """A thread-safe pool of open and authenticated SMTP connections.
+
+    `connect`: A callable that returns a new, ready to use, connection.
+
+    `max_size`: Maximum number of connections, idle or in use, open at
+        the same time. When all of them are in use, `acquire()` waits for one
+        to be released.
+
+    `idle_timeout`: Seconds an idle connection is kept open before being
+        discarded. Use `None` to keep them forever.
+
+    `max_messages`: Number of messages sent through a connection before
+        it is closed and replaced by a fresh one. Use `None` for no limit.
+
+    `check_after`: Idle connections that haven't been used for this many
+        seconds are checked with a NOOP command before being handed out.
+
+    `wait_timeout`: Maximum seconds `acquire()` waits for a free connection
+        before raising a `TimeoutError`. `None` means wait forever.
+
+    """
+
+    def __init__(
+        self,
+        connect,
+        max_size=10,
+        idle_timeout=60,
+        max_messages=100,
+        check_after=1,
+        wait_timeout=None,
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+
+        self._cond = threading.Condition()
+        # Idle connections as (connection, last_used) pairs, most recently
+        # used at the right.
+        self._idle = collections.deque()
+        # Number of messages sent by every open connection.
+        self._sent = {}
+        self._size = 0
+        self._closed = False
+
+    @property
+    def size(self):
+        """Number of open connections, idle or in use."""
+        return self._size
+
+    def acquire(self):
+        """Borrow a connection from the pool, opening a new one if there are
+        no idle connections available.
+        """
+        deadline = None
+        if self.wait_timeout is not None:
+            deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            connection, check = self._reserve(deadline)
+            if connection is None:
+                break
+            # Checked outside the lock, so the other threads don't have to
+            # wait for the reply.
+            if not check or _is_alive(connection):
+                return connection
+            self._drop(connection)
+
+        # Connect outside the lock, so other threads don't have to wait for
+        # the handshake to finish.
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._sent[connection] = 0
+        return connection
+
+    def release(self, connection, messages=0):
+        """Return a borrowed connection to the pool.
+        `messages` is the number of messages sent with it while borrowed.
+        """
+        with self._cond:
+            sent = self._sent.get(connection, 0) + messages
+            self._sent[connection] = sent
+            recycle = self._closed or (
+                self.max_messages is not None and sent >= self.max_messages
+            )
+            if not recycle:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+                return
+        self.discard(connection)
+
+    def discard(self, connection):
+        """Close a borrowed connection instead of returning it to the pool.
+        Use it for connections that are broken.
+        """
+        with self._cond:
+            self._sent.pop(connection, None)
+            self._size -= 1
+            self._cond.notify()
+        try:
+            quit_connection(connection)
+        except Exception:
+            pass
+
+    def close(self):
+        """Close all the idle connections. Connections in use are closed
+        when released.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+        for connection in idle:
+            with self._cond:
+                self._sent.pop(connection, None)
+                self._size -= 1
+            try:
+                quit_connection(connection)
+            except Exception:
+                pass
+
+    def _reserve(self, deadline):
+        """Wait until there is an idle connection, and return it with
+        whether it has to be checked before using it, or room for a new one,
+        and return `(None, False)`.
+        """
+        expired = []
+        try:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("The connection pool is closed")
+                    now = time.monotonic()
+                    while self._idle:
+                        connection, last_used = self._idle.pop()
+                        idle_for = now - last_used
+                        if self.idle_timeout is None or idle_for <= self.idle_timeout:
+                            return connection, idle_for >= self.check_after
+                        self._forget(connection)
+                        expired.append(connection)
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None, False
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise TimeoutError(
+                                "Timed out waiting for an SMTP connection"
+                            )
+                    self._cond.wait(remaining)
+        finally:
+            for connection in expired:
+                _close(connection)
+
+    def _forget(self, connection):
+        """Must be called with the lock held."""
+        self._sent.pop(connection, None)
+        self._size -= 1
+        self._cond.notify()
+
+    def _drop(self, connection):
+        with self._cond:
+            self._forget(connection)
+        _close(connection)
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def _is_alive(connection):
+    try:
+        return connection.noop()[0] == 250
+    except Exception:
+        return False
+
+
 class SMTPMailer(BaseMailer):
 
     """A wrapper that manages the SMTP network connection.
@@ -21,6 +487,32 @@ class SMTPMailer(BaseMailer):
         Mailshake send several messages instead of one, in order to stay inside
         that limit.
 
+    `pool_size`: If set, keep up to this many connections open in a pool
+        shared by all the threads using this mailer, instead of connecting
+        and disconnecting every time. See `SMTPConnectionPool`. `close()`
+        returns the connection to the pool, so call `shutdown()` when the
+        mailer is no longer needed to close the pooled connections.
+
+    `pool_idle_timeout`: Seconds an unused pooled connection is kept open.
+
+    `pool_max_messages`: Number of messages sent through a pooled connection
+        before replacing it with a new one.
+
+    `pool_timeout`: Maximum seconds to wait for a free pooled connection.
+
+    `workers`: If bigger than one, `send_messages()` spreads the messages
+        among this many SMTP sessions running in parallel threads.
+        See `send_parallel()`.
+
+    `retry`: A `RetryPolicy` for the failed sends. The transient errors,
+        and the recipients temporarily refused, are retried with an
+        exponential backoff. By default, a message is only retried once,
+        after reconnecting, if the server disconnected.
+
+    `send_messages()` returns a `SendReport`: the number of messages sent
+    that also has the `SendResult` of each message, with the recipients
+    accepted and refused.
+
     """
 
     def __init__(
@@ -33,6 +525,12 @@ class SMTPMailer(BaseMailer):
         use_ssl=None,
         timeout=None,
         max_recipients=200,
+        pool_size=None,
+        pool_idle_timeout=60,
+        pool_max_messages=100,
+        pool_timeout=None,
+        workers=None,
+        retry=None,
         *args,
         **kwargs
     ):
@@ -46,10 +544,32 @@ class SMTPMailer(BaseMailer):
         if self.use_ssl and self.use_tls:
             raise ValueError("EMAIL_USE_TLS/EMAIL_USE_SSL are mutually exclusive")
 
-        self.connection = None
+        # The connection is per thread, so a mailer can be safely
+        # shared by several threads.
+        self._local = threading.local()
         self.max_recipients = max_recipients
+        self.workers = workers
+        self.retry = retry or RECONNECT_ONCE
+        self.pool = None
+        if pool_size:
+            self.pool = SMTPConnectionPool(
+                self.connect,
+                max_size=pool_size,
+                idle_timeout=pool_idle_timeout,
+                max_messages=pool_max_messages,
+                wait_timeout=pool_timeout,
+            )
         super(SMTPMailer, self).__init__(*args, **kwargs)
 
+    @property
+    def connection(self):
+        return getattr(self._local, "connection", None)
+
+    @connection.setter
+    def connection(self, value):
+        self._local.connection = value
+        self._local.messages = 0
+
     def open(self, hostname=None):
         """Ensures we have a connection to the email server. Returns whether or
         not a new connection was required (True or False).
@@ -58,96 +578,306 @@ class SMTPMailer(BaseMailer):
             # Nothing to do if the connection is already open.
             return False
 
+        try:
+            if self.pool is not None:
+                self.connection = self.pool.acquire()
+            else:
+                self.connection = self.connect()
+        except Exception:
+            if not self.fail_silently:
+                raise
+
+        return True
+
+    def connect(self):
+        """Open and return a new, authenticated connection to the email server.
+        Unlike `open()`, the connection is not stored in the mailer.
+        """
+        with self._phase("connect"):
+            return self._connect()
+
+    def _connect(self):
         # If local_hostname is not specified, socket.getfqdn() gets used.
         # For performance, we use the cached FQDN for local_hostname.
         connection_params = {"local_hostname": DNS_NAME.get_fqdn()}
         if self.timeout is not None:
             connection_params["timeout"] = self.timeout
 
+        connection = smtplib.SMTP(self.host, self.port, **connection_params)
         try:
-            self.connection = smtplib.SMTP(self.host, self.port, **connection_params)
-
             if self.use_ssl:
                 context = ssl.SSLContext(ssl.PROTOCOL_SSLv3)
-                self.connection.ehlo()
-                self.connection.starttls(context)
-                self.connection.ehlo()
+                connection.ehlo()
+                connection.starttls(context)
+                connection.ehlo()
             elif self.use_tls:
-                self.connection.ehlo()
-                self.connection.starttls()
-                self.connection.ehlo()
+                connection.ehlo()
+                connection.starttls()
+                connection.ehlo()
 
             if self.username and self.password:
-                self.connection.login(self.username, self.password)
-
+                connection.login(self.username, self.password)
         except Exception:
-            if not self.fail_silently:
-                raise
+            connection.close()
+            raise
 
-        return True
+        return connection
 
     def close(self):
         """Closes the connection to the email server."""
         if self.connection is None:
             return
+        if self.pool is not None:
+            if not _is_usable(self.connection):
+                self._drop_connection()
+                return
+            # Return the connection to the pool instead of closing it.
+            self.pool.release(self.connection, self._local.messages)
+            self.connection = None
+            return
         try:
             try:
-                self.connection.quit()
-            except (ssl.SSLError, smtplib.SMTPServerDisconnected):
-                # This happens when calling quit() on a TLS connection
-                # sometimes, or when the connection was already disconnected
-                # by the server.
-                self.connection.close()
+                quit_connection(self.connection)
             except Exception:
                 if not self.fail_silently:
                     raise
         finally:
             self.connection = None
 
+    def shutdown(self):
+        """Close the connection and, if there is a pool, all of its
+        connections. Pooled connections still in use by other threads are
+        closed when released.
+        """
+        self.close()
+        if self.pool is not None:
+            self.pool.close()
+
+    def _drop_connection(self):
+        """Forget a broken connection."""
+        if self.pool is not None:
+            self.pool.discard(self.connection)
+        self.connection = None
+
     def send_messages(self, *email_messages):
         """Sends one or more EmailMessage objects and returns the number of
-        messages sent.
+        messages sent, as a `SendReport`.
         """
         if not email_messages:
-            return
+            return SendReport()
+        if self.workers and self.workers > 1 and len(email_messages) > 1:
+            return self._report(self._send_parallel(email_messages, self.workers))
+        start = time.perf_counter()
         new_conn_created = self.open()
+        timings = {"connect": time.perf_counter() - start}
         if not self.connection:
             # We failed silently on open(), trying to send would be pointless.
+            return self._report(SendResult(message) for message in email_messages)
+        try:
+            results = [self._send(message) for message in email_messages]
+        finally:
+            # Even after an error, or a pooled connection would never
+            # be released. `close()` discards it if it's broken.
+            if new_conn_created:
+                self.close()
+        return self._report(results, timings)
+
+    def send_parallel(self, *email_messages, workers=None):
+        """Sends the messages using several SMTP sessions in parallel threads,
+        and returns a list with the result (True or False) of each message,
+        in the same order.
+
+        Each session sends one message at a time, taking the next pending
+        one when it's done, so slow messages don't hold the others.
+        If the mailer has a pool, the sessions borrow their connections
+        from it.
+        """
+        results = self._send_parallel(email_messages, workers or self.workers)
+        return [result.sent for result in results]
+
+    def _send_parallel(self, email_messages, workers):
+        results = [SendResult(message) for message in email_messages]
+        workers = min(workers or 1, len(email_messages))
+        if self.pool is not None:
+            # More sessions would only wait for a free connection.
+            workers = min(workers, self.pool.max_size)
+        if not workers:
+            return results
+        pending = enumerate(email_messages)
+        lock = threading.Lock()
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._send_session, pending, lock, results, errors)
+                for _ in range(workers)
+            ]
+        for future in futures:
+            future.result()
+        # The messages left if no session could connect
+        unsent = list(pending)
+        if unsent and errors:
+            if not self.fail_silently:
+                raise errors[0]
+            for index, _ in unsent:
+                results[index].error = errors[0]
+        return results
+
+    def _send_session(self, pending, lock, results, errors):
+        """One of the sessions of `send_parallel()`: send the pending
+        messages, one by one, until there are no more.
+        """
+        try:
+            self.open()
+        except Exception as exc:
+            errors.append(exc)
+        if not self.connection:
+            # We couldn't connect, leave the messages to the other sessions.
             return
-        num_sent = 0
-        for message in email_messages:
-            sent = self._send(message)
-            if sent:
-                num_sent += 1
-        if new_conn_created:
+        try:
+            while True:
+                with lock:
+                    index, message = next(pending, (None, None))
+                if message is None:
+                    break
+                results[index] = self._send(message)
+        finally:
             self.close()
-        return num_sent
 
     def _send(self, message):
-        """A helper method that does the actual sending."""
+        """A helper method that does the actual sending.
+        Returns a `SendResult`.
+        """
+        result = SendResult(message)
         recipients = message.get_recipients()
         if not recipients:
-            return False
+            return result
         from_email = message.from_email or self.default_from
-        to_set = set(message.to)
-        cc_set = set(message.cc)
-        bcc_set = set(message.bcc)
         try:
+            start = time.perf_counter()
             # Your SMTP provider has limits!
-            for group in chunker(recipients, self.max_recipients):
-                group_set = set(group)
-                message.to = list(to_set.intersection(group_set))
-                message.cc = list(cc_set.intersection(group_set))
-                message.bcc = list(bcc_set.intersection(group_set))
-                rendered_msg = message.render().as_bytes(policy=email.policy.SMTP)
-                try:
-                    self.connection.sendmail(from_email, group, rendered_msg)
-                except smtplib.SMTPServerDisconnected:
-                    self.connection = None
-                    self.open()
-                    self.connection.sendmail(from_email, group, rendered_msg)
-        except Exception:
+            for group, msg in render_chunks(message, self.max_recipients):
+                result.add_time("render", time.perf_counter() - start)
+                result.message_id = msg["Message-ID"]
+                self._send_group(from_email, group, msg, result)
+                self._local.messages += 1
+                start = time.perf_counter()
+            result.sent = True
+        except Exception as exc:
+            result.error = exc
+            if self.connection is not None and not _is_usable(self.connection):
+                self._drop_connection()
             if not self.fail_silently:
                 raise
-            return False
-        return True
+        return result
+
+    def _send_group(self, from_email, recipients, msg, result):
+        """Send the message to a group of recipients, retrying the transient
+        errors according to the `retry` policy. When only some recipients
+        are refused, only those are retried.
+
+        The recipients being retried keep their last reply in
+        `result.refused` until they are accepted. If the message was already
+        delivered to some recipients, an error while retrying the others
+        doesn't raise, it's recorded in `result.error` and against them.
+        """
+        pending = recipients
+        delivered = False
+        attempt = 1
+        while True:
+            result.attempts = max(result.attempts, attempt)
+            try:
+                with result.timer("transfer"), self._phase("transfer"):
+                    refused = self._try_send_data(from_email, pending, msg, result)
+            except Exception as exc:
+                if attempt < self.retry.max_attempts and self.retry.is_transient(exc):
+                    with result.timer("connect"):
+                        self._reconnect_after(exc)
+                elif delivered:
+                    _refuse(result, pending, exc)
+                    break
+                else:
+                    raise
+            else:
+                accepted = [addr for addr in pending if addr not in refused]
+                delivered = delivered or bool(accepted)
+                result.accepted.extend(accepted)
+                for addr in accepted:
+                    result.refused.pop(addr, None)
+                result.refused.update(refused)
+                pending = [addr for addr in refused if self._can_retry(refused[addr])]
+                if not pending or attempt >= self.retry.max_attempts:
+                    break
+            self.retry.wait(attempt)
+            attempt += 1
+
+        if all(addr in result.refused for addr in recipients):
+            # the server refused all our recipients
+            raise smtplib.SMTPRecipientsRefused(
+                {addr: result.refused[addr] for addr in recipients}
+            )
+
+    def _try_send_data(self, from_email, recipients, msg, result):
+        """Like `_send_data()` but returns the refused recipients instead of
+        raising an error if all of them were.
+        """
+        try:
+            return self._send_data(from_email, recipients, msg, result)
+        except smtplib.SMTPRecipientsRefused as exc:
+            if len(exc.recipients) < len(recipients):
+                # The connection was closed in the middle of the RCPT commands
+                raise smtplib.SMTPServerDisconnected(str(exc.recipients))
+            return exc.recipients
+
+    def _can_retry(self, reply):
+        code, resp = reply
+        return self.retry.is_transient(smtplib.SMTPResponseException(code, resp))
+
+    def _reconnect_after(self, exc):
+        """Replace the connection if the error left it unusable."""
+        connection = self.connection
+        if (
+            isinstance(exc, smtplib.SMTPResponseException)
+            and getattr(connection, "sock", None) is not None
+        ):
+            # The server replied and the transaction was reset, so the
+            # connection can still be used.
+            return
+        if connection is not None:
+            self._drop_connection()
+        self.open()
+
+    def _send_data(self, from_email, recipients, msg, result):
+        # The message is streamed, so the content of lazy file attachments
+        # is never fully loaded in memory.
+        chunks = _count_bytes(iter_message_bytes(msg, policy=email.policy.SMTP), result)
+        if self.connection is None:
+            # The last one was broken by a previous message.
+            self.open()
+            if self.connection is None:
+                raise smtplib.SMTPServerDisconnected("Could not reconnect")
+        return send_data(self.connection, from_email, recipients, chunks)
+
+
+def _refuse(result, recipients, exc):
+    """Record an error that happened while retrying some recipients.
+    They keep their previous reply, unless the error has a newer one.
+    """
+    result.error = exc
+    for addr in recipients:
+        if isinstance(exc, smtplib.SMTPRecipientsRefused) and addr in exc.recipients:
+            result.refused[addr] = exc.recipients[addr]
+        elif isinstance(exc, smtplib.SMTPResponseException):
+            result.refused[addr] = (exc.smtp_code, exc.smtp_error)
+
+
+def _is_usable(connection):
+    """Whether a connection is still open, eg: it wasn't closed after
+    an error in the middle of a message.
+    """
+    return getattr(connection, "sock", None) is not None
+
+
+def _count_bytes(chunks, result):
+    for chunk in chunks:
+        result.bytes_sent += len(chunk)
+        yield chunk
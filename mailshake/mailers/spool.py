@@ -0,0 +1,330 @@
+"""
+Mailer that saves the messages in a directory, to be delivered later
+by another mailer.
+"""
+from concurrent.futures import Future
+import email.policy
+from email import message_from_bytes
+import json
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+
+from .base import BaseMailer
+from ..message import EmailMessage
+from ..results import SendResult
+from ..retry import RetryPolicy
+
+
+FSYNC_ALWAYS = "always"
+FSYNC_BATCH = "batch"
+FSYNC_NEVER = "never"
+
+
+class SpoolMailer(BaseMailer):
+    """A durable queue of messages on disk.
+
+    `send_messages()` only saves the messages in the `path` directory, so
+    they survive if the process dies. `deliver()`, or a daemon calling
+    `run()`, reads them later and sends them through another mailer, deleting
+    each one only after it was sent.
+
+    The directory has a Maildir-like layout: the messages are written in
+    `tmp/` and atomically moved to `new/` when complete. A delivery process
+    claims a message by moving it to `cur/`, so several of them can share a
+    spool. The messages that can't be delivered end up in `failed/`.
+    Each file is a JSON line with the envelope (sender and recipients,
+    including the Bcc ones) followed by the message as `as_bytes()`.
+
+    `fsync`: The trade-off between throughput and durability.
+        "always": every message is flushed to the disk before returning.
+        "batch" (the default): every message is flushed to the disk but the
+            directory only once for each call to `send_messages()`.
+        "never": leave it to the operating system. Fastest, but the
+            messages of the last seconds can be lost if the machine (not
+            just the process) crashes.
+
+    `max_attempts`: Number of failed deliveries after which a message is
+        moved to the `failed/` directory instead of being retried again.
+        `None` to retry forever. Failing to connect to the server doesn't
+        count as an attempt.
+
+    `retry_delay`: Seconds to wait before retrying a message that failed.
+        The wait is doubled after every attempt, up to `max_retry_delay`.
+        The attempts and the time of the next one are kept in the file name.
+
+    """
+
+    def __init__(
+        self,
+        path,
+        fsync=FSYNC_BATCH,
+        max_attempts=10,
+        retry_delay=60,
+        max_retry_delay=3600,
+        *args,
+        **kwargs
+    ):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER):
+            raise ValueError("Invalid fsync value: %r" % (fsync,))
+        self.path = os.path.abspath(path)
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.backoff = RetryPolicy(
+            base_delay=retry_delay, max_delay=max_retry_delay, jitter=0.1
+        )
+        self.tmp_path = os.path.join(self.path, "tmp")
+        self.new_path = os.path.join(self.path, "new")
+        self.cur_path = os.path.join(self.path, "cur")
+        self.failed_path = os.path.join(self.path, "failed")
+        for path in (self.tmp_path, self.new_path, self.cur_path, self.failed_path):
+            os.makedirs(path, exist_ok=True)
+        super(SpoolMailer, self).__init__(*args, **kwargs)
+
+    def send_messages(self, *email_messages):
+        """Save the messages in the spool and returns the number of
+        messages saved, as a `SendReport`.
+        """
+        results = [SendResult(message) for message in email_messages]
+        try:
+            names = [self._write(message) for message in email_messages]
+            for name, result in zip(names, results):
+                os.rename(
+                    os.path.join(self.tmp_path, name), os.path.join(self.new_path, name)
+                )
+                if self.fsync == FSYNC_ALWAYS:
+                    _fsync_dir(self.new_path)
+                result.sent = True
+                result.accepted = result.message.get_recipients()
+            if self.fsync == FSYNC_BATCH:
+                _fsync_dir(self.new_path)
+        except Exception as exc:
+            if not self.fail_silently:
+                raise
+            for result in results:
+                if not result.sent:
+                    result.error = exc
+        return self._report(results)
+
+    def pending(self):
+        """Number of messages waiting to be delivered."""
+        return len(os.listdir(self.new_path))
+
+    def deliver(self, mailer, limit=None):
+        """Send the messages in the spool, oldest first, using `mailer`.
+
+        The messages that are sent are deleted and the ones that fail are
+        left in the spool, to be retried after a while, or moved to `failed/`
+        after `max_attempts`. The messages waiting for a retry are skipped.
+        If the server can't be reached, the delivery stops there, leaving
+        the messages as they were. If `mailer` returns a `Future` (like
+        `QueuedMailer`) this waits for it. Returns the number of messages sent.
+        """
+        logger = logging.getLogger("mailshake:SpoolMailer")
+        now = time.time()
+        names = os.listdir(self.new_path)
+        due = [name for name in names if _parse_name(name)[2] <= now]
+        num_tried = 0
+        num_sent = 0
+        conn_created = False
+        try:
+            for name in sorted(due):
+                if limit is not None and num_tried >= limit:
+                    break
+                if not conn_created:
+                    try:
+                        conn_created = mailer.open()
+                    except Exception as exc:
+                        logger.warning("Failed to connect: %r", exc)
+                        break
+                path = self._claim(name)
+                if path is None:
+                    continue
+                num_tried += 1
+                sent, error = _send_spooled(mailer, path)
+                if sent:
+                    os.remove(path)
+                    num_sent += 1
+                    continue
+                logger.warning("Failed to deliver %s: %r", name, error)
+                if _is_connection_error(error):
+                    os.rename(path, os.path.join(self.new_path, name))
+                    break
+                self._retry_later(path, name, logger)
+        finally:
+            if conn_created:
+                mailer.close()
+        return num_sent
+
+    def recover(self, older_than=300):
+        """Return to the queue the messages that has been claimed for
+        delivery for more than `older_than` seconds, and delete the
+        unfinished ones, left there by processes that died.
+        """
+        limit = time.time() - older_than
+        for name in os.listdir(self.cur_path):
+            path = os.path.join(self.cur_path, name)
+            if _mtime(path) < limit:
+                os.rename(path, os.path.join(self.new_path, name))
+        for name in os.listdir(self.tmp_path):
+            path = os.path.join(self.tmp_path, name)
+            if _mtime(path) < limit:
+                os.remove(path)
+
+    def run(self, mailer, interval=5, stop=None):
+        """Deliver the messages in the spool, checking for new ones every
+        `interval` seconds, until the `stop` event (a `threading.Event`) is
+        set. Meant to be run by a daemon process or thread.
+        """
+        stop = stop or threading.Event()
+        self.recover()
+        while not stop.is_set():
+            try:
+                sent = self.deliver(mailer)
+            except Exception:
+                logging.getLogger("mailshake:SpoolMailer").exception(
+                    "Error delivering the spool"
+                )
+                sent = 0
+            if not sent:
+                stop.wait(interval)
+
+    def _write(self, message):
+        name = "{:.6f}.{}.{}".format(time.time(), os.getpid(), uuid.uuid4().hex)
+        envelope = {
+            "from": message.from_email or self.default_from,
+            "to": message.to,
+            "cc": message.cc,
+            "bcc": message.bcc,
+        }
+        path = os.path.join(self.tmp_path, name)
+        with open(path, "wb") as f:
+            f.write(json.dumps(envelope).encode("utf-8") + b"\n")
+            for chunk in message.iter_bytes():
+                f.write(chunk)
+            if self.fsync != FSYNC_NEVER:
+                f.flush()
+                os.fsync(f.fileno())
+        return name
+
+    def _retry_later(self, path, name, logger):
+        """Return a message that failed to the queue, or move it to `failed/`
+        if it has run out of attempts.
+        """
+        base, attempts, _ = _parse_name(name)
+        attempts += 1
+        if self.max_attempts is not None and attempts >= self.max_attempts:
+            logger.error("Giving up on %s after %d attempts", base, attempts)
+            new_name = "{},{}".format(base, attempts)
+            os.rename(path, os.path.join(self.failed_path, new_name))
+        else:
+            due = time.time() + self.backoff.delay(attempts)
+            new_name = "{},{},{:d}".format(base, attempts, int(due))
+            os.rename(path, os.path.join(self.new_path, new_name))
+
+    def _claim(self, name):
+        """Move a message to `cur/`, so no other process tries to deliver it.
+        Returns its new path or `None` if another process did it first.
+        """
+        path = os.path.join(self.cur_path, name)
+        try:
+            os.rename(os.path.join(self.new_path, name), path)
+        except FileNotFoundError:
+            return None
+        # Used by `recover()`
+        os.utime(path)
+        return path
+
+
+class SpooledMessage(EmailMessage):
+    """A message read from a `SpoolMailer` directory.
+    It renders exactly the message that was saved.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            envelope = json.loads(f.readline().decode("utf-8"))
+            self._data = f.read()
+        msg = self._parse()
+        body = msg.get_body(("plain",))
+        html = msg.get_body(("html",))
+        super(SpooledMessage, self).__init__(
+            subject=msg.get("Subject", ""),
+            text=body.get_content() if body else "",
+            html=html.get_content() if html else None,
+            from_email=envelope["from"],
+            to=envelope["to"],
+            cc=envelope["cc"],
+            bcc=envelope["bcc"],
+        )
+
+    def render(self):
+        return self._parse()
+
+    def _parse(self):
+        return message_from_bytes(self._data, policy=email.policy.default)
+
+
+def _parse_name(name):
+    """Split the name of a spooled file in its base name, the number of
+    failed attempts and the time of the next one.
+    """
+    base, _, rest = name.partition(",")
+    attempts, _, due = rest.partition(",")
+    return base, int(attempts or 0), int(due or 0)
+
+
+def _send_spooled(mailer, path):
+    """Send a spooled message. Returns whether it was sent and the error."""
+    try:
+        sent = mailer.send_messages(SpooledMessage(path))
+        if isinstance(sent, Future):
+            sent = sent.result()
+    except Exception as exc:
+        return False, exc
+    # A `SendReport` is the number of messages sent
+    if isinstance(sent, int) and sent > 0:
+        return True, None
+    results = getattr(sent, "results", None)
+    return False, results[0].error if results else None
+
+
+def _is_connection_error(exc):
+    """Whether the server couldn't be reached, so the message itself is
+    not to blame.
+    """
+    return isinstance(
+        exc,
+        (
+            ConnectionError,
+            socket.timeout,
+            socket.gaierror,
+            smtplib.SMTPConnectError,
+            smtplib.SMTPServerDisconnected,
+        ),
+    )
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        # Already moved by another process
+        return time.time()
+
+
+def _fsync_dir(path):
+    """Make the renames in a directory durable."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Not supported on some platforms, like Windows.
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,128 @@
+"""
+Mailer that limits how fast another mailer sends the messages.
+"""
+import threading
+import time
+
+from .base import BaseMailer
+from ..results import SendReport, get_results
+
+
+class TokenBucket:
+    """A thread-safe token bucket.
+
+    `rate`: Tokens added per second.
+
+    `capacity`: Maximum number of tokens that can be saved while the bucket
+        is not used, to be spent later in a burst. By default, one second
+        worth of tokens (but at least one).
+
+    The bucket starts full. Asking for more tokens than available puts the
+    bucket "in debt", so even requests bigger than its capacity (eg: a
+    message with more recipients than the limit per second) are allowed,
+    just delayed accordingly.
+    A bucket can be shared by several mailers to enforce a common limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("The rate must be a positive number")
+        self.rate = rate
+        self.capacity = max(1, capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take the tokens and return how many seconds the caller must wait
+        before using them. Useful for async code.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Take the tokens, waiting until they are available."""
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ThrottledMailer(BaseMailer):
+    """Wraps another mailer so it sends the messages no faster than the
+    limits of the email provider, instead of failing because of them.
+
+    The messages are sent one by one, each one waiting, if needed, until
+    the limits allow it, so a bulk send goes at the highest allowed speed.
+    The limits are shared by all the threads using the mailer.
+
+    `mailer`: The mailer used to send the messages, eg: a `SMTPMailer`.
+
+    `messages_per_second`: Maximum number of messages sent per second.
+
+    `recipients_per_second`: Maximum number of recipients (including
+        Cc and Bcc) per second.
+
+    `burst`: Seconds of unused sending capacity that can be spent at once,
+        after a pause. By default, one.
+
+    Instead of numbers, `messages_per_second` and `recipients_per_second`
+    can also be `TokenBucket` instances, to share the limits between
+    mailers or to use other periods, eg: for a quota of 10.000 recipients
+    per hour, `TokenBucket(10000 / 3600, capacity=10000)`.
+    """
+
+    def __init__(
+        self,
+        mailer,
+        messages_per_second=None,
+        recipients_per_second=None,
+        burst=1,
+        *args,
+        **kwargs
+    ):
+        self.mailer = mailer
+        self.messages = _make_bucket(messages_per_second, burst)
+        self.recipients = _make_bucket(recipients_per_second, burst)
+        super(ThrottledMailer, self).__init__(*args, **kwargs)
+
+    def open(self):
+        return self.mailer.open()
+
+    def close(self):
+        return self.mailer.close()
+
+    def send_messages(self, *email_messages):
+        """Sends one or more EmailMessage objects, at the allowed rate,
+        and returns the number of messages sent.
+        """
+        if not email_messages:
+            return SendReport()
+        new_conn_created = self.mailer.open()
+        results = []
+        try:
+            for message in email_messages:
+                if self.messages is not None:
+                    self.messages.acquire(1)
+                if self.recipients is not None:
+                    self.recipients.acquire(len(message.get_recipients()))
+                sent = self.mailer.send_messages(message)
+                results.extend(get_results(sent, [message]))
+        finally:
+            if new_conn_created:
+                self.mailer.close()
+        return SendReport(results)
+
+
+def _make_bucket(rate, burst):
+    if rate is None or isinstance(rate, TokenBucket):
+        return rate
+    return TokenBucket(rate, capacity=rate * burst)
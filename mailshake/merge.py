@@ -0,0 +1,116 @@
+"""
+Personalized bulk emails from a single template message.
+"""
+from concurrent.futures import Future
+import copy
+from string import Template
+
+from .message import encode_addresses
+
+
+class MailMerge:
+    """Generate personalized copies of a template `EmailMessage`.
+
+    The subject, text and html of the template can have `$name` or `${name}`
+    placeholders, replaced by the values of each recipient (use `$$` for
+    a literal `$`). Placeholders without a value are left as they are.
+
+    Everything else (sender, headers, attachments) is shared. The attachments
+    are encoded only once for all the messages and, if the text or the html
+    has no placeholders, so is their MIME part.
+
+    Usage:
+
+        merge = MailMerge(EmailMessage(
+            "Hi $name", "Hello $name, your code is $code", "from@example.com",
+        ))
+        merge.send(mailer, [
+            {"to": "mary@example.com", "name": "Mary", "code": "1234"},
+            {"to": "bob@example.com", "name": "Bob", "code": "5678"},
+        ])
+
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self._subject = _compile(template.subject)
+        self._text = _compile(template.text)
+        self._html = _compile(template.html)
+        # Encode the shared parts now, so the copies can reuse them.
+        template._create_message()
+
+    def messages(self, recipients):
+        """Yields a personalized message for each item of `recipients`.
+
+        Each item is a dictionary with the values for the placeholders,
+        plus the "to" and, optionally, the "cc", "bcc" and "reply_to"
+        addresses of the message.
+        """
+        for values in recipients:
+            yield self.personalize(values)
+
+    def personalize(self, values):
+        """Returns a copy of the template personalized with `values`.
+        See `messages()`.
+        """
+        template = self.template
+        msg = copy.copy(template)
+        msg.to = encode_addresses(values.get("to"), template.encoding)
+        msg.cc = encode_addresses(values.get("cc"), template.encoding)
+        msg.bcc = encode_addresses(values.get("bcc"), template.encoding)
+        if "reply_to" in values:
+            msg.reply_to = encode_addresses(values["reply_to"], template.encoding)
+
+        msg.subject = _render(self._subject, template.subject, values)
+        msg.text = _render(self._text, template.text, values)
+        msg.html = _render(self._html, template.html, values)
+
+        msg.attachments = list(template.attachments)
+        msg.extra_headers = dict(template.extra_headers)
+        msg._body_parts = dict(template._body_parts)
+        return msg
+
+    def send(self, mailer, recipients, batch_size=100):
+        """Personalize the template for each item of `recipients` and send
+        the messages with `mailer`, in batches of `batch_size`, so they are
+        never all in memory. If `mailer` returns a `Future` (like
+        `QueuedMailer`), this waits for each batch to be sent.
+
+        Returns the number of messages sent.
+        """
+        num_sent = 0
+        batch = []
+        for msg in self.messages(recipients):
+            batch.append(msg)
+            if len(batch) >= batch_size:
+                num_sent += _send_batch(mailer, batch)
+                batch = []
+        if batch:
+            num_sent += _send_batch(mailer, batch)
+        return num_sent
+
+
+def _send_batch(mailer, batch):
+    sent = mailer.send_messages(*batch)
+    if isinstance(sent, Future):
+        sent = sent.result()
+    return sent or 0
+
+
+def _compile(value):
+    """Returns a `Template` of the value or `None` if it has no placeholders,
+    so it can be reused as is.
+    """
+    if not value:
+        return None
+    template = Template(value)
+    for match in template.pattern.finditer(value):
+        if match.group("named") or match.group("braced") or match.group("escaped"):
+            return template
+    return None
+
+
+def _render(template, value, values):
+    if template is None:
+        return value
+    return template.safe_substitute(values)
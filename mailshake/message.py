@@ -1,5 +1,7 @@
+import base64
 import email
 from email import message_from_string
+from email.generator import BytesGenerator
 from email.message import Message
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -7,16 +9,18 @@ from email.mime.base import MIMEBase
 from email.mime.message import MIMEMessage
 import email.policy
 from email.utils import formatdate, getaddresses
+import functools
+import io
 import mimetypes
 import os
+import re
+import threading
+import uuid
 
-import html2text
-
+from .instrumentation import NO_INSTRUMENTATION
 from .utils import encode_address, forbid_multi_line_headers, make_msgid, to_str
 
 
-textify = html2text.HTML2Text()
-
 # Header names that contain structured address data (RFC #5322)
 ADDRESS_HEADERS = set(
     [
@@ -43,6 +47,13 @@ email.charset.add_charset("utf-8", email.charset.SHORTEST, None, "utf-8")
 # and cannot be guessed).
 DEFAULT_ATTACHMENT_MIME_TYPE = "application/octet-stream"
 
+# Number of different html bodies whose plain text version is remembered.
+HTML_TO_TEXT_CACHE_SIZE = 256
+
+# Size of the blocks read from the files of `FileAttachment`s. It must be
+# a multiple of 57, the number of bytes encoded in each line of base64.
+FILE_BLOCK_SIZE = 57 * 1024
+
 
 class SafeMIMEMixin:
     encoding = "ascii"
@@ -84,6 +95,157 @@ class SafeMIMEMultipart(SafeMIMEMixin, MIMEMultipart):
         super().__init__(_subtype, boundary, _subparts, **_params)
 
 
+class FileAttachment(MIMEBase):
+    """A MIME attachment whose content is read from a file only when
+    the message is written.
+
+    With `iter_message_bytes()` the file is read and base64-encoded
+    in blocks, while the message is being written, so its content is never
+    fully loaded in memory.
+    Everywhere else it works like a regular base64-encoded attachment.
+    """
+
+    def __init__(self, path, mimetype=None, filename=None):
+        filename = filename or os.path.basename(path)
+        mimetype = mimetype or guess_mimetype(filename)
+        basetype, subtype = mimetype.split("/", 1)
+        super().__init__(basetype, subtype)
+        self.path = path
+        self["Content-Transfer-Encoding"] = "base64"
+        if filename:
+            self.add_header(
+                "Content-Disposition",
+                "attachment",
+                filename=_encode_filename(filename),
+            )
+        # Written instead of the content by `iter_message_bytes()`,
+        # that later replace it with the encoded file.
+        self.placeholder = "mailshake-file-%s" % uuid.uuid4().hex
+        self._payload = self.placeholder
+
+    def get_payload(self, i=None, decode=False):
+        if decode:
+            with open(self.path, "rb") as f:
+                return f.read()
+        return b"".join(self.iter_encoded()).decode("ascii")
+
+    def check(self):
+        """Raise an `OSError` if the file can't be read."""
+        with open(self.path, "rb"):
+            pass
+
+    def iter_encoded(self, linesep=b"\n"):
+        """Read the file in blocks and yields them base64-encoded, in lines
+        separated by `linesep`.
+        """
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(FILE_BLOCK_SIZE)
+                if not block:
+                    break
+                data = base64.encodebytes(block)
+                if linesep != b"\n":
+                    data = data.replace(b"\n", linesep)
+                yield data
+
+
+class _SkeletonGenerator(BytesGenerator):
+    """A `BytesGenerator` that writes the placeholders of the
+    `FileAttachment`s instead of their content.
+    """
+
+    def _dispatch(self, msg):
+        if isinstance(msg, FileAttachment):
+            self.write(msg.placeholder + self._NL)
+        else:
+            super()._dispatch(msg)
+
+
+def iter_message_bytes(msg, policy=email.policy.default):
+    """Serialize a rendered message as an iterator of bytes chunks.
+
+    The output is the same as `msg.as_bytes(policy=policy)`, but the
+    content of the `FileAttachment`s is read and encoded in blocks while
+    iterating, instead of all at once. Each chunk starts at the beginning
+    of a line.
+
+    The message is serialized, and the files checked, before returning,
+    so those errors are raised here and not in the middle of the iteration
+    (eg: after starting to send the message to a server).
+    """
+    files = {
+        part.placeholder: part
+        for part in msg.walk()
+        if isinstance(part, FileAttachment)
+    }
+    for part in files.values():
+        part.check()
+    fp = io.BytesIO()
+    _SkeletonGenerator(fp, mangle_from_=False, policy=policy).flatten(msg)
+    data = fp.getvalue()
+    if not files:
+        return iter((data,))
+    return _iter_with_files(data, files, policy.linesep.encode("ascii"))
+
+
+def _iter_with_files(data, files, linesep):
+    pattern = re.compile(
+        b"(?:"
+        + b"|".join(re.escape(placeholder.encode("ascii")) for placeholder in files)
+        + b")"
+        + re.escape(linesep)
+    )
+    pos = 0
+    for match in pattern.finditer(data):
+        yield data[pos : match.start()]
+        placeholder = match.group()[: -len(linesep)].decode("ascii")
+        yield from files[placeholder].iter_encoded(linesep)
+        pos = match.end()
+    yield data[pos:]
+
+
+_local = threading.local()
+
+
+@functools.lru_cache(maxsize=HTML_TO_TEXT_CACHE_SIZE)
+def html_to_text(html):
+    """Convert an html body to plain text.
+
+    The results are cached, so sending the same html to many people
+    converts it only once. `html2text.HTML2Text` instances aren't thread
+    safe, so every thread uses its own.
+    """
+    textify = getattr(_local, "textify", None)
+    if textify is None:
+        # Imported here because it is slow to import and most messages
+        # don't need it.
+        import html2text
+
+        textify = _local.textify = html2text.HTML2Text()
+    return textify.handle(html)
+
+
+def encode_addresses(addrs, encoding):
+    """Encode an email address or a list of them. See `encode_address()`."""
+    addrs = addrs or []
+    if isinstance(addrs, str):
+        addrs = [addrs]
+    return [encode_address(addr, encoding) for addr in addrs]
+
+
+def guess_mimetype(filename):
+    mimetype, _ = mimetypes.guess_type(filename)
+    return mimetype or DEFAULT_ATTACHMENT_MIME_TYPE
+
+
+def _encode_filename(filename):
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        return ("utf-8", "", filename)
+    return filename
+
+
 class EmailMessage:
 
     """A container for email information."""
@@ -93,6 +255,10 @@ class EmailMessage:
     html_subtype = "html"
     alternative_subtype = "alternative"
 
+    # An `Instrumentation` to measure the encoding of the addresses and the
+    # rendering of all the messages.
+    instrumentation = NO_INSTRUMENTATION
+
     def __init__(
         self,
         subject="",
@@ -123,39 +289,44 @@ class EmailMessage:
         `tags` are ignored unless the mailer supports them (eg. Amazon SES)
         """
         self.encoding = encoding
-        to = to or []
-        if isinstance(to, str):
-            to = [to]
-        self.to = [encode_address(addr, self.encoding) for addr in to]
-        cc = cc or []
-        if isinstance(cc, str):
-            cc = [cc]
-        self.cc = [encode_address(addr, self.encoding) for addr in cc]
-
-        bcc = bcc or []
-        if isinstance(bcc, str):
-            bcc = [bcc]
-        self.bcc = [encode_address(addr, self.encoding) for addr in bcc]
-
-        reply_to = reply_to or []
-        if isinstance(reply_to, str):
-            reply_to = [reply_to]
-        self.reply_to = [encode_address(addr, self.encoding) for addr in reply_to]
+        with self.instrumentation.phase("encode"):
+            self.to = encode_addresses(to, self.encoding)
+            self.cc = encode_addresses(cc, self.encoding)
+            self.bcc = encode_addresses(bcc, self.encoding)
+            self.reply_to = encode_addresses(reply_to, self.encoding)
 
         self.from_email = from_email
         self.subject = subject
         self.attachments = attachments or []
+        # Cache of the MIME parts of the attachments, so they are only encoded
+        # once no matter how many times the message is rendered.
+        self._attachment_parts = {}
+        # Same for the text and html parts, as `{subtype: (content, part)}`.
+        self._body_parts = {}
         self.extra_headers = headers or {}
 
-        text = to_str(text or text_content or "")
-        html = to_str(html or html_content or "")
-        if html and not text:
-            text = textify.handle(html)
-        self.text = text
-        self.html = html
+        self.text = to_str(text or text_content or "")
+        self.html = to_str(html or html_content or "")
         self.tags = tags
 
+    @property
+    def text(self):
+        """The plain text body. If it's empty, it's generated from the html
+        body, but only when needed.
+        """
+        if not self._text and self.html:
+            return html_to_text(self.html)
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+
     def render(self):
+        with self.instrumentation.phase("render"):
+            return self._render()
+
+    def _render(self):
         msg = self._create_message()
         msg["Subject"] = self.subject
         msg["From"] = self.extra_headers.get("From", self.from_email)
@@ -191,6 +362,12 @@ class EmailMessage:
     def as_bytes(self, unixfrom=False):
         return self.render().as_bytes(unixfrom, policy=email.policy.default)
 
+    def iter_bytes(self, policy=email.policy.default):
+        """Render the message and return an iterator of bytes chunks.
+        See `iter_message_bytes()`.
+        """
+        return iter_message_bytes(self.render(), policy=policy)
+
     def get_recipients(self):
         """Returns a list of all recipients of the email (includes direct
         addressees as well as Cc and Bcc entries).
@@ -212,17 +389,29 @@ class EmailMessage:
             assert content is not None
             self.attachments.append((filename, content, mimetype))
 
-    def attach_file(self, path, mimetype=None):
-        """Attaches a file from the filesystem."""
+    def attach_file(self, path, mimetype=None, lazy=False):
+        """Attaches a file from the filesystem.
+
+        If `lazy` is true, the file is not read now but when the message is
+        sent, in blocks, so it's never fully loaded in memory.
+        See `FileAttachment`.
+        """
+        if lazy:
+            self.attach(FileAttachment(path, mimetype))
+            return
         filename = os.path.basename(path)
         with open(path, "rb") as f:
             content = f.read()
         self.attach(filename, content, mimetype)
 
     def _create_message(self):
-        text = SafeMIMEText(
-            to_str(self.text or ""), self.content_subtype, self.encoding
-        )
+        if not self.html and not self.attachments:
+            # The part is also the message, so it can't be reused.
+            return SafeMIMEText(
+                to_str(self.text or ""), self.content_subtype, self.encoding
+            )
+
+        text = self._get_body_part(self.content_subtype, self.text or "")
         msg = text
 
         if self.html:
@@ -233,11 +422,7 @@ class EmailMessage:
                 msg.attach(text)
 
             if self.html:
-                html = SafeMIMEText(
-                    to_str(self.html or "").encode(self.encoding),
-                    self.html_subtype,
-                    self.encoding,
-                )
+                html = self._get_body_part(self.html_subtype, self.html)
                 msg.attach(html)
 
         if self.attachments:
@@ -246,31 +431,52 @@ class EmailMessage:
             )
             _msg.attach(msg)
             msg = _msg
+            parts = {}
             for attachment in self.attachments:
                 if isinstance(attachment, MIMEBase):
                     msg.attach(attachment)
+                    continue
+                # The cache is keyed by identity but it keeps a reference to the
+                # attachment, so the id can't be reused by another object.
+                cached = self._attachment_parts.get(id(attachment))
+                if cached is not None and cached[0] is attachment:
+                    part = cached[1]
                 else:
-                    msg.attach(self._create_attachment(*attachment))
+                    part = self._create_attachment(*attachment)
+                parts[id(attachment)] = (attachment, part)
+                msg.attach(part)
+            # Forget the parts of attachments that were removed.
+            self._attachment_parts = parts
 
         return msg
 
+    def _get_body_part(self, subtype, content):
+        """Return the MIME part of the text or html body, reusing the last
+        one if the content is the same.
+        """
+        cached = self._body_parts.get(subtype)
+        if cached is not None and cached[0] is content:
+            return cached[1]
+        data = to_str(content)
+        if subtype == self.html_subtype:
+            data = data.encode(self.encoding)
+        part = SafeMIMEText(data, subtype, self.encoding)
+        self._body_parts[subtype] = (content, part)
+        return part
+
     def _create_attachment(self, filename, content, mimetype=None):
         """
         Converts the filename, content, mimetype triple into a MIME attachment
         object.
         """
         if mimetype is None:
-            mimetype, _ = mimetypes.guess_type(filename)
-            if mimetype is None:
-                mimetype = DEFAULT_ATTACHMENT_MIME_TYPE
+            mimetype = guess_mimetype(filename)
         attachment = self._create_mime_attachment(content, mimetype)
         if filename:
-            try:
-                filename.encode("ascii")
-            except UnicodeEncodeError:
-                filename = ("utf-8", "", filename)
             attachment.add_header(
-                "Content-Disposition", "attachment", filename=filename
+                "Content-Disposition",
+                "attachment",
+                filename=_encode_filename(filename),
             )
         return attachment
 
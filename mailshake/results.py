@@ -0,0 +1,125 @@
+"""
+The detailed outcome of sending messages.
+"""
+from contextlib import contextmanager
+import time
+
+
+class SendResult:
+    """The outcome of sending a message.
+
+    `message`: The `EmailMessage`.
+
+    `sent`: Whether the message was sent, even if some of the recipients
+        were refused.
+
+    `message_id`: The "Message-ID" header of the message sent.
+
+    `provider_id`: The ID given to the message by the email provider,
+        eg: by Amazon SES.
+
+    `accepted`: List of the recipients accepted.
+
+    `refused`: Dictionary of the recipients refused by the server, with
+        the `(code, response)` of the server for each one.
+
+    `attempts`: Number of attempts made to send the message.
+
+    `bytes_sent`: Size of the message sent, including all the retries.
+
+    `timings`: Seconds spent in each phase of the send, eg:
+        `{"render": 0.001, "transfer": 0.02}`.
+
+    `error`: The exception that made the send fail, if any.
+
+    It is true if the message was sent.
+    """
+
+    def __init__(self, message, sent=False):
+        self.message = message
+        self.sent = sent
+        self.message_id = None
+        self.provider_id = None
+        self.accepted = list(message.get_recipients()) if sent else []
+        self.refused = {}
+        self.attempts = 1 if sent else 0
+        self.bytes_sent = 0
+        self.timings = {}
+        self.error = None
+
+    def __bool__(self):
+        return self.sent
+
+    def __repr__(self):
+        return "<SendResult sent=%s accepted=%s refused=%s>" % (
+            self.sent,
+            len(self.accepted),
+            len(self.refused),
+        )
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    @contextmanager
+    def timer(self, phase):
+        """Add the time spent inside the `with` block to the `phase`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+
+class SendReport(int):
+    """What `send_messages()` returns: the number of messages sent,
+    with the `SendResult` of every message in `results`.
+
+    `timings` has the total seconds spent in each phase, including the ones
+    not related to a single message, like opening a connection.
+    """
+
+    def __new__(cls, results=(), timings=None):
+        results = list(results)
+        report = super().__new__(cls, sum(1 for result in results if result.sent))
+        report.results = results
+        report.timings = dict(timings or {})
+        for result in results:
+            for phase, seconds in result.timings.items():
+                report.timings[phase] = report.timings.get(phase, 0) + seconds
+        return report
+
+    @property
+    def failed(self):
+        """The results of the messages that weren't sent."""
+        return [result for result in self.results if not result.sent]
+
+    @property
+    def refused(self):
+        """All the recipients refused, with the reply of the server."""
+        refused = {}
+        for result in self.results:
+            refused.update(result.refused)
+        return refused
+
+    @property
+    def bytes_sent(self):
+        return sum(result.bytes_sent for result in self.results)
+
+
+def sent_results(email_messages):
+    """The `SendResult`s of messages sent without problems."""
+    return [SendResult(message, sent=True) for message in email_messages]
+
+
+def get_results(sent, email_messages):
+    """The `SendResult`s of the messages, from what the `send_messages()`
+    of a mailer returned. For mailers that only return the number of
+    messages sent, the first ones are assumed to be the sent ones.
+    """
+    if isinstance(sent, SendReport):
+        return sent.results
+    count = sent or 0
+    return [
+        SendResult(message, sent=num < count)
+        for num, message in enumerate(email_messages)
+    ]
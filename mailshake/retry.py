@@ -0,0 +1,111 @@
+"""
+Retrying failed sends.
+"""
+import random
+import smtplib
+import socket
+import time
+
+
+# Error codes of the AWS API that are worth retrying.
+AWS_TRANSIENT_ERRORS = set(
+    [
+        "Throttling",
+        "ThrottlingException",
+        "TooManyRequestsException",
+        "RequestTimeout",
+        "ServiceUnavailable",
+        "InternalFailure",
+        # Statuses of the destinations of a bulk send
+        "AccountThrottled",
+        "TransientFailure",
+    ]
+)
+
+
+def is_transient_code(code):
+    """Whether an SMTP reply code means "try again later" (4xx)."""
+    return 400 <= code < 500
+
+
+def is_transient(exc):
+    """Whether an error is transient, so the send could succeed if retried:
+    disconnections, timeouts, 4xx SMTP replies and throttling by AWS.
+    Everything else, like 5xx SMTP replies, is considered permanent.
+    """
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return is_transient_code(exc.smtp_code)
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return any(is_transient_code(code) for code, _ in exc.recipients.values())
+    if isinstance(exc, (socket.timeout, TimeoutError, ConnectionError)):
+        return True
+    # A `botocore.exceptions.ClientError`
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in AWS_TRANSIENT_ERRORS
+    return False
+
+
+class RetryPolicy:
+    """When and how many times to retry a failed send.
+
+    `max_attempts`: Maximum number of attempts, including the first one.
+
+    `base_delay`: Seconds to wait before the first retry.
+
+    `multiplier`: The wait is multiplied by this after every retry.
+
+    `max_delay`: Maximum seconds to wait between attempts.
+
+    `jitter`: Fraction of the wait that is random, so the retries of
+        many senders don't happen all at the same time. Between 0 and 1.
+
+    `classify`: A function that takes an exception and returns whether
+        it is transient, and so worth retrying. By default, `is_transient()`.
+
+    """
+
+    def __init__(
+        self,
+        max_attempts=3,
+        base_delay=1,
+        multiplier=2,
+        max_delay=60,
+        jitter=0.5,
+        classify=is_transient,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.classify = classify
+
+    def is_transient(self, exc):
+        return self.classify(exc)
+
+    def delay(self, attempt):
+        """Seconds to wait after the failed attempt number `attempt`."""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def wait(self, attempt):
+        delay = self.delay(attempt)
+        if delay > 0:
+            time.sleep(delay)
+
+    def call(self, func, *args, **kwargs):
+        """Call `func(*args, **kwargs)`, retrying it while it fails with
+        transient errors.
+        """
+        attempt = 1
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as exc:
+                if attempt >= self.max_attempts or not self.is_transient(exc):
+                    raise
+            self.wait(attempt)
+            attempt += 1
@@ -5,6 +5,7 @@ The original code was BSD licensed (see LICENSE)
 from datetime import datetime
 from email.charset import Charset
 from email.utils import formataddr, parseaddr
+import functools
 import os
 import socket
 import threading
@@ -37,18 +38,32 @@ def split_addr(addr, encoding):
     return encode_address(addr, encoding).rsplit("@", 1)
 
 
+# Maximum number of different addresses and domains whose encoded version
+# is remembered.
+ADDRESS_CACHE_SIZE = 4096
+
+
 def encode_address(addr, charset):
     """Encode a pair of (name, address) or an email address string.
 
     When non-ascii characters are present in the name or local part, they're
     MIME-word encoded. The domain name is idna-encoded if it contains
     non-ascii characters.
+
+    The results are cached, see `encode_address.cache_info()`. If
+    `charset` is a `Charset`, only its name is used.
     """
     if not isinstance(addr, tuple):
-        addr = parseaddr(to_str(addr))
+        addr = to_str(addr)
+    return _encode_address(addr, str(charset).lower())
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _encode_address(addr, charset):
+    if not isinstance(addr, tuple):
+        addr = parseaddr(addr)
     name, addr = addr
-    if isinstance(charset, str):
-        charset = Charset(charset)
+    charset = Charset(charset)
     if "@" in addr:
         localpart, domain = addr.rsplit("@", 1)
         # Try to get the simplest encoding - ascii if possible so that
@@ -58,7 +73,7 @@ def encode_address(addr, charset):
             localpart.encode("ascii")
         except UnicodeEncodeError:
             localpart = charset.header_encode(localpart)
-        addr = localpart + "@" + domain.encode("idna").decode("ascii")
+        addr = localpart + "@" + encode_domain(domain)
         del localpart, domain
     else:
         try:
@@ -68,6 +83,17 @@ def encode_address(addr, charset):
     return formataddr((name, addr), charset=charset)
 
 
+# Hits and misses counters of the cache, like in `functools.lru_cache`
+encode_address.cache_info = _encode_address.cache_info
+encode_address.cache_clear = _encode_address.cache_clear
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def encode_domain(domain):
+    """Encode a domain name with idna. The results are cached."""
+    return domain.encode("idna").decode("ascii")
+
+
 def sanitize_address(addr, encoding):
     warnings.warn(
         "the sanitize_address function has been replaced by encode_address",
@@ -76,6 +102,19 @@ def sanitize_address(addr, encoding):
     return encode_address(addr, encoding)
 
 
+def normalize_address(addr, encoding="utf-8"):
+    """The email address, without the name, to compare it with the
+    addresses of the messages: encoded like them (see `encode_address()`)
+    and with the domain in lowercase. The local part is case-sensitive.
+    Eg: "Mary <mary@Example.com>" -> "mary@example.com".
+    """
+    addr = parseaddr(encode_address(addr, encoding))[1] or addr
+    localpart, at, domain = addr.rpartition("@")
+    if not at:
+        return addr
+    return localpart + "@" + domain.lower()
+
+
 thread_lock = threading.Lock()
 
 
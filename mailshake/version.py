@@ -1,7 +1,14 @@
-import pkg_resources
+try:
+    from importlib.metadata import version
+except ImportError:  # pragma:no cover
+    # Python < 3.8
+    from pkg_resources import get_distribution
+
+    def version(name):
+        return get_distribution(name).version
 
 
 try:
-    __version__ = pkg_resources.require("mailshake")[0].version
+    __version__ = version("mailshake")
 except Exception:  # pragma:no cover
     __version__ = None
@@ -0,0 +1,332 @@
+import email
+import os
+import threading
+import time
+
+import pytest
+
+from ..mailshake import AmazonSESMailer, EmailMessage, Instrumentation
+from ..mailshake.mailers import amazon_ses
+from ..mailshake.retry import RetryPolicy, is_transient
+
+
+pytest.importorskip("boto3")
+from botocore.stub import ANY, Stubber  # noqa
+
+
+def make_mailer(**kwargs):
+    return AmazonSESMailer(
+        aws_access_key_id="AKIAEXAMPLE",
+        aws_secret_access_key="secret",
+        **kwargs
+    )
+
+
+def make_emails():
+    return [
+        EmailMessage(
+            "Subject-%s" % num, "Content", "from@example.com", "to@example.com"
+        )
+        for num in range(1, 5)
+    ]
+
+
+def test_send_email():
+    mailer = make_mailer()
+    msg = EmailMessage(
+        "Subject", "Content", "from@example.com", "to@example.com", html="<p>Hi</p>"
+    )
+    with Stubber(mailer.client) as stub:
+        stub.add_response(
+            "send_email",
+            {"MessageId": "msg-1"},
+            expected_params={
+                "Source": "from@example.com",
+                "Destination": {"ToAddresses": ["to@example.com"]},
+                "Message": {
+                    "Subject": {"Data": "Subject", "Charset": "UTF-8"},
+                    "Body": {
+                        "Text": {"Data": "Content", "Charset": "UTF-8"},
+                        "Html": {"Data": "<p>Hi</p>", "Charset": "UTF-8"},
+                    },
+                },
+            },
+        )
+        report = mailer.send_messages(msg)
+        stub.assert_no_pending_responses()
+
+    assert report == 1
+    assert report.results[0].provider_id == "msg-1"
+    assert report.results[0].accepted == ["to@example.com"]
+
+
+def test_send_raw_email():
+    mailer = make_mailer(raw=True)
+    msg = EmailMessage(
+        "Subject",
+        "Content",
+        "from@example.com",
+        "to@example.com",
+        bcc=["bcc@example.com"],
+        headers={"X-Campaign": "spring"},
+    )
+    msg.attach("report.txt", "Some data", "text/plain")
+    with Stubber(mailer.client) as stub:
+        stub.add_response(
+            "send_raw_email",
+            {"MessageId": "msg-1"},
+            expected_params={
+                "Source": "from@example.com",
+                "Destinations": ["to@example.com", "bcc@example.com"],
+                "RawMessage": {"Data": ANY},
+            },
+        )
+        report = mailer.send_messages(msg)
+        stub.assert_no_pending_responses()
+
+    assert report == 1
+    result = report.results[0]
+    assert result.provider_id == "msg-1"
+    assert result.bytes_sent > 0
+
+
+def test_send_raw_email_content():
+    mailer = make_mailer(raw=True)
+    msg = EmailMessage("Subject", "Content", "from@example.com", "to@example.com")
+    msg.attach("report.txt", "Some data", "text/plain")
+    data = mailer._get_raw_data(msg)["RawMessage"]["Data"]
+    sent = email.message_from_bytes(data)
+    assert sent["Subject"] == "Subject"
+    assert sent.get_payload(1).get_filename() == "report.txt"
+
+
+def test_send_errors():
+    mailer = make_mailer(fail_silently=True)
+    with Stubber(mailer.client) as stub:
+        stub.add_response("send_email", {"MessageId": "msg-1"})
+        stub.add_client_error("send_email", "MessageRejected", "Not verified")
+        report = mailer.send_messages(*make_emails()[:2])
+
+    assert report == 1
+    assert report.failed[0].error.response["Error"]["Code"] == "MessageRejected"
+
+    mailer = make_mailer()
+    with Stubber(mailer.client) as stub:
+        stub.add_client_error("send_email", "MessageRejected", "Not verified")
+        with pytest.raises(Exception):
+            mailer.send_messages(*make_emails()[:1])
+
+
+def test_workers():
+    mailer = make_mailer(raw=True, workers=4)
+    threads = set()
+    send_raw_email = mailer.client.send_raw_email
+
+    def record(**kwargs):
+        threads.add(threading.get_ident())
+        return send_raw_email(**kwargs)
+
+    mailer.client.send_raw_email = record
+    emails = make_emails() * 3
+    with Stubber(mailer.client) as stub:
+        for num in range(len(emails)):
+            stub.add_response("send_raw_email", {"MessageId": "msg-%s" % num})
+        report = mailer.send_messages(*emails)
+
+    assert report == 12
+    assert [result.message for result in report.results] == emails
+    assert len({result.provider_id for result in report.results}) == 12
+    assert len(threads) > 1
+
+
+def test_send_templated():
+    mailer = make_mailer(default_from="from@example.com")
+    recipients = [
+        {"to": "user%s@example.com" % num, "name": "User %s" % num}
+        for num in range(60)
+    ]
+    recipients[1]["bcc"] = "boss@example.com"
+
+    def statuses(first, count):
+        return {
+            "Status": [
+                {"Status": "Success", "MessageId": "msg-%s" % num}
+                for num in range(first, first + count)
+            ]
+        }
+
+    with Stubber(mailer.client) as stub:
+        stub.add_response(
+            "send_bulk_templated_email",
+            statuses(0, 50),
+            expected_params={
+                "Source": "from@example.com",
+                "Template": "welcome",
+                "DefaultTemplateData": '{"name": "friend"}',
+                "Destinations": ANY,
+            },
+        )
+        stub.add_response("send_bulk_templated_email", statuses(50, 10))
+        report = mailer.send_templated(
+            "welcome", recipients, default_data={"name": "friend"}
+        )
+        stub.assert_no_pending_responses()
+
+    assert report == 60
+    assert report.results[59].provider_id == "msg-59"
+    assert report.results[1].message is recipients[1]
+    assert report.results[1].accepted == ["user1@example.com", "boss@example.com"]
+
+
+def test_send_templated_destinations():
+    data = amazon_ses._get_destination(
+        {"to": "a@example.com", "bcc": ["b@example.com"], "code": 1234}
+    )
+    assert data == {
+        "Destination": {
+            "ToAddresses": ["a@example.com"],
+            "BccAddresses": ["b@example.com"],
+        },
+        "ReplacementTemplateData": '{"code": 1234}',
+    }
+
+
+def test_send_templated_status():
+    mailer = make_mailer()
+    recipients = [{"to": "a@example.com"}, {"to": "b@example.com"}]
+    with Stubber(mailer.client) as stub:
+        stub.add_response(
+            "send_bulk_templated_email",
+            {
+                "Status": [
+                    {"Status": "Success", "MessageId": "msg-1"},
+                    {"Status": "MessageRejected", "Error": "Address blacklisted"},
+                ]
+            },
+        )
+        report = mailer.send_templated("welcome", recipients, "from@example.com")
+
+    assert report == 1
+    error = report.failed[0].error
+    assert isinstance(error, amazon_ses.SESBulkError)
+    assert error.status == "MessageRejected"
+    assert not is_transient(error)
+    assert is_transient(amazon_ses.SESBulkError("TransientFailure"))
+
+
+def test_send_templated_retries_transient_statuses():
+    mailer = make_mailer(retry=RetryPolicy(base_delay=0, jitter=0))
+    recipients = [
+        {"to": "a@example.com"},
+        {"to": "b@example.com"},
+        {"to": "c@example.com"},
+    ]
+    with Stubber(mailer.client) as stub:
+        stub.add_response(
+            "send_bulk_templated_email",
+            {
+                "Status": [
+                    {"Status": "Success", "MessageId": "msg-1"},
+                    {"Status": "TransientFailure"},
+                    {"Status": "MessageRejected"},
+                ]
+            },
+        )
+        stub.add_response(
+            "send_bulk_templated_email",
+            {"Status": [{"Status": "Success", "MessageId": "msg-2"}]},
+            expected_params={
+                "Source": "from@example.com",
+                "Template": "welcome",
+                "DefaultTemplateData": "{}",
+                "Destinations": [
+                    {
+                        "Destination": {"ToAddresses": ["b@example.com"]},
+                        "ReplacementTemplateData": "{}",
+                    }
+                ],
+            },
+        )
+        report = mailer.send_templated("welcome", recipients, "from@example.com")
+        stub.assert_no_pending_responses()
+
+    assert report == 2
+    assert report.results[1].provider_id == "msg-2"
+    assert report.results[1].error is None
+    assert report.failed[0].error.status == "MessageRejected"
+
+
+def test_send_templated_missing_status():
+    mailer = make_mailer()
+    recipients = [{"to": "a@example.com"}, {"to": "b@example.com"}]
+    with Stubber(mailer.client) as stub:
+        stub.add_response(
+            "send_bulk_templated_email",
+            {"Status": [{"Status": "Success", "MessageId": "msg-1"}]},
+        )
+        report = mailer.send_templated("welcome", recipients, "from@example.com")
+
+    assert report == 1
+    assert report.failed[0].message is recipients[1]
+    assert isinstance(report.failed[0].error, amazon_ses.SESBulkError)
+
+
+def test_send_templated_empty():
+    mailer = make_mailer()
+    assert mailer.send_templated("welcome", []) == 0
+
+
+def test_lazy_client():
+    mailer = make_mailer(workers=20, tcp_keepalive=True)
+    assert mailer._client is None
+
+    clients = []
+    threads = [
+        threading.Thread(target=lambda: clients.append(mailer.client))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(client) for client in clients}) == 1
+    client = clients[0]
+    assert client is mailer.client
+    assert client.meta.region_name == "us-east-1"
+    assert client.meta.config.max_pool_connections == 20
+    assert client.meta.config.tcp_keepalive is True
+
+
+def test_client_creation_is_not_render_time(monkeypatch):
+    phases = []
+
+    class Recorder(Instrumentation):
+        def on_phase(self, name, seconds, labels, error=None):
+            if labels.get("mailer"):
+                phases.append(name)
+
+    client = make_mailer().client
+
+    def create_client():
+        time.sleep(0.2)
+        return client
+
+    mailer = make_mailer(instrumentation=Recorder())
+    monkeypatch.setattr(mailer, "_create_client", create_client)
+    with Stubber(client) as stub:
+        stub.add_response("send_email", {"MessageId": "msg-1"})
+        report = mailer.send_messages(make_emails()[0])
+
+    assert report == 1
+    assert phases == ["connect", "render", "transfer"]
+    assert report.results[0].timings["render"] < 0.1
+
+
+def test_client_after_fork(monkeypatch):
+    mailer = make_mailer()
+    client = mailer.client
+    pid = os.getpid()
+    monkeypatch.setattr(os, "getpid", lambda: pid + 1)
+    assert mailer.client is not client
+    assert mailer.client is mailer.client
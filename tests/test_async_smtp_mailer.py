@@ -0,0 +1,239 @@
+import asyncio
+import threading
+
+import pytest
+
+from ..mailshake import AsyncSMTPMailer, EmailMessage, SMTPMailer
+from ..mailshake.mailers import async_smtp
+from ..mailshake.mailers.async_smtp import AsyncSMTPConnectionPool
+
+
+pytest.importorskip("aiosmtplib")
+
+
+def make_emails():
+    return [
+        EmailMessage(
+            "Subject-%s" % num, "Content", "from@example.com", "to@example.com"
+        )
+        for num in range(1, 5)
+    ]
+
+
+def test_sending(smtpd):
+    mailer = AsyncSMTPMailer(host=smtpd.hostname, port=smtpd.port)
+    email1, email2, email3, email4 = make_emails()
+
+    async def run():
+        assert await mailer.send_messages(email1) == 1
+        assert await mailer.send_messages(email2, email3) == 2
+        assert await mailer.send_messages(email4) == 1
+        assert await mailer.send_messages() == 0
+        await mailer.close()
+
+    asyncio.run(run())
+
+    assert len(smtpd.messages) == 4
+    assert mailer.pool.size == 0
+
+    message = smtpd.messages[0]
+    assert message.get_content_type() == "text/plain"
+    assert message.get("subject") == "Subject-1"
+    assert message.get("from") == "from@example.com"
+    assert message.get("to") == "to@example.com"
+
+
+def test_same_bytes_as_sync_mailer(smtpd):
+    headers = {"Date": "Fri, 09 Nov 2001 01:08:47 -0000", "Message-ID": "<1@a>"}
+    email = EmailMessage(
+        "Olé", "Contenido", "from@example.com", "to@example.com", headers=headers
+    )
+
+    SMTPMailer(host=smtpd.hostname, port=smtpd.port).send_messages(email)
+
+    async def run():
+        mailer = AsyncSMTPMailer(host=smtpd.hostname, port=smtpd.port)
+        await mailer.send_messages(email)
+        await mailer.close()
+
+    asyncio.run(run())
+
+    assert len(smtpd.messages) == 2
+    sync_msg, async_msg = smtpd.messages
+    del sync_msg["X-Peer"], async_msg["X-Peer"]
+    assert sync_msg.as_bytes() == async_msg.as_bytes()
+
+
+def test_file_attachments_read_outside_the_loop(smtpd, tmp_path, monkeypatch):
+    path = tmp_path / "report.txt"
+    path.write_text("Lazy content")
+    email1, email2 = make_emails()[:2]
+    email2.attach_file(str(path), lazy=True)
+
+    threads = []
+    as_bytes = async_smtp._as_bytes
+
+    def record_thread(msg):
+        threads.append(threading.current_thread())
+        return as_bytes(msg)
+
+    monkeypatch.setattr(async_smtp, "_as_bytes", record_thread)
+
+    async def run():
+        mailer = AsyncSMTPMailer(host=smtpd.hostname, port=smtpd.port)
+        assert await mailer.send_messages(email1, email2) == 2
+        await mailer.close()
+
+    asyncio.run(run())
+
+    main = threading.current_thread()
+    assert threads[0] is main
+    assert threads[1] is not main
+    assert len(smtpd.messages) == 2
+    attachment = smtpd.messages[1].get_payload()[-1]
+    assert attachment.get_payload(decode=True) == b"Lazy content"
+
+
+def test_concurrent_sending(smtpd):
+    mailer = AsyncSMTPMailer(
+        host=smtpd.hostname, port=smtpd.port, pool_size=2, max_recipients=2
+    )
+    send_to = ["user{}@example.com".format(i) for i in range(1, 6)]
+    emails = [
+        EmailMessage("Subject-%s" % num, "Content", "from@example.com", send_to)
+        for num in range(1, 6)
+    ]
+
+    async def run():
+        sent = await asyncio.gather(
+            mailer.send_messages(*emails[:3]), mailer.send_messages(*emails[3:])
+        )
+        assert mailer.pool.size <= 2
+        await mailer.close()
+        return sent
+
+    assert asyncio.run(run()) == [3, 2]
+    assert len(smtpd.messages) == 15
+
+
+def test_pool_checks_connections_outside_the_lock():
+    class Reply:
+        code = 250
+
+    class SlowConnection:
+        def __init__(self, unblock):
+            self.unblock = unblock
+
+        async def noop(self):
+            await self.unblock.wait()
+            return Reply()
+
+        def close(self):
+            pass
+
+    async def run():
+        unblock = asyncio.Event()
+
+        async def connect():
+            return SlowConnection(unblock)
+
+        pool = AsyncSMTPConnectionPool(connect, max_size=2, check_after=0)
+        conn1, conn2 = await pool.acquire(), await pool.acquire()
+        await pool.release(conn1)
+
+        checking = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        # While the NOOP is waiting for its reply, the pool is still usable.
+        await asyncio.wait_for(pool.release(conn2), 1)
+
+        unblock.set()
+        assert await checking is conn1
+
+    asyncio.run(run())
+
+
+def test_fail_silently(smtpd):
+    mailer = AsyncSMTPMailer(
+        host=smtpd.hostname, port=3000, timeout=0.5, fail_silently=True
+    )
+
+    async def run():
+        assert await mailer.send_messages(*make_emails()) == 0
+        await mailer.close()
+
+    asyncio.run(run())
+
+
+def test_wrong_port(smtpd):
+    mailer = AsyncSMTPMailer(host=smtpd.hostname, port=3000, timeout=0.5)
+
+    async def run():
+        with pytest.raises(Exception):
+            await mailer.send_messages(*make_emails())
+        await mailer.close()
+
+    asyncio.run(run())
+    assert mailer.pool.size == 0
+
+
+def test_send_report(smtpd):
+    mailer = AsyncSMTPMailer(host=smtpd.hostname, port=smtpd.port)
+    emails = make_emails()
+
+    async def run():
+        report = await mailer.send_messages(*emails)
+        await mailer.close()
+        return report
+
+    report = asyncio.run(run())
+    assert report == 4
+    assert [result.message for result in report.results] == emails
+    result = report.results[0]
+    assert result.accepted == ["to@example.com"]
+    assert result.message_id
+    assert result.bytes_sent > 0
+    assert set(result.timings) == {"render", "transfer"}
+
+
+def test_attempts_per_message(smtpd):
+    mailer = AsyncSMTPMailer(host=smtpd.hostname, port=smtpd.port, max_recipients=2)
+    send_to = ["user{}@example.com".format(i) for i in range(1, 6)]
+    email = EmailMessage("Subject", "Content", "from@example.com", send_to)
+
+    async def run():
+        report = await mailer.send_messages(email)
+        await mailer.close()
+        return report
+
+    report = asyncio.run(run())
+    assert len(smtpd.messages) == 3
+    assert report.results[0].attempts == 1
+
+
+def test_error_stops_the_other_workers(smtpd):
+    mailer = AsyncSMTPMailer(host=smtpd.hostname, port=smtpd.port, pool_size=2)
+    emails = make_emails() + make_emails()
+    sent = []
+
+    async def send(connection, result):
+        await asyncio.sleep(0.01)
+        if result.message is emails[1]:
+            raise ValueError("broken")
+        sent.append(result.message)
+        return 1
+
+    mailer._send = send
+
+    async def run():
+        with pytest.raises(ValueError):
+            await mailer.send_messages(*emails)
+        num_sent = len(sent)
+        await asyncio.sleep(0.1)
+        # Nothing was sent after raising
+        assert len(sent) == num_sent
+        await mailer.close()
+
+    asyncio.run(run())
+    # Only the messages being sent when the error happened
+    assert emails[0] in sent
+    assert not any(email in sent for email in emails[3:])
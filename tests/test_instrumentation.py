@@ -0,0 +1,98 @@
+from smtplib import SMTP
+
+from ..mailshake import (
+    EmailMessage,
+    Instrumentation,
+    MetricsCollector,
+    SMTPMailer,
+    ToMemoryMailer,
+)
+
+
+def make_emails():
+    return [
+        EmailMessage(
+            "Subject-%s" % num, "Content", "from@example.com", "to@example.com"
+        )
+        for num in range(1, 5)
+    ]
+
+
+def test_phases(smtpd, monkeypatch):
+    phases = []
+
+    class Recorder(Instrumentation):
+        def on_phase(self, name, seconds, labels, error=None):
+            phases.append((name, labels))
+
+    recorder = Recorder()
+    monkeypatch.setattr(EmailMessage, "instrumentation", recorder)
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, instrumentation=recorder)
+    email = EmailMessage("Subject", "Content", "from@example.com", "to@example.com")
+
+    with SMTP(smtpd.hostname, smtpd.port):
+        assert mailer.send_messages(email) == 1
+
+    assert phases == [
+        ("encode", {}),
+        ("connect", {"mailer": "SMTPMailer"}),
+        ("render", {}),
+        ("transfer", {"mailer": "SMTPMailer"}),
+    ]
+
+
+def test_metrics_collector(smtpd):
+    metrics = MetricsCollector()
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, instrumentation=metrics)
+    emails = make_emails()
+    emails.append(EmailMessage("No recipients", "Content", "from@example.com"))
+
+    with SMTP(smtpd.hostname, smtpd.port):
+        assert mailer.send_messages(*emails) == 4
+
+    labels = {"mailer": "SMTPMailer"}
+    assert metrics.counter("mailshake_messages_total", status="sent", **labels) == 4
+    assert metrics.counter("mailshake_messages_total", status="failed", **labels) == 1
+    assert (
+        metrics.counter("mailshake_recipients_total", status="accepted", **labels) == 4
+    )
+    assert metrics.counter("mailshake_bytes_sent_total", **labels) > 0
+    total, count = metrics.histogram(phase="transfer", **labels)
+    assert count == 4
+    assert total > 0
+    assert metrics.histogram(phase="connect", **labels)[1] == 1
+
+
+def test_prometheus():
+    metrics = MetricsCollector(buckets=(0.1, 1))
+    mailer = ToMemoryMailer(instrumentation=metrics)
+    mailer.send_messages(*make_emails())
+    metrics.on_phase("connect", 0.5, {"mailer": "SMTPMailer"})
+    metrics.on_phase("connect", 2, {"mailer": "SMTPMailer"}, error=OSError())
+
+    bucket = 'mailshake_phase_seconds_bucket{mailer="SMTPMailer",phase="connect",'
+    assert metrics.prometheus().splitlines() == [
+        "# TYPE mailshake_messages_total counter",
+        'mailshake_messages_total{mailer="ToMemoryMailer",status="sent"} 4',
+        "# TYPE mailshake_phase_errors_total counter",
+        'mailshake_phase_errors_total{mailer="SMTPMailer",phase="connect"} 1',
+        "# TYPE mailshake_recipients_total counter",
+        'mailshake_recipients_total{mailer="ToMemoryMailer",status="accepted"} 4',
+        "# TYPE mailshake_phase_seconds histogram",
+        bucket + 'le="0.1"} 0',
+        bucket + 'le="1"} 1',
+        bucket + 'le="+Inf"} 2',
+        'mailshake_phase_seconds_sum{mailer="SMTPMailer",phase="connect"} 2.5',
+        'mailshake_phase_seconds_count{mailer="SMTPMailer",phase="connect"} 2',
+    ]
+
+    assert metrics.statsd(prefix="app.") == [
+        "app.mailshake_messages_total:4|g|#mailer:ToMemoryMailer,status:sent",
+        "app.mailshake_phase_errors_total:1|g|#mailer:SMTPMailer,phase:connect",
+        "app.mailshake_recipients_total:4|g|#mailer:ToMemoryMailer,status:accepted",
+        "app.mailshake_phase_seconds.sum:2.5|g|#mailer:SMTPMailer,phase:connect",
+        "app.mailshake_phase_seconds.count:2|g|#mailer:SMTPMailer,phase:connect",
+    ]
+
+    metrics.reset()
+    assert metrics.prometheus() == ""
@@ -1,20 +1,39 @@
+import asyncio
 import email
+import gzip
 from io import StringIO
 import os
+import queue
 import shutil
+import smtplib
+import subprocess
 import sys
 import tempfile
+import threading
+import time
 
 import pytest
 
 from ..mailshake import (
     EmailMessage,
+    AsyncBaseMailer,
+    AsyncDummyMailer,
+    AsyncToMemoryMailer,
     BaseMailer,
     DummyMailer,
+    QueuedMailer,
+    SendReport,
+    SendResult,
+    SpoolMailer,
+    ThrottledMailer,
     ToMemoryMailer,
     ToConsoleMailer,
     ToFileMailer,
+    ToMaildirMailer,
+    ToMboxMailer,
 )
+from ..mailshake.mailers.filebased import FileIndex
+from ..mailshake.mailers.throttled import TokenBucket
 
 
 def make_emails():
@@ -52,6 +71,93 @@ def test_to_memory_mailer():
     assert mailer.outbox[1] == email2
 
 
+def test_to_memory_mailer_indexes():
+    mailer = ToMemoryMailer()
+    email1, email2, email3, email4 = make_emails()
+    email2.to = ["Mary <mary@Example.com>"]
+    email3.bcc = ["mary@example.com"]
+    email3.subject = "Welcome"
+    email4.extra_headers["Message-ID"] = "<1234@example.com>"
+    mailer.send_messages(email1, email2, email3, email4)
+
+    assert mailer.outbox.by_recipient("mary@example.com") == [email2, email3]
+    assert mailer.outbox.by_recipient("nobody@example.com") == []
+    assert mailer.outbox.by_subject("Subject") == [email1, email2, email4]
+    assert mailer.outbox.by_message_id("1234@example.com") is email4
+    assert mailer.outbox[-2:] == [email3, email4]
+
+    # The local part is case-sensitive
+    assert mailer.outbox.by_recipient("Mary@example.com") == []
+
+    email5 = EmailMessage("Hi", "Content", "from@example.com", "toБ@exämple.com")
+    mailer.send_messages(email5)
+    assert mailer.outbox.by_recipient("toБ@exämple.com") == [email5]
+    assert mailer.outbox.by_recipient("Tö <toБ@EXÄMPLE.com>") == [email5]
+
+    mailer.outbox.clear()
+    assert mailer.outbox == []
+    assert mailer.outbox.by_subject("Welcome") == []
+
+
+def test_to_memory_mailer_list_operations():
+    mailer = ToMemoryMailer()
+    email1, email2, email3, email4 = make_emails()
+    email2.to = ["mary@example.com"]
+    email3.subject = "Welcome"
+    mailer.send_messages(email1, email2, email3, email4)
+    outbox = mailer.outbox
+
+    assert outbox.pop() is email4
+    assert outbox.index(email2) == 1
+    assert outbox + [email4] == [email1, email2, email3, email4]
+    assert [email4] + outbox == [email4, email1, email2, email3]
+
+    outbox.remove(email2)
+    assert outbox == [email1, email3]
+    assert outbox.by_recipient("mary@example.com") == []
+
+    outbox[1] = email2
+    assert outbox.by_subject("Welcome") == []
+    assert outbox.by_recipient("mary@example.com") == [email2]
+
+    outbox.insert(0, email3)
+    assert outbox == [email3, email1, email2]
+    assert outbox.by_subject("Welcome") == [email3]
+
+    del outbox[:]
+    assert outbox == []
+    assert outbox.by_recipient("mary@example.com") == []
+
+
+def test_to_memory_mailer_maxlen():
+    mailer = ToMemoryMailer(maxlen=3)
+    emails = make_emails()
+    emails[0].to = ["mary@example.com"]
+    emails[3].to = ["mary@example.com"]
+    mailer.send_messages(*emails)
+
+    assert list(mailer.outbox) == emails[1:]
+    assert mailer.outbox.evicted == 1
+    assert mailer.outbox.by_recipient("mary@example.com") == [emails[3]]
+    assert mailer.outbox.by_subject("Subject") == emails[1:]
+
+
+def test_to_memory_mailer_compact():
+    mailer = ToMemoryMailer(compact=True, maxlen=10)
+    msg = EmailMessage("Report", "See attached", "from@example.com", "to@example.com")
+    msg.attach("report.txt", "Some data " * 1000, "text/plain")
+    mailer.send_messages(msg)
+
+    stored = mailer.outbox[0]
+    assert stored.subject == "Report"
+    assert stored.get_recipients() == ["to@example.com"]
+    assert len(stored._data) < 1000
+    parsed = stored.parse()
+    assert parsed.get_payload(1).get_content().startswith("Some data")
+    assert mailer.outbox.by_message_id(parsed["Message-ID"]) is stored
+    assert mailer.outbox.by_recipient("to@example.com") == [stored]
+
+
 def test_to_console_mailer():
     __stdout = sys.stdout
     s = sys.stdout = StringIO()
@@ -121,6 +227,14 @@ def test_to_file_mailer():
     assert mailer.path == os.path.dirname(__file__)
 
 
+def test_to_file_mailer_no_messages():
+    tmp_dir = tempfile.mkdtemp()
+    mailer = ToFileMailer(tmp_dir)
+    assert mailer.send_messages() == 0
+    assert os.listdir(tmp_dir) == []
+    shutil.rmtree(tmp_dir, True)
+
+
 def test_to_file_mailer_dir_creation():
     tmp_dir = os.path.join(os.path.dirname(__file__), "qwertyuiop12345")
     ToFileMailer(tmp_dir)
@@ -166,3 +280,596 @@ def test_to_file_mailer_multifile():
     assert len(os.listdir(tmp_dir)) == 3
 
     shutil.rmtree(tmp_dir, True)
+
+
+def test_async_base_mailer():
+    mailer = AsyncBaseMailer()
+
+    async def run():
+        await mailer.open()
+        await mailer.close()
+        with pytest.raises(NotImplementedError):
+            await mailer.send()
+
+    asyncio.run(run())
+
+
+def test_async_dummy_mailer():
+    mailer = AsyncDummyMailer()
+    email1, email2, email3, email4 = make_emails()
+
+    async def run():
+        assert await mailer.send_messages(email1) == 1
+        assert await mailer.send_messages(email2, email3, email4) == 3
+
+    asyncio.run(run())
+
+
+def test_async_to_memory_mailer():
+    mailer = AsyncToMemoryMailer()
+    email1, email2, email3, email4 = make_emails()
+
+    async def run():
+        assert await mailer.send_messages(email1) == 1
+        assert await mailer.send_messages(email2, email3, email4) == 3
+        assert await mailer.send(
+            "Subject", "Content", "from@example.com", "to@example.com"
+        )
+
+    asyncio.run(run())
+    assert len(mailer.outbox) == 5
+    assert mailer.outbox[1] == email2
+
+
+def test_queued_mailer():
+    backend = ToMemoryMailer()
+    mailer = QueuedMailer(backend, workers=2)
+    email1, email2, email3, email4 = make_emails()
+
+    future1 = mailer.send_messages(email1)
+    future2 = mailer.send_messages(email2, email3)
+    future3 = mailer.send("Subject", "Content", "from@example.com", "to@example.com")
+    assert future1.result(timeout=5) == 1
+    report = future2.result(timeout=5)
+    assert report == 2
+    assert [result.message for result in report.results] == [email2, email3]
+    assert future3.result(timeout=5) == 1
+    mailer.close()
+
+    assert len(backend.outbox) == 4
+    with pytest.raises(RuntimeError):
+        mailer.send_messages(email4)
+
+
+def test_queued_mailer_batches():
+    sent = []
+    release = threading.Event()
+
+    class SlowMailer(ToMemoryMailer):
+        def send_messages(self, *email_messages):
+            release.wait(5)
+            sent.append(len(email_messages))
+            return super().send_messages(*email_messages)
+
+    mailer = QueuedMailer(SlowMailer(), batch_size=3)
+    emails = make_emails() * 2
+    futures = [mailer.send_messages(email) for email in emails]
+    release.set()
+    mailer.flush()
+
+    assert sum(sent) == 8
+    assert max(sent) <= 3
+    assert all(future.done() for future in futures)
+    mailer.close()
+
+
+def test_queued_mailer_backpressure():
+    release = threading.Event()
+
+    class SlowMailer(DummyMailer):
+        def send_messages(self, *email_messages):
+            release.wait(5)
+            return super().send_messages(*email_messages)
+
+    mailer = QueuedMailer(SlowMailer(), maxsize=1, block=False, batch_size=1)
+    email1, email2, email3, email4 = make_emails()
+    mailer.send_messages(email1)
+    # wait for the worker to take the first one from the queue
+    while not mailer._queue.empty():
+        time.sleep(0.01)
+    mailer.send_messages(email2)
+    with pytest.raises(queue.Full):
+        mailer.send_messages(email3)
+    release.set()
+    mailer.close()
+
+
+def test_queued_mailer_waiting_call_doesnt_block_others():
+    release = threading.Event()
+
+    class SlowMailer(DummyMailer):
+        def send_messages(self, *email_messages):
+            release.wait(5)
+            return super().send_messages(*email_messages)
+
+    mailer = QueuedMailer(SlowMailer(), maxsize=1, batch_size=1)
+    email1, email2, email3, email4 = make_emails()
+    mailer.send_messages(email1)
+    while not mailer._queue.empty():
+        time.sleep(0.01)
+    mailer.send_messages(email2)
+    # Waits for a free slot
+    producer = threading.Thread(target=mailer.send_messages, args=(email3,))
+    producer.start()
+    while not mailer._putting:
+        time.sleep(0.01)
+
+    mailer.block = False
+    start = time.perf_counter()
+    with pytest.raises(queue.Full):
+        mailer.send_messages(email4)
+    assert time.perf_counter() - start < 1
+    release.set()
+    producer.join()
+    mailer.close()
+
+
+def test_queued_mailer_no_messages():
+    mailer = QueuedMailer(DummyMailer())
+    report = mailer.send_messages().result(timeout=5)
+    assert isinstance(report, SendReport)
+    assert report == 0
+    mailer.close()
+
+
+def test_queued_mailer_errors():
+    class BrokenMailer(BaseMailer):
+        def send_messages(self, *email_messages):
+            raise ValueError("broken")
+
+    mailer = QueuedMailer(BrokenMailer())
+    future = mailer.send_messages(*make_emails())
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    mailer.close()
+
+
+def test_spool_mailer():
+    tempdir = tempfile.mkdtemp()
+    try:
+        spool = SpoolMailer(tempdir)
+        email = EmailMessage(
+            "Subject", "Content", "from@example.com", "to@example.com",
+            bcc=["bcc@example.com"], html="<p>Content</p>",
+        )
+        assert spool.send_messages(email, *make_emails()) == 5
+        assert spool.pending() == 5
+        assert os.listdir(os.path.join(tempdir, "tmp")) == []
+
+        mailer = ToMemoryMailer()
+        assert spool.deliver(mailer) == 5
+        assert spool.pending() == 0
+        assert os.listdir(os.path.join(tempdir, "cur")) == []
+
+        sent = mailer.outbox[0]
+        assert sent.get_recipients() == ["to@example.com", "bcc@example.com"]
+        assert sent.text.strip() == "Content"
+        assert sent.html.strip() == "<p>Content</p>"
+        rendered = sent.render()
+        assert rendered["Subject"] == "Subject"
+        assert rendered["To"] == "to@example.com"
+        assert rendered["Bcc"] is None
+        assert [msg.text.strip() for msg in mailer.outbox[1:]] == [
+            "Content #%s" % num for num in range(1, 5)
+        ]
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_spool_mailer_failed_delivery():
+    class FlakyMailer(ToMemoryMailer):
+        calls = 0
+
+        def send_messages(self, *email_messages):
+            self.calls += 1
+            if self.calls == 2:
+                raise OSError("try later")
+            return super().send_messages(*email_messages)
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        spool = SpoolMailer(tempdir, fsync="never")
+        spool.send_messages(*make_emails())
+        mailer = FlakyMailer()
+        assert spool.deliver(mailer, limit=3) == 2
+        assert spool.pending() == 2
+
+        # The message that failed waits before being retried
+        assert spool.deliver(ToMemoryMailer()) == 1
+        assert spool.pending() == 1
+        (name,) = os.listdir(spool.new_path)
+        base, attempts, due = name.split(",")
+        assert attempts == "1"
+        assert 50 <= int(due) - time.time() <= 60
+
+        os.rename(
+            os.path.join(spool.new_path, name),
+            os.path.join(spool.new_path, "%s,1,0" % base),
+        )
+        assert spool.deliver(ToMemoryMailer()) == 1
+        assert spool.pending() == 0
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_spool_mailer_unreachable_server():
+    class DownMailer(BaseMailer):
+        def open(self):
+            raise ConnectionRefusedError()
+
+    class SilentlyDownMailer(BaseMailer):
+        calls = 0
+
+        def send_messages(self, *email_messages):
+            self.calls += 1
+            result = SendResult(email_messages[0])
+            result.error = smtplib.SMTPServerDisconnected("Could not reconnect")
+            return SendReport([result])
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        spool = SpoolMailer(tempdir, fsync="never", max_attempts=2)
+        spool.send_messages(*make_emails())
+        names = sorted(os.listdir(spool.new_path))
+
+        for _ in range(3):
+            assert spool.deliver(DownMailer()) == 0
+        mailer = SilentlyDownMailer()
+        for _ in range(3):
+            assert spool.deliver(mailer) == 0
+        # Each pass stops at the first message, that is not retried later
+        assert mailer.calls == 3
+        assert sorted(os.listdir(spool.new_path)) == names
+        assert os.listdir(spool.cur_path) == []
+        assert os.listdir(spool.failed_path) == []
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_spool_mailer_max_attempts():
+    class BrokenMailer(BaseMailer):
+        def send_messages(self, *email_messages):
+            raise OSError("550 rejected")
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        spool = SpoolMailer(tempdir, fsync="never", max_attempts=3, retry_delay=0)
+        spool.send_messages(*make_emails()[:1])
+        # A corrupt file fails too, instead of being retried forever
+        with open(os.path.join(spool.new_path, "0.0.corrupt"), "wb") as f:
+            f.write(b"{")
+
+        for _ in range(2):
+            assert spool.deliver(BrokenMailer()) == 0
+            assert spool.pending() == 2
+        assert all(",2," in name for name in os.listdir(spool.new_path))
+
+        assert spool.deliver(BrokenMailer()) == 0
+        assert spool.pending() == 0
+        assert os.listdir(spool.cur_path) == []
+        failed = sorted(os.listdir(spool.failed_path))
+        assert len(failed) == 2
+        assert failed[0] == "0.0.corrupt,3"
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_spool_mailer_waits_for_futures():
+    backend = ToMemoryMailer()
+    mailer = QueuedMailer(backend)
+    tempdir = tempfile.mkdtemp()
+    try:
+        spool = SpoolMailer(tempdir, fsync="never")
+        spool.send_messages(*make_emails())
+        assert spool.deliver(mailer) == 4
+        assert len(backend.outbox) == 4
+        assert spool.pending() == 0
+
+        # A message that fails in the background is not deleted
+        spool.send_messages(*make_emails()[:1])
+        backend.send_messages = lambda *msgs: 0
+        assert spool.deliver(mailer) == 0
+        assert spool.pending() == 1
+    finally:
+        mailer.close()
+        shutil.rmtree(tempdir)
+
+
+def test_spool_mailer_recover():
+    tempdir = tempfile.mkdtemp()
+    try:
+        spool = SpoolMailer(tempdir)
+        spool.send_messages(*make_emails()[:2])
+        # A delivery process that died after claiming a message
+        name = sorted(os.listdir(spool.new_path))[0]
+        os.rename(
+            os.path.join(spool.new_path, name), os.path.join(spool.cur_path, name)
+        )
+        # A process that died while writing a message
+        with open(os.path.join(spool.tmp_path, "partial"), "wb") as f:
+            f.write(b"{")
+        assert spool.pending() == 1
+
+        spool.recover(older_than=60)
+        assert spool.pending() == 1
+        spool.recover(older_than=-1)
+        assert spool.pending() == 2
+        assert os.listdir(spool.tmp_path) == []
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_spool_mailer_run():
+    tempdir = tempfile.mkdtemp()
+    try:
+        spool = SpoolMailer(tempdir)
+        mailer = ToMemoryMailer()
+        stop = threading.Event()
+        thread = threading.Thread(target=spool.run, args=(mailer, 0.01, stop))
+        thread.start()
+        spool.send_messages(*make_emails())
+        for _ in range(500):
+            if len(mailer.outbox) == 4:
+                break
+            time.sleep(0.01)
+        stop.set()
+        thread.join()
+        assert len(mailer.outbox) == 4
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_spool_mailer_invalid_fsync():
+    with pytest.raises(ValueError):
+        SpoolMailer(tempfile.gettempdir(), fsync="sometimes")
+
+
+def test_token_bucket():
+    bucket = TokenBucket(100, capacity=5)
+    start = time.monotonic()
+    # The burst
+    for _ in range(5):
+        assert bucket.acquire() == 0
+    # Then 100 per second
+    for _ in range(10):
+        bucket.acquire()
+    assert 0.08 < time.monotonic() - start < 0.5
+    # Bigger than the capacity
+    assert bucket.reserve(10) > 0
+
+
+def test_token_bucket_threads():
+    bucket = TokenBucket(200, capacity=1)
+    start = time.monotonic()
+    threads = [
+        threading.Thread(target=lambda: [bucket.acquire() for _ in range(10)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 40 tokens at 200 per second, minus the initial one
+    assert 0.18 < time.monotonic() - start < 1
+
+
+def test_throttled_mailer():
+    memory = ToMemoryMailer()
+    mailer = ThrottledMailer(memory, messages_per_second=100, burst=0.01)
+    start = time.monotonic()
+    assert mailer.send_messages(*(make_emails() * 3)) == 12
+    assert 0.1 < time.monotonic() - start < 1
+    assert len(memory.outbox) == 12
+
+
+def test_throttled_mailer_recipients():
+    memory = ToMemoryMailer()
+    bucket = TokenBucket(100, capacity=1)
+    mailer = ThrottledMailer(memory, recipients_per_second=bucket)
+    send_to = ["user{}@example.com".format(i) for i in range(10)]
+    start = time.monotonic()
+    mailer.send("Subject", "Content", "from@example.com", send_to)
+    mailer.send("Subject", "Content", "from@example.com", send_to)
+    assert 0.15 < time.monotonic() - start < 1
+    assert len(memory.outbox) == 2
+
+
+def test_send_report():
+    mailer = ToMemoryMailer()
+    emails = make_emails()
+    report = mailer.send_messages(*emails)
+    assert report == 4
+    assert [result.message for result in report.results] == emails
+    assert all(result.sent for result in report.results)
+    assert report.results[0].accepted == ["to@example.com"]
+    assert report.failed == []
+    assert mailer.send_messages() == 0
+
+
+def test_console_send_report():
+    class BrokenStream(StringIO):
+        def flush(self):
+            if self.tell() > 0:
+                raise OSError("disk full")
+
+    mailer = ToConsoleMailer(stream=BrokenStream(), fail_silently=True)
+    report = mailer.send_messages(*make_emails())
+    assert report == 0
+    assert len(report.failed) == 4
+    assert isinstance(report.failed[0].error, OSError)
+
+
+def test_lazy_imports():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (
+        "import sys, mailshake; "
+        "print(sorted(name for name in sys.modules "
+        "if name.startswith(('mailshake.', 'html2text', 'boto3'))))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=root,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_package_exports():
+    from .. import mailshake
+
+    for name in mailshake.__all__:
+        assert getattr(mailshake, name, None) is not None or name == "__version__"
+    assert mailshake.Mailer is ToConsoleMailer
+    with pytest.raises(AttributeError):
+        mailshake.NotAMailer
+
+
+def test_maildir_mailer():
+    import mailbox
+
+    tmp_dir = tempfile.mkdtemp()
+    mailer = ToMaildirMailer(tmp_dir)
+    emails = make_emails()
+    emails[0].text = "From here\n>From there\n"
+    assert mailer.send_messages(*emails) == 4
+
+    assert os.listdir(os.path.join(tmp_dir, "tmp")) == []
+    messages = sorted(
+        mailbox.Maildir(tmp_dir, create=False), key=lambda msg: msg.get_payload()
+    )
+    assert [msg.get_payload() for msg in messages] == [
+        "Content #2",
+        "Content #3",
+        "Content #4",
+        "From here\n>From there\n",
+    ]
+    shutil.rmtree(tmp_dir, True)
+
+
+def test_maildir_mailer_gzip():
+    tmp_dir = tempfile.mkdtemp()
+    mailer = ToMaildirMailer(tmp_dir, compress="gzip", fsync="batch")
+    assert mailer.send_messages(*make_emails()) == 4
+
+    new_path = os.path.join(tmp_dir, "new")
+    names = sorted(os.listdir(new_path))
+    assert len(set(names)) == 4
+    assert all(name.endswith(".gz") for name in names)
+    with gzip.open(os.path.join(new_path, names[0])) as f:
+        assert email.message_from_binary_file(f)["Subject"] == "Subject"
+    shutil.rmtree(tmp_dir, True)
+
+
+def test_mbox_mailer():
+    import mailbox
+
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, "captured", "mails.mbox")
+    mailer = ToMboxMailer(path)
+    emails = make_emails()
+    emails[0].text = "From here\n>From there\n"
+    assert mailer.send_messages(*emails[:2]) == 2
+    assert mailer.send_messages(*emails[2:]) == 2
+
+    messages = list(mailbox.mbox(path, create=False))
+    assert len(messages) == 4
+    assert messages[0].get_from().startswith("from@example.com ")
+    # "mboxrd" escaping
+    assert messages[0].get_payload() == ">From here\n>>From there\n"
+    assert messages[3].get_payload() == "Content #4\n"
+    shutil.rmtree(tmp_dir, True)
+
+
+def test_mbox_mailer_gzip():
+    import mailbox
+
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, "mails.mbox.gz")
+    mailer = ToMboxMailer(path, compress="gzip")
+    emails = make_emails()
+    assert mailer.send_messages(*emails[:1]) == 1
+    assert mailer.send_messages(*emails[1:]) == 3
+
+    plain_path = os.path.join(tmp_dir, "mails.mbox")
+    with gzip.open(path) as src, open(plain_path, "wb") as dest:
+        dest.write(src.read())
+    messages = list(mailbox.mbox(plain_path, create=False))
+    assert [msg.get_payload() for msg in messages] == [
+        "Content #%s\n" % num for num in range(1, 5)
+    ]
+    shutil.rmtree(tmp_dir, True)
+
+    with pytest.raises(ValueError):
+        ToMboxMailer(path, compress="rar")
+
+
+def test_to_file_mailer_index():
+    tmp_dir = tempfile.mkdtemp()
+    mailer = ToFileMailer(tmp_dir, index=True)
+    emails = make_emails()
+    emails[1].to = ["Mary <mary@Example.com>"]
+    emails[1].cc = ["mary@example.com"]
+    emails[2].subject = "Ñandú"
+    emails[3].bcc = ["boss@example.com"]
+    assert mailer.send_messages(*emails[:2]) == 2
+    assert mailer.send_messages(*emails[2:]) == 2
+
+    index = FileIndex(tmp_dir)
+    assert len(index) == 4
+    assert [msg["Subject"] for msg in index.messages()] == [
+        "Subject",
+        "Subject",
+        "Ñandú",
+        "Subject",
+    ]
+
+    (entry,) = index.find(recipient="mary@example.com")
+    assert entry.recipients == ["mary@example.com", "mary@example.com"]
+    assert index.read(entry).get_content() == "Content #2\n"
+
+    (msg,) = index.messages(subject="Ñandú")
+    assert msg.get_content() == "Content #3\n"
+    (entry,) = index.find(message_id=msg["Message-ID"])
+    assert entry.subject == "Ñandú"
+
+    (msg,) = index.messages(recipient="boss@example.com")
+    assert msg["Bcc"] is None
+    assert msg.get_content() == "Content #4\n"
+
+    email5 = EmailMessage("Hi", "Content", "from@example.com", "toБ@exämple.com")
+    mailer.send_messages(email5)
+    (entry,) = index.find(recipient="toБ@exämple.com")
+    assert entry.subject == "Hi"
+
+    assert len(list(index.find(limit=3))) == 3
+    assert list(index.find(recipient="nobody@example.com")) == []
+    shutil.rmtree(tmp_dir, True)
+
+
+def test_file_index_pages(monkeypatch):
+    from ..mailshake.mailers import filebased
+
+    monkeypatch.setattr(filebased, "PAGE_SIZE", 3)
+    tmp_dir = tempfile.mkdtemp()
+    mailer = ToFileMailer(tmp_dir, multifile=False, index=True)
+    emails = make_emails() * 2
+    assert mailer.send_messages(*emails) == 8
+
+    assert [msg.get_content() for msg in mailer.index.messages()] == [
+        msg.text + "\n" for msg in emails
+    ]
+    assert len(list(mailer.index.find(limit=4))) == 4
+    assert len(list(mailer.index.find(limit=20))) == 8
+    shutil.rmtree(tmp_dir, True)
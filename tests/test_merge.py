@@ -0,0 +1,97 @@
+from ..mailshake import EmailMessage, MailMerge, QueuedMailer, ToMemoryMailer
+
+
+def make_template():
+    template = EmailMessage(
+        "Hi $name",
+        "Hello $name, your code is ${code}. It costs $5.",
+        "from@example.com",
+        headers={"X-Campaign": "spring"},
+    )
+    template.attach("terms.pdf", b"%PDF-1.4.%...", mimetype="application/pdf")
+    return template
+
+
+def make_recipients():
+    return [
+        {"to": "mary@example.com", "name": "Mary", "code": "1234"},
+        {"to": ["bob@example.com"], "bcc": "boss@example.com", "name": "Bob"},
+    ]
+
+
+def test_messages():
+    merge = MailMerge(make_template())
+    mary, bob = list(merge.messages(make_recipients()))
+
+    assert mary.to == ["mary@example.com"]
+    assert mary.subject == "Hi Mary"
+    assert mary.text == "Hello Mary, your code is 1234. It costs $5."
+    assert mary.extra_headers == {"X-Campaign": "spring"}
+
+    assert bob.to == ["bob@example.com"]
+    assert bob.bcc == ["boss@example.com"]
+    assert bob.subject == "Hi Bob"
+    assert bob.text == "Hello Bob, your code is ${code}. It costs $5."
+
+    message = mary.render()
+    assert message["Subject"] == "Hi Mary"
+    assert message["To"] == "mary@example.com"
+    assert message["X-Campaign"] == "spring"
+    assert message.get_payload(0).get_payload() == mary.text
+
+
+def test_template_is_not_modified():
+    template = make_template()
+    merge = MailMerge(template)
+    list(merge.messages(make_recipients()))
+
+    assert template.to == []
+    assert template.subject == "Hi $name"
+    assert len(template.attachments) == 1
+
+
+def test_shared_parts_are_reused():
+    template = EmailMessage(
+        "Hi $name", "Hello!", "from@example.com", html="<p>Hello!</p>"
+    )
+    template.attach("terms.pdf", b"%PDF-1.4.%...", mimetype="application/pdf")
+    merge = MailMerge(template)
+    mary, bob = merge.messages(make_recipients())
+
+    mary_msg = mary.render()
+    bob_msg = bob.render()
+
+    assert mary_msg["Subject"] == "Hi Mary"
+    assert bob_msg["Subject"] == "Hi Bob"
+    # the attachment
+    assert mary_msg.get_payload(1) is bob_msg.get_payload(1)
+    # the text and html parts
+    mary_body = mary_msg.get_payload(0).get_payload()
+    bob_body = bob_msg.get_payload(0).get_payload()
+    assert mary_body[0] is bob_body[0]
+    assert mary_body[1] is bob_body[1]
+
+
+def test_send():
+    mailer = ToMemoryMailer()
+    merge = MailMerge(make_template())
+    recipients = (
+        {"to": "user%s@example.com" % i, "name": "User %s" % i} for i in range(5)
+    )
+
+    assert merge.send(mailer, recipients, batch_size=2) == 5
+    assert len(mailer.outbox) == 5
+    assert mailer.outbox[4].subject == "Hi User 4"
+
+
+def test_send_with_queued_mailer():
+    backend = ToMemoryMailer()
+    mailer = QueuedMailer(backend)
+    merge = MailMerge(make_template())
+    recipients = (
+        {"to": "user%s@example.com" % i, "name": "User %s" % i} for i in range(5)
+    )
+
+    assert merge.send(mailer, recipients, batch_size=2) == 5
+    assert len(backend.outbox) == 5
+    mailer.close()
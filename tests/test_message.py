@@ -1,8 +1,14 @@
+from email import message_from_bytes
+import email.encoders as email_encoders
+import email.policy as email_policy
 import re
+import threading
 
+import html2text
 import pytest
 
 from ..mailshake import EmailMessage
+from ..mailshake.message import html_to_text, iter_message_bytes
 
 
 def test_ascii():
@@ -326,6 +332,54 @@ def test_html():
     assert message.get_payload(1).get_content_type() == "text/html"
 
 
+def test_html_only_text_is_lazy(monkeypatch):
+    calls = []
+    handle = html2text.HTML2Text.handle
+
+    def counting_handle(self, html):
+        calls.append(html)
+        return handle(self, html)
+
+    monkeypatch.setattr(html2text.HTML2Text, "handle", counting_handle)
+    html_to_text.cache_clear()
+    html = "<p>This is an <strong>important</strong> message.</p>"
+
+    emails = [
+        EmailMessage("hello", from_email="from@example.com", html=html)
+        for _ in range(3)
+    ]
+    assert calls == []
+
+    for email in emails:
+        message = email.render()
+        assert message.get_payload(0).get_payload() == (
+            "This is an **important** message.\n\n"
+        )
+    assert calls == [html]
+
+    email = emails[0]
+    email.html = "<p>Other</p>"
+    assert email.text == "Other\n\n"
+    email.text = "Explicit"
+    assert email.text == "Explicit"
+
+
+def test_html_to_text_threads():
+    html_to_text.cache_clear()
+    results = {}
+
+    def convert(num):
+        results[num] = html_to_text("<p>Message <b>%s</b></p>" % num)
+
+    threads = [threading.Thread(target=convert, args=(num,)) for num in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {num: "Message **%s**\n\n" % num for num in range(20)}
+
+
 def test_safe_mime_multipart():
     """Make sure headers can be set with a different encoding than utf-8 in
     SafeMIMEMultipart as well
@@ -420,6 +474,65 @@ def test_attachments():
     assert message.get_payload(1).get_content_type() == "application/pdf"
 
 
+def test_attachments_are_encoded_once(monkeypatch):
+    calls = []
+    encode_base64 = email_encoders.encode_base64
+
+    def counting_encode_base64(msg):
+        calls.append(msg)
+        return encode_base64(msg)
+
+    monkeypatch.setattr(email_encoders, "encode_base64", counting_encode_base64)
+
+    email = EmailMessage("Subject", "Content", "from@example.com", "to@example.com")
+    email.attach("doc.pdf", b"%PDF-1.4.%...", mimetype="application/pdf")
+    message1 = email.render()
+    email.as_bytes()
+    message2 = email.render()
+
+    assert len(calls) == 1
+    assert message1.get_payload(1) is message2.get_payload(1)
+
+    email.attach("other.pdf", b"%PDF-1.4.%...", mimetype="application/pdf")
+    message3 = email.render()
+
+    assert len(calls) == 2
+    assert message3.get_payload(1) is message1.get_payload(1)
+    assert message3.get_payload(2).get_filename() == "other.pdf"
+
+    del email.attachments[0]
+    message4 = email.render()
+
+    assert len(message4.get_payload()) == 2
+    assert message4.get_payload(1).get_filename() == "other.pdf"
+    assert len(calls) == 2
+
+
+def test_lazy_file_attachment(tmp_path):
+    path = tmp_path / "report.bin"
+    content = bytes(range(256)) * 1000
+    path.write_bytes(content)
+
+    email = EmailMessage("Subject", "Content", "from@example.com", "to@example.com")
+    email.attach_file(str(path), lazy=True)
+    email.attach("notes.txt", "Some notes")
+    message = email.render()
+
+    attachment = message.get_payload(1)
+    assert attachment.get_content_type() == "application/octet-stream"
+    assert attachment.get_filename() == "report.bin"
+    assert attachment.get_payload(decode=True) == content
+
+    for policy in (email_policy.default, email_policy.SMTP):
+        chunks = list(iter_message_bytes(message, policy=policy))
+        assert len(chunks) > 3
+        assert b"".join(chunks) == message.as_bytes(policy=policy)
+
+    parsed = message_from_bytes(b"".join(email.iter_bytes()))
+    assert parsed.get_payload(1).get_payload(decode=True) == content
+    assert parsed.get_payload(2).get_payload() == "Some notes"
+
+
 def test_dont_mangle_from_in_body():
     """Make sure that EmailMessage doesn't mangle 'From' in message body."""
     email = EmailMessage(
@@ -0,0 +1,68 @@
+import smtplib
+import socket
+
+import pytest
+
+from ..mailshake.retry import RetryPolicy, is_transient
+
+
+class ClientError(Exception):
+    def __init__(self, code):
+        self.response = {"Error": {"Code": code}}
+
+
+def test_is_transient():
+    assert is_transient(smtplib.SMTPServerDisconnected())
+    assert is_transient(smtplib.SMTPDataError(451, b"Later"))
+    assert is_transient(smtplib.SMTPSenderRefused(421, b"Busy", "a@example.com"))
+    assert is_transient(socket.timeout())
+    assert is_transient(ConnectionResetError())
+    assert is_transient(ClientError("Throttling"))
+    assert is_transient(
+        smtplib.SMTPRecipientsRefused({"a@example.com": (452, b"Too many")})
+    )
+
+    assert not is_transient(smtplib.SMTPDataError(554, b"Rejected"))
+    assert not is_transient(
+        smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"No such user")})
+    )
+    assert not is_transient(ClientError("MessageRejected"))
+    assert not is_transient(ValueError())
+
+
+def test_delay():
+    policy = RetryPolicy(base_delay=1, multiplier=2, max_delay=5, jitter=0)
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+
+    policy = RetryPolicy(base_delay=1, multiplier=2, jitter=0.5)
+    for _ in range(100):
+        assert 1 <= policy.delay(2) <= 2
+
+
+def test_call():
+    calls = []
+
+    def send():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ClientError("Throttling")
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0)
+    assert policy.call(send) == "ok"
+    assert len(calls) == 3
+
+    calls.clear()
+    policy = RetryPolicy(max_attempts=2, base_delay=0)
+    with pytest.raises(ClientError):
+        policy.call(send)
+    assert len(calls) == 2
+
+    def fail():
+        calls.append(1)
+        raise ClientError("MessageRejected")
+
+    calls.clear()
+    with pytest.raises(ClientError):
+        policy.call(fail)
+    assert len(calls) == 1
@@ -1,7 +1,19 @@
+import threading
+import time
+
 import pytest
-from smtplib import SMTP, SMTPException
+from smtplib import (
+    SMTP,
+    SMTPDataError,
+    SMTPException,
+    SMTPNotSupportedError,
+    SMTPSenderRefused,
+)
 
 from ..mailshake import EmailMessage, SMTPMailer
+from ..mailshake.mailers import smtp
+from ..mailshake.mailers.smtp import send_data
+from ..mailshake.retry import RetryPolicy
 
 
 def make_emails():
@@ -130,3 +142,697 @@ def test_batch_too_many_recipients(smtpd):
     assert len(smtpd.messages[5].get("to").split(",")) == 200
     assert len(smtpd.messages[6].get("to").split(",")) == 200
     assert len(smtpd.messages[7].get("to").split(",")) == 100
+
+
+def test_pool_reuses_connections(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname, port=smtpd.port, use_tls=False, pool_size=2
+    )
+    connections = []
+
+    def connect():
+        connections.append(mailer.connect())
+        return connections[-1]
+
+    mailer.pool._connect = connect
+    for email in make_emails():
+        assert mailer.send_messages(email) == 1
+
+    assert len(smtpd.messages) == 4
+    assert len(connections) == 1
+    assert mailer.pool.size == 1
+    mailer.shutdown()
+    assert mailer.pool.size == 0
+
+
+def test_pool_max_messages(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname,
+        port=smtpd.port,
+        use_tls=False,
+        pool_size=2,
+        pool_max_messages=2,
+    )
+    connections = []
+
+    def connect():
+        connections.append(mailer.connect())
+        return connections[-1]
+
+    mailer.pool._connect = connect
+    for email in make_emails():
+        assert mailer.send_messages(email) == 1
+
+    assert len(smtpd.messages) == 4
+    assert len(connections) == 2
+    mailer.shutdown()
+
+
+def test_pool_discards_dead_connections(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname, port=smtpd.port, use_tls=False, pool_size=1
+    )
+    email1, email2, _, _ = make_emails()
+    assert mailer.send_messages(email1) == 1
+
+    connection = mailer.pool.acquire()
+    connection.close()
+    mailer.pool.release(connection)
+    mailer.pool.check_after = 0
+
+    assert mailer.send_messages(email2) == 1
+    assert len(smtpd.messages) == 2
+    assert mailer.pool.size == 1
+    mailer.shutdown()
+
+
+def test_pool_checks_connections_outside_the_lock():
+    unblock = threading.Event()
+
+    class SlowConnection:
+        def noop(self):
+            unblock.wait(5)
+            return (250, b"OK")
+
+        def close(self):
+            pass
+
+    pool = smtp.SMTPConnectionPool(SlowConnection, max_size=2, check_after=0)
+    conn1, conn2 = pool.acquire(), pool.acquire()
+    pool.release(conn1)
+
+    acquired = []
+    checking = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    checking.start()
+    # While the NOOP is waiting for its reply, the pool is still usable.
+    releasing = threading.Thread(target=pool.release, args=(conn2,))
+    releasing.start()
+    releasing.join(1)
+    assert not releasing.is_alive()
+
+    unblock.set()
+    checking.join()
+    assert acquired == [conn1]
+
+
+def test_pool_threads(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname, port=smtpd.port, use_tls=False, pool_size=3
+    )
+
+    def send():
+        for email in make_emails():
+            mailer.send_messages(email)
+
+    threads = [threading.Thread(target=send) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(smtpd.messages) == 20
+    assert mailer.pool.size <= 3
+    mailer.shutdown()
+
+
+def test_shutdown_closes_the_pool(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname, port=smtpd.port, use_tls=False, pool_size=2
+    )
+    mailer.open()
+    assert mailer.pool.size == 1
+    mailer.shutdown()
+    assert mailer.connection is None
+    assert mailer.pool.size == 0
+
+    # Without a pool it's the same as `close()`
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, use_tls=False)
+    mailer.open()
+    mailer.shutdown()
+    assert mailer.connection is None
+
+
+def test_send_parallel(smtpd):
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, use_tls=False)
+    emails = make_emails()
+    emails.insert(2, EmailMessage("No recipients", "Content", "from@example.com"))
+
+    assert mailer.send_parallel(*emails, workers=3) == [
+        True,
+        True,
+        False,
+        True,
+        True,
+    ]
+    assert len(smtpd.messages) == 4
+    assert mailer.connection is None
+
+
+def test_send_messages_with_workers(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname,
+        port=smtpd.port,
+        use_tls=False,
+        max_recipients=2,
+        workers=2,
+        pool_size=2,
+    )
+    send_to = ["user{}@example.com".format(i) for i in range(1, 6)]
+    emails = [
+        EmailMessage("Subject-%s" % num, "Content", "from@example.com", send_to)
+        for num in range(1, 5)
+    ]
+
+    assert mailer.send_messages(*emails) == 4
+    assert len(smtpd.messages) == 12
+    assert mailer.pool.size <= 2
+    mailer.shutdown()
+
+
+def test_send_messages_with_more_workers_than_connections(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname,
+        port=smtpd.port,
+        use_tls=False,
+        workers=3,
+        pool_size=1,
+        pool_timeout=0.1,
+    )
+    send = mailer._send
+
+    def slow_send(message):
+        # Longer than the other sessions would wait for the connection
+        time.sleep(0.2)
+        return send(message)
+
+    mailer._send = slow_send
+    assert mailer.send_messages(*make_emails()) == 4
+    assert len(smtpd.messages) == 4
+    mailer.shutdown()
+
+
+def test_send_parallel_session_fails_to_connect(smtpd):
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, use_tls=False)
+    connect = mailer.connect
+    calls = []
+
+    def connect_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionRefusedError()
+        return connect()
+
+    mailer.connect = connect_once
+    assert mailer.send_parallel(*make_emails(), workers=2) == [True] * 4
+    assert len(smtpd.messages) == 4
+
+    # If no session can connect, the error is raised
+    def refuse():
+        raise ConnectionRefusedError()
+
+    mailer.connect = refuse
+    with pytest.raises(ConnectionRefusedError):
+        mailer.send_parallel(*make_emails(), workers=2)
+
+
+def test_batch_renders_once(smtpd):
+    mailer = SMTPMailer(
+        host=smtpd.hostname,
+        port=smtpd.port,
+        use_tls=False,
+        max_recipients=2,
+    )
+    to = ["to{}@example.com".format(i) for i in range(1, 4)]
+    cc = ["cc{}@example.com".format(i) for i in range(1, 3)]
+    bcc = ["bcc@example.com"]
+    msg = EmailMessage("The Subject", "Content", "from@example.com", to, cc, bcc)
+    msg.attach("file.bin", b"\x00" * 100, "application/octet-stream")
+    render = msg.render
+    calls = []
+
+    def counting_render():
+        calls.append(1)
+        return render()
+
+    msg.render = counting_render
+
+    with SMTP(smtpd.hostname, smtpd.port):
+        assert mailer.send_messages(msg) == 1
+
+    assert len(calls) == 1
+    assert msg.to == to
+    assert msg.cc == cc
+    assert msg.bcc == bcc
+
+    assert len(smtpd.messages) == 3
+    assert [m.get("to") for m in smtpd.messages] == [
+        "to1@example.com, to2@example.com",
+        "to3@example.com",
+        None,
+    ]
+    assert [m.get("cc") for m in smtpd.messages] == [
+        None,
+        "cc1@example.com",
+        "cc2@example.com",
+    ]
+    ids = {m.get("message-id") for m in smtpd.messages}
+    assert len(ids) == 1
+    for message in smtpd.messages:
+        assert message.get_payload(1).get_payload(decode=True) == b"\x00" * 100
+
+
+def test_sending_lazy_attachment(smtpd, tmp_path):
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, use_tls=False)
+    path = tmp_path / "report.bin"
+    content = bytes(range(256)) * 1000
+    path.write_bytes(content)
+    email = EmailMessage(
+        "Subject", ".Content\n.\n..", "from@example.com", "to@example.com"
+    )
+    email.attach_file(str(path), lazy=True)
+
+    with SMTP(smtpd.hostname, smtpd.port):
+        assert mailer.send_messages(email) == 1
+
+    assert len(smtpd.messages) == 1
+    message = smtpd.messages[0]
+    text = message.get_payload(0).get_payload()
+    assert text.splitlines() == [".Content", ".", ".."]
+    assert message.get_payload(1).get_payload(decode=True) == content
+
+
+def test_lazy_attachment_missing_file(smtpd, tmp_path):
+    mailer = SMTPMailer(
+        host=smtpd.hostname, port=smtpd.port, pool_size=1, fail_silently=True
+    )
+    path = tmp_path / "report.bin"
+    path.write_bytes(b"data")
+    email1, email2 = make_emails()[:2]
+    email1.attach_file(str(path), lazy=True)
+    path.unlink()
+
+    with SMTP(smtpd.hostname, smtpd.port):
+        mailer.open()
+        connection = mailer.connection
+        report = mailer.send_messages(email1, email2)
+        # The file was checked before starting the transaction,
+        # so the connection is still usable.
+        assert mailer.connection is connection
+        mailer.close()
+        assert mailer.send_messages(email1) == 0
+
+    assert report == 1
+    assert isinstance(report.results[0].error, FileNotFoundError)
+    assert [msg["Subject"] for msg in smtpd.messages] == ["Subject-2"]
+    assert mailer.pool.size == 1
+
+
+class ScriptedSMTP(SMTP):
+    """A fake SMTP connection that records what is sent and answers
+    with the given replies."""
+
+    def __init__(self, replies, extensions=()):
+        super().__init__()
+        self.ehlo_resp = b"localhost"
+        self.sock = True
+        self.does_esmtp = True
+        self.esmtp_features = {name: "" for name in extensions}
+        self.replies = list(replies)
+        self.sent = []
+
+    def send(self, s):
+        if isinstance(s, str):
+            s = s.encode(self.command_encoding)
+        self.sent.append(s)
+
+    def getreply(self):
+        return self.replies.pop(0)
+
+    def close(self):
+        self.sock = None
+
+
+def test_pipelining(smtpd):
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, use_tls=False)
+    send_to = ["user{}@example.com".format(i) for i in range(1, 51)]
+    msg = EmailMessage("The Subject", "Content", "from@example.com", send_to)
+
+    with SMTP(smtpd.hostname, smtpd.port):
+        mailer.open()
+        connection = mailer.connection
+        connection.ehlo()
+        connection.esmtp_features["pipelining"] = ""
+        writes = []
+        send = connection.send
+
+        def record(data):
+            writes.append(data)
+            send(data)
+
+        connection.send = record
+        assert mailer.send_messages(msg) == 1
+        mailer.close()
+
+    assert len(smtpd.messages) == 1
+    assert len(smtpd.messages[0].get("to").split(",")) == 50
+    envelope = [data for data in writes if "rcpt" in str(data)]
+    assert len(envelope) == 1
+    assert envelope[0].startswith("mail FROM:<from@example.com> BODY=8BITMIME\r\n")
+    assert envelope[0].count("rcpt TO:") == 50
+
+
+def test_pipelining_refused_recipients():
+    connection = ScriptedSMTP(
+        [
+            (250, b"OK"),
+            (250, b"OK"),
+            (550, b"No such user"),
+            (250, b"OK"),
+            (354, b"Go ahead"),
+            (250, b"Queued"),
+        ],
+        extensions=["pipelining"],
+    )
+    to = ["a@example.com", "b@example.com", "c@example.com"]
+    senderrs = send_data(connection, "from@example.com", to, [b"Subject: Hi\r\n"])
+    assert senderrs == {"b@example.com": (550, b"No such user")}
+    assert connection.sent[0] == (
+        b"mail FROM:<from@example.com>\r\n"
+        b"rcpt TO:<a@example.com>\r\n"
+        b"rcpt TO:<b@example.com>\r\n"
+        b"rcpt TO:<c@example.com>\r\n"
+    )
+    assert not connection.replies
+
+
+def test_pipelining_refused_sender():
+    connection = ScriptedSMTP(
+        [(550, b"Go away"), (503, b"No sender"), (250, b"Reset")],
+        extensions=["pipelining"],
+    )
+    with pytest.raises(SMTPSenderRefused):
+        send_data(connection, "from@example.com", ["a@example.com"], [b"Hi\r\n"])
+    # All the replies were read, including the one to RSET
+    assert not connection.replies
+
+
+def test_bdat(monkeypatch):
+    monkeypatch.setattr(smtp, "BDAT_CHUNK_SIZE", 10)
+    connection = ScriptedSMTP(
+        [(250, b"OK"), (250, b"OK"), (250, b"OK"), (250, b"Queued")],
+        extensions=["chunking"],
+    )
+    chunks = [b"Subject: Hi\r\n", b"\r\n", b".Hello\r\n.\r\n"]
+    assert send_data(connection, "from@example.com", ["a@example.com"], chunks) == {}
+    assert connection.sent[2:] == [
+        b"BDAT 13\r\nSubject: Hi\r\n",
+        # No dot-stuffing
+        b"BDAT 13 LAST\r\n\r\n.Hello\r\n.\r\n",
+    ]
+    assert not connection.replies
+
+
+def test_bdat_pipelining(monkeypatch):
+    monkeypatch.setattr(smtp, "BDAT_CHUNK_SIZE", 10)
+    connection = ScriptedSMTP(
+        [(250, b"OK"), (250, b"OK"), (552, b"Too big"), (250, b"OK"), (250, b"Reset")],
+        extensions=["chunking", "pipelining"],
+    )
+    chunks = [b"Subject: Hi\r\n", b"\r\n", b"Hello\r\n"]
+    with pytest.raises(SMTPDataError):
+        send_data(connection, "from@example.com", ["a@example.com"], chunks)
+    # The BDAT commands were sent without waiting for the replies
+    assert connection.sent[1:4] == [
+        b"BDAT 13\r\nSubject: Hi\r\n",
+        b"BDAT 9 LAST\r\n\r\nHello\r\n",
+        b"rset\r\n",
+    ]
+    assert not connection.replies
+
+
+def test_data_error_closes_connection():
+    connection = ScriptedSMTP(
+        [(250, b"OK"), (250, b"OK"), (354, b"Go ahead")],
+    )
+
+    def chunks():
+        yield b"Subject: Hi\r\n"
+        raise OSError("Disk error")
+
+    with pytest.raises(OSError):
+        send_data(connection, "from@example.com", ["a@example.com"], chunks())
+    assert connection.sock is None
+
+
+def test_broken_connection_is_discarded():
+    mailer = SMTPMailer(pool_size=1, fail_silently=True)
+    connections = []
+
+    def connect():
+        connection = ScriptedSMTP(
+            [(250, b"OK"), (250, b"OK"), (354, b"Go ahead")]
+            + [(250, b"OK"), (250, b"OK"), (354, b"Go ahead"), (250, b"Queued")]
+        )
+        connections.append(connection)
+        return connection
+
+    mailer.pool._connect = connect
+    email1, email2 = make_emails()[:2]
+    email1.attach("report.txt", "data", "text/plain")
+
+    iter_message_bytes = smtp.iter_message_bytes
+
+    def broken_iter(msg, policy):
+        chunks = iter_message_bytes(msg, policy=policy)
+        if msg["Subject"] == "Subject-1":
+            first = next(chunks)
+
+            def gen():
+                yield first
+                raise OSError("Disk error")
+
+            return gen()
+        return chunks
+
+    mailer.open()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(smtp, "iter_message_bytes", broken_iter)
+        report = mailer.send_messages(email1, email2)
+    mailer.close()
+
+    assert report == 1
+    assert isinstance(report.results[0].error, OSError)
+    # The first connection was left in the middle of the DATA command,
+    # so it was replaced.
+    assert len(connections) == 2
+    assert connections[0].sock is None
+    assert mailer.pool.size == 1
+
+
+def test_pooled_connection_released_after_error():
+    mailer = SMTPMailer(pool_size=1, pool_timeout=0.1)
+    mailer.pool._connect = lambda: ScriptedSMTP(
+        [(250, b"OK"), (250, b"OK"), (354, b"Go ahead"), (554, b"Rejected")]
+        + [(250, b"Reset")]
+    )
+    with pytest.raises(SMTPDataError):
+        mailer.send_messages(*make_emails()[:1])
+    assert mailer.connection is None
+
+    # Another thread can use the connection
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(mailer.pool.acquire()))
+    thread.start()
+    thread.join()
+    assert len(acquired) == 1
+    assert mailer.pool.size == 1
+
+
+def test_mail_options():
+    connection = ScriptedSMTP(
+        [(250, b"OK"), (250, b"OK"), (354, b"Go ahead"), (250, b"Queued")],
+        extensions=["8bitmime", "smtputf8"],
+    )
+    send_data(connection, "frôm@example.com", ["a@example.com"], [b"Hi\r\n"])
+    command = "mail FROM:<frôm@example.com> BODY=8BITMIME SMTPUTF8\r\n"
+    assert connection.sent[0] == command.encode("utf-8")
+
+    connection = ScriptedSMTP([], extensions=["8bitmime"])
+    with pytest.raises(SMTPNotSupportedError):
+        send_data(connection, "frôm@example.com", ["a@example.com"], [b"Hi\r\n"])
+
+    # Only the address, not the name, needs SMTPUTF8
+    connection = ScriptedSMTP(
+        [(250, b"OK"), (250, b"OK"), (354, b"Go ahead"), (250, b"Queued")],
+        extensions=["8bitmime"],
+    )
+    from_addr = "José García <jose@example.com>"
+    send_data(connection, from_addr, ["Zoë <a@example.com>"], [b"Hi\r\n"])
+    assert connection.sent[0] == b"mail FROM:<jose@example.com> BODY=8BITMIME\r\n"
+
+
+def make_retry_mailer(replies):
+    mailer = SMTPMailer(retry=RetryPolicy(base_delay=0))
+    mailer.connection = ScriptedSMTP(replies)
+    return mailer
+
+
+def test_retry_refused_recipients():
+    mailer = make_retry_mailer(
+        [
+            (250, b"OK"),
+            (250, b"OK"),
+            (450, b"Mailbox busy"),
+            (550, b"No such user"),
+            (354, b"Go ahead"),
+            (250, b"Queued"),
+            # Only the recipient temporarily refused is retried
+            (250, b"OK"),
+            (250, b"OK"),
+            (354, b"Go ahead"),
+            (250, b"Queued"),
+        ]
+    )
+    to = ["a@example.com", "b@example.com", "c@example.com"]
+    report = mailer.send_messages(EmailMessage("Subject", "Hi", "from@example.com", to))
+    assert report == 1
+    (result,) = report.results
+    assert result.accepted == ["a@example.com", "b@example.com"]
+    assert result.refused == {"c@example.com": (550, b"No such user")}
+    assert result.attempts == 2
+    assert report.refused == result.refused
+    assert b"rcpt TO:<b@example.com>" in mailer.connection.sent[-3]
+    assert not mailer.connection.replies
+
+
+def test_retry_error_after_partial_delivery():
+    mailer = make_retry_mailer(
+        [
+            (250, b"OK"),
+            (250, b"OK"),
+            (450, b"Mailbox busy"),
+            (354, b"Go ahead"),
+            (250, b"Queued"),
+            # The retry of the second recipient fails
+            (250, b"OK"),
+            (250, b"OK"),
+            (354, b"Go ahead"),
+            (554, b"Rejected"),
+            (250, b"Reset"),
+        ]
+    )
+    mailer.retry.max_attempts = 2
+    to = ["a@example.com", "b@example.com"]
+    report = mailer.send_messages(EmailMessage("Subject", "Hi", "from@example.com", to))
+    (result,) = report.results
+    assert report == 1
+    assert result.sent
+    assert result.accepted == ["a@example.com"]
+    assert result.refused == {"b@example.com": (554, b"Rejected")}
+    assert isinstance(result.error, SMTPDataError)
+    assert not mailer.connection.replies
+
+
+def test_retry_keeps_last_reply():
+    mailer = make_retry_mailer(
+        [
+            (250, b"OK"),
+            (250, b"OK"),
+            (450, b"Mailbox busy"),
+            (354, b"Go ahead"),
+            (250, b"Queued"),
+            (250, b"OK"),
+            (450, b"Still busy"),
+            (250, b"Reset"),
+        ]
+    )
+    mailer.retry.max_attempts = 2
+    to = ["a@example.com", "b@example.com"]
+    report = mailer.send_messages(EmailMessage("Subject", "Hi", "from@example.com", to))
+    (result,) = report.results
+    assert report == 1
+    assert result.accepted == ["a@example.com"]
+    assert result.refused == {"b@example.com": (450, b"Still busy")}
+    assert not mailer.connection.replies
+
+
+def test_retry_transient_error():
+    mailer = make_retry_mailer(
+        [
+            (250, b"OK"),
+            (250, b"OK"),
+            (354, b"Go ahead"),
+            (451, b"Try again later"),
+            (250, b"Reset"),
+            (250, b"OK"),
+            (250, b"OK"),
+            (354, b"Go ahead"),
+            (250, b"Queued"),
+        ]
+    )
+    report = mailer.send_messages(*make_emails()[:1])
+    assert report == 1
+    assert report.results[0].attempts == 2
+    assert not mailer.connection.replies
+
+
+def test_retry_permanent_error():
+    mailer = make_retry_mailer(
+        [
+            (250, b"OK"),
+            (250, b"OK"),
+            (354, b"Go ahead"),
+            (554, b"Rejected"),
+            (250, b"Reset"),
+        ]
+    )
+    with pytest.raises(SMTPDataError):
+        mailer.send_messages(*make_emails()[:1])
+
+    mailer = make_retry_mailer(
+        [
+            (250, b"OK"),
+            (250, b"OK"),
+            (354, b"Go ahead"),
+            (554, b"Rejected"),
+            (250, b"Reset"),
+        ]
+    )
+    mailer.fail_silently = True
+    report = mailer.send_messages(*make_emails()[:1])
+    assert report == 0
+    assert isinstance(report.failed[0].error, SMTPDataError)
+    assert report.failed[0].attempts == 1
+
+
+def test_default_retry_only_reconnects():
+    mailer = SMTPMailer(fail_silently=True)
+    mailer.connection = ScriptedSMTP(
+        [(250, b"OK"), (250, b"OK"), (354, b"Go ahead"), (451, b"Later"), (250, b"")]
+    )
+    assert mailer.send_messages(*make_emails()[:1]) == 0
+    assert not mailer.connection.replies
+
+
+def test_send_report(smtpd):
+    mailer = SMTPMailer(host=smtpd.hostname, port=smtpd.port, max_recipients=2)
+    send_to = ["user{}@example.com".format(i) for i in range(1, 4)]
+    email = EmailMessage("Subject", "Content", "from@example.com", send_to)
+    email2 = EmailMessage("No recipients", "Content", "from@example.com")
+
+    with SMTP(smtpd.hostname, smtpd.port):
+        report = mailer.send_messages(email, email2)
+
+    assert report == 1
+    result, result2 = report.results
+    assert result.sent
+    assert result.accepted == send_to
+    assert result.refused == {}
+    assert result.message_id == smtpd.messages[0]["Message-ID"]
+    assert result.attempts == 1
+    assert result.bytes_sent > 0
+    assert set(result.timings) == {"render", "transfer"}
+    assert set(report.timings) == {"connect", "render", "transfer"}
+    assert report.bytes_sent == result.bytes_sent
+    assert not result2.sent
+    assert report.failed == [result2]
@@ -0,0 +1,32 @@
+from email.charset import Charset
+
+from ..mailshake.utils import encode_address, encode_domain
+
+
+def test_encode_address():
+    assert encode_address("to@example.com", "utf-8") == "to@example.com"
+    assert encode_address(("Tó", "to@example.com"), "utf-8") == (
+        "=?utf-8?b?VMOz?= <to@example.com>"
+    )
+    assert encode_address("toБ@exampleБ.com", Charset("utf-8")) == (
+        "=?utf-8?q?to=D0=91?=@xn--example-hgg.com"
+    )
+
+
+def test_encode_address_cache():
+    encode_address.cache_clear()
+    encode_domain.cache_clear()
+
+    encode_address("to@example.com", "utf-8")
+    encode_address("to@example.com", Charset("utf-8"))
+    encode_address("to@example.com", "UTF-8")
+    encode_address("other@example.com", "utf-8")
+
+    info = encode_address.cache_info()
+    assert info.hits == 2
+    assert info.misses == 2
+    assert info.currsize == 2
+
+    info = encode_domain.cache_info()
+    assert info.hits == 1
+    assert info.misses == 1